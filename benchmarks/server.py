@@ -0,0 +1,209 @@
+"""
+A local HTTP server standing in for the sites packs are downloaded from in
+benchmarks. It serves the files in a folder with ETag and Range support, and
+each request's behaviour is set with query parameters:
+
+    rate=BYTES        throttle the response to BYTES per second
+    drop=BYTES        close the connection after BYTES of the body...
+    drops=N           ...on the first N requests for the URL (default: 1)
+    type=TYPE         Content-Type to send, or 'none' (default: by suffix)
+    disposition=MODE  Content-Disposition to send: 'none' (default),
+                      'attachment' (filename="...") or 'utf8' (filename*=)
+    name=NAME         filename sent in Content-Disposition
+    ranges=0          ignore Range requests and don't send Accept-Ranges
+
+e.g. /Pack.zip?rate=2000000&drop=500000&disposition=utf8
+
+    python benchmarks/server.py FOLDER [--port 8000]
+"""
+
+import argparse
+import email.utils
+import hashlib
+import http.server
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlparse
+
+CONTENT_TYPES = {
+    ".zip": "application/zip",
+    ".gz": "application/gzip",
+    ".tgz": "application/gzip",
+    ".bz2": "application/x-bzip2",
+    ".xz": "application/x-xz",
+    ".tar": "application/x-tar",
+}
+CHUNK_SIZE = 64 * 1024
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server: "BenchServer"
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body: bool) -> None:
+        url = urlparse(self.path)
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        path = self.server.root / unquote(url.path).lstrip("/")
+        if not path.is_file() or self.server.root not in path.parents:
+            self.send_error(404)
+            return
+        size = path.stat().st_size
+        etag = self.server.etag(path)
+        ranges = params.get("ranges", "1") != "0"
+        start = 0
+        range_header = self.headers.get("Range")
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", range_header or "")
+        if_range = self.headers.get("If-Range", etag)
+        if ranges and match and if_range == etag:
+            start = int(match[1])
+            end = int(match[2]) if match[2] else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            end = size - 1
+            self.send_response(200)
+        content_type = params.get("type") or CONTENT_TYPES.get(
+            path.suffix, "application/octet-stream"
+        )
+        if content_type != "none":
+            self.send_header("Content-Type", content_type)
+        name = params.get("name", path.name)
+        match params.get("disposition", "none"):
+            case "attachment":
+                disposition = f'attachment; filename="{name}"'
+            case "utf8":
+                disposition = f"attachment; filename*=UTF-8''{quote(name)}"
+            case _:
+                disposition = None
+        if disposition is not None:
+            self.send_header("Content-Disposition", disposition)
+        self.send_header("Content-Length", str(end - start + 1))
+        self.send_header("ETag", etag)
+        self.send_header(
+            "Last-Modified", email.utils.formatdate(path.stat().st_mtime)
+        )
+        if ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        if not send_body:
+            return
+        drop = None
+        if "drop" in params and self.server.take_drop(
+            self.path, int(params.get("drops", 1))
+        ):
+            drop = int(params["drop"])
+        rate = int(params["rate"]) if "rate" in params else None
+        self._send_file(path, start, end, rate, drop)
+
+    def _send_file(
+        self,
+        path: Path,
+        start: int,
+        end: int,
+        rate: Optional[int],
+        drop: Optional[int],
+    ) -> None:
+        sent = 0
+        began = time.monotonic()
+        chunk_size = min(CHUNK_SIZE, max(1024, rate // 20)) if rate else None
+        with open(path, "rb") as file:
+            file.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                size = min(chunk_size or CHUNK_SIZE, remaining)
+                if drop is not None:
+                    size = min(size, drop - sent)
+                    if size <= 0:
+                        # Close without sending the rest of the body
+                        self.close_connection = True
+                        self.connection.shutdown(2)
+                        return
+                chunk = file.read(size)
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                sent += len(chunk)
+                remaining -= len(chunk)
+                self.server.count(len(chunk))
+                if rate:
+                    # Sleep until the average rate is back down to `rate`
+                    delay = began + sent / rate - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class BenchServer(http.server.ThreadingHTTPServer):
+    """
+    Serves the files in `root` on `port` (default: any free port) from a
+    background thread while used as a context manager.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, root: Path, port: int = 0, verbose: bool = False):
+        super().__init__(("127.0.0.1", port), _Handler)
+        self.root = root.resolve()
+        self.verbose = verbose
+        self.bytes_sent = 0
+        self.lock = threading.Lock()
+        self.drops: dict[str, int] = {}
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    def url(self, name: str, **params) -> str:
+        """Returns the URL of the file `name` with query `params`."""
+        query = f"?{urlencode(params)}" if params else ""
+        return f"http://127.0.0.1:{self.server_port}/{quote(name)}{query}"
+
+    def etag(self, path: Path) -> str:
+        stat = path.stat()
+        key = f"{path}:{stat.st_size}:{stat.st_mtime_ns}"
+        return '"' + hashlib.sha1(key.encode()).hexdigest()[:16] + '"'
+
+    def take_drop(self, request: str, drops: int) -> bool:
+        """Returns whether the connection for `request` should be dropped."""
+        with self.lock:
+            count = self.drops.get(request, 0)
+            self.drops[request] = count + 1
+            return count < drops
+
+    def count(self, size: int) -> None:
+        with self.lock:
+            self.bytes_sent += size
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *_exc):
+        self.shutdown()
+        self.server_close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    with BenchServer(args.folder, args.port, verbose=True) as server:
+        print(f"Serving {server.root} at {server.url('')}")
+        try:
+            server.thread.join()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == "__main__":
+    main()
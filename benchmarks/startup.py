@@ -0,0 +1,190 @@
+"""
+Startup time regression benchmark for the itg-cli commands that should start
+quickly. Each command is run with `python -X importtime` against a temporary
+ITGmania folder, and the benchmark fails if a command imports a module it
+shouldn't or if its imports take longer than its budget.
+
+    python benchmarks/startup.py [--repeat N] [--budget-scale X]
+
+Budgets are in milliseconds of total import time (the fastest of `--repeat`
+runs). Use `--budget-scale` on machines slower than a typical cabinet PC.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import NamedTuple
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+# Network, progress bar and simfile parsing dependencies
+HEAVY = {"gdown", "requests", "tqdm", "simfile", "pyrfc6266"}
+IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+SIMFILE = """#VERSION:0.83;
+#TITLE:{title};
+#ARTIST:Benchmark;
+#BPMS:0.000=120.000;
+#NOTEDATA:;
+#STEPSTYPE:dance-single;
+#DIFFICULTY:Easy;
+#METER:3;
+#NOTES:
+0000
+1000
+0100
+0010
+;
+"""
+CONFIG = """version = 1
+
+[required]
+root = '{root}'
+singles_pack_name = 'Singles'
+delete_macos_files = false
+
+[optional]
+"""
+
+
+class Case(NamedTuple):
+    name: str
+    args: list[str]
+    budget: float  # Milliseconds of total import time
+    forbidden: set[str]
+    # Arguments of a command run before each measured run, e.g. to put back
+    # the songs censored by the previous run. Its exit code is ignored.
+    setup: list[str]
+
+
+CENSOR = ["censor", "Bench/*", "--yes"]
+UNCENSOR = ["uncensor", "--all"]
+CASES = [
+    Case("--version", ["--version"], 250, HEAVY | {"rich", "tomlkit"}, []),
+    Case("censor", CENSOR, 400, HEAVY, UNCENSOR),
+    Case("uncensor", UNCENSOR, 400, HEAVY, CENSOR),
+]
+
+
+class Result(NamedTuple):
+    total: float  # Milliseconds
+    modules: set[str]  # Top-level packages imported
+
+
+def parse_importtime(stderr: str) -> Result:
+    """
+    Sums the cumulative times of the top-level imports in `-X importtime`
+    output and collects the top-level packages that were imported.
+    """
+    total = 0
+    modules = set()
+    for match in IMPORT_LINE.finditer(stderr):
+        _, cumulative, indent, module = match.groups()
+        modules.add(module.partition(".")[0])
+        if len(indent) == 1:
+            total += int(cumulative)
+    return Result(total / 1000, modules)
+
+
+def run(args: list[str], env: dict[str, str], check: bool = True) -> Result:
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-m", "itg_cli", *args],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if check and process.returncode != 0:
+        raise RuntimeError(
+            f"itg-cli {' '.join(args)} failed:\n{process.stdout}"
+            + "\n".join(
+                line
+                for line in process.stderr.splitlines()
+                if not line.startswith("import time:")
+            )
+        )
+    return parse_importtime(process.stderr)
+
+
+def make_library(root: Path, songs: int) -> dict[str, str]:
+    """
+    Creates an ITGmania folder with a pack of `songs` songs and a config file
+    in `root`, and returns the environment to run itg-cli in.
+    """
+    pack = root / "itgmania" / "Songs" / "Bench"
+    for i in range(songs):
+        song = pack / f"Song {i:03}"
+        song.mkdir(parents=True)
+        (song / "song.ssc").write_text(SIMFILE.format(title=f"Song {i}"))
+    for folder in ("Courses", "Cache"):
+        (root / "itgmania" / folder).mkdir()
+    # Write the config to the default location so the CLI doesn't create it
+    env = dict(os.environ)
+    env.update(
+        HOME=str(root),
+        XDG_CONFIG_HOME=str(root / "config"),
+        APPDATA=str(root / "config"),
+        PYTHONPATH=os.pathsep.join(
+            filter(None, (str(SRC), os.environ.get("PYTHONPATH")))
+        ),
+    )
+    process = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import typer; print(typer.get_app_dir('itg-cli'))",
+        ],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    config = Path(process.stdout.strip()) / "config.toml"
+    config.parent.mkdir(parents=True)
+    config.write_text(CONFIG.format(root=root / "itgmania"))
+    return env
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--repeat", type=int, default=5, help="runs per command (default: 5)"
+    )
+    parser.add_argument(
+        "--budget-scale",
+        type=float,
+        default=1.0,
+        help="multiply every budget by this factor",
+    )
+    parser.add_argument(
+        "--songs", type=int, default=50, help="songs in the test pack"
+    )
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as temp:
+        env = make_library(Path(temp), args.songs)
+        for case in CASES:
+            results = []
+            for _ in range(args.repeat):
+                if case.setup:
+                    run(case.setup, env, check=False)
+                results.append(run(case.args, env))
+            best = min(result.total for result in results)
+            budget = case.budget * args.budget_scale
+            loaded = set.union(*(result.modules for result in results))
+            problems = []
+            if best > budget:
+                problems.append(f"over budget ({budget:.0f} ms)")
+            if loaded & case.forbidden:
+                forbidden = ", ".join(sorted(loaded & case.forbidden))
+                problems.append(f"imported {forbidden}")
+            status = "FAIL " + "; ".join(problems) if problems else "ok"
+            print(f"{case.name:<12} {best:7.1f} ms  {status}")
+            failed = failed or bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,376 @@
+"""
+Benchmarks add-pack, add-song, censor and uncensor on synthetic packs (see
+synthetic.py), downloading through a local stand-in server (see server.py)
+where a stage needs one. Each stage runs in a fresh process, against a fresh
+library, and reports its wall time, peak RSS and the bytes it wrote.
+
+    python benchmarks/suite.py [--songs N] [--audio-size 1MB] [--repeat 3]
+        [--only STAGE ...] [--save NAME] [--compare NAME] [--tolerance 0.2]
+
+Results can be saved as a named baseline in benchmarks/baselines and later
+runs compared against it: the comparison fails if a stage got slower or used
+more memory by more than `--tolerance` (a fraction).
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple, Optional
+
+BENCHMARKS = Path(__file__).resolve().parent
+SRC = BENCHMARKS.parent / "src"
+BASELINES = BENCHMARKS / "baselines"
+sys.path.insert(0, str(SRC))
+
+from server import BenchServer  # noqa: E402
+from synthetic import make_archive, make_pack  # noqa: E402
+from itg_cli import add_pack, add_song, censor_songs, uncensor_songs  # noqa
+from itg_cli._config import parse_size  # noqa: E402
+from itg_cli._metadata import song_dirs  # noqa: E402
+
+PACK = "Synthetic Pack"
+SONG = "Song 000"
+
+
+class Library(NamedTuple):
+    packs: Path
+    courses: Path
+    cache: Path
+
+    @classmethod
+    def create(cls, root: Path) -> "Library":
+        library = cls(root / "Songs", root / "Courses", root / "Cache")
+        for folder in library:
+            folder.mkdir(parents=True)
+        return library
+
+    @property
+    def singles(self) -> Path:
+        return self.packs / "Singles"
+
+
+class Stage(NamedTuple):
+    name: str
+    # Called in the child process with the library, the fixtures folder and
+    # the stand-in server's base URL; this is what is measured
+    run: Callable[[Library, Path, str], object]
+    # Called in this process before the child is started
+    setup: Optional[Callable[[Library, Path], None]] = None
+
+
+def _install(library: Library, fixtures: Path) -> None:
+    shutil.copytree(fixtures / "src" / PACK, library.packs / PACK)
+
+
+def _install_censored(library: Library, fixtures: Path) -> None:
+    _install(library, fixtures)
+    censor_songs(song_dirs(library.packs / PACK), library.packs, library.cache)
+
+
+def _add_pack(library: Library, source: str, **kwargs) -> object:
+    return add_pack(
+        source,
+        library.packs,
+        library.courses,
+        delete_macos_files_flag=True,
+        cache=library.cache,
+        **kwargs,
+    )
+
+
+STAGES = [
+    Stage(
+        "add-pack-zip",
+        lambda lib, fixtures, url: _add_pack(
+            lib, str(fixtures / f"{PACK}.zip")
+        ),
+    ),
+    Stage(
+        "add-pack-tar-xz",
+        lambda lib, fixtures, url: _add_pack(
+            lib, str(fixtures / f"{PACK}.tar.xz")
+        ),
+    ),
+    Stage(
+        "add-pack-dir",
+        lambda lib, fixtures, url: _add_pack(lib, str(fixtures / "src")),
+    ),
+    Stage(
+        "add-pack-http",
+        lambda lib, fixtures, url: _add_pack(
+            lib, f"{url}/{PACK}.zip?disposition=utf8"
+        ),
+    ),
+    Stage(
+        # Dropped halfway once, then resumed with a Range request after the
+        # 2 second retry delay. The pid makes the URL new, so the server
+        # drops it again on every run.
+        "add-pack-http-resume",
+        lambda lib, fixtures, url: _add_pack(
+            lib,
+            f"{url}/{PACK}.zip?drop={_size(fixtures, 'zip') // 2}"
+            f"&run={os.getpid()}",
+        ),
+    ),
+    Stage(
+        "add-pack-http-stream",
+        lambda lib, fixtures, url: _add_pack(
+            lib,
+            f"{url}/{PACK}.tar.gz?disposition=attachment",
+            stream=True,
+        ),
+    ),
+    Stage(
+        "add-song",
+        lambda lib, fixtures, url: add_song(
+            str(fixtures / "song.zip"),
+            lib.singles,
+            cache=lib.cache,
+            delete_macos_files_flag=True,
+        ),
+    ),
+    Stage(
+        "censor",
+        lambda lib, fixtures, url: censor_songs(
+            song_dirs(lib.packs / PACK), lib.packs, lib.cache
+        ),
+        _install,
+    ),
+    Stage(
+        "uncensor",
+        lambda lib, fixtures, url: uncensor_songs(lib.packs),
+        _install_censored,
+    ),
+]
+
+
+def _size(fixtures: Path, fmt: str) -> int:
+    return (fixtures / f"{PACK}.{fmt}").stat().st_size
+
+
+def make_fixtures(fixtures: Path, args: argparse.Namespace) -> None:
+    src = fixtures / "src"
+    make_pack(
+        src,
+        PACK,
+        args.songs,
+        args.charts,
+        parse_size(args.audio_size),
+        args.junk,
+        args.courses,
+    )
+    for fmt in ("zip", "tar.gz", "tar.xz"):
+        make_archive(src, fixtures / f"{PACK}.{fmt}")
+    song = fixtures / "song"
+    shutil.copytree(src / PACK / SONG, song / SONG)
+    make_archive(song, fixtures / "song.zip")
+
+
+def measure(stage: Stage, library: Library, fixtures: Path, url: str) -> dict:
+    """
+    Runs `stage` in this process and returns its wall time, peak RSS and the
+    bytes it wrote. Peak RSS includes the interpreter and itg_cli itself.
+    """
+    written = _bytes_written()
+    start = time.perf_counter()
+    stage.run(library, fixtures, url)
+    seconds = time.perf_counter() - start
+    written_after = _bytes_written()
+    return {
+        "seconds": seconds,
+        "peak_rss": _peak_rss(),
+        "bytes_written": (
+            written_after - written if written is not None else None
+        ),
+    }
+
+
+def _peak_rss() -> Optional[int]:
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _bytes_written() -> Optional[int]:
+    """Returns the bytes this process has passed to write() (Linux only)."""
+    try:
+        with open("/proc/self/io") as io:
+            fields = dict(line.split(": ") for line in io.read().splitlines())
+    except OSError:
+        return None
+    return int(fields["wchar"])
+
+
+def run_stage(stage: Stage, root: Path, fixtures: Path, url: str) -> dict:
+    """Runs `stage` against a fresh library in `root`, in a child process."""
+    if root.exists():
+        shutil.rmtree(root)
+    library = Library.create(root)
+    if stage.setup is not None:
+        stage.setup(library, fixtures)
+    process = subprocess.run(
+        [
+            sys.executable,
+            __file__,
+            "--child",
+            stage.name,
+            str(root),
+            str(fixtures),
+            url,
+        ],
+        capture_output=True,
+        text=True,
+        # Progress bars would be counted as bytes written
+        env={**os.environ, "TQDM_DISABLE": "1"},
+    )
+    if process.returncode != 0:
+        raise RuntimeError(f"{stage.name} failed:\n{process.stderr}")
+    return json.loads(process.stdout.splitlines()[-1])
+
+
+def child(name: str, root: str, fixtures: str, url: str) -> None:
+    stage = next(stage for stage in STAGES if stage.name == name)
+    library = Library(*(Path(root) / n for n in ("Songs", "Courses", "Cache")))
+    # itg_cli's own messages go to stderr so stdout only holds the result
+    stdout = sys.stdout
+    sys.stdout = sys.stderr
+    result = measure(stage, library, Path(fixtures), url)
+    print(json.dumps(result), file=stdout)
+
+
+def summarize(runs: list[dict]) -> dict:
+    """Combines the runs of a stage: median time and writes, maximum RSS."""
+
+    def values(key):
+        return [run[key] for run in runs if run[key] is not None]
+
+    return {
+        "seconds": statistics.median(values("seconds")),
+        "peak_rss": max(values("peak_rss"), default=None),
+        "bytes_written": (
+            int(statistics.median(values("bytes_written")))
+            if values("bytes_written")
+            else None
+        ),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> bool:
+    """
+    Prints how `results` changed from `baseline`. Returns false if a stage's
+    time or peak RSS grew by more than `tolerance`.
+    """
+    if baseline["params"] != results["params"]:
+        print("Warning | The baseline was run with different parameters.")
+    ok = True
+    print(f"\n{'stage':<22} {'time':>9} {'peak RSS':>9}")
+    for name, stage in results["stages"].items():
+        old = baseline["stages"].get(name)
+        if old is None:
+            print(f"{name:<22} {'new':>9}")
+            continue
+        changes = []
+        for key in ("seconds", "peak_rss"):
+            if not old[key] or stage[key] is None:
+                changes.append(f"{'-':>9}")
+                continue
+            change = stage[key] / old[key] - 1
+            flag = "!" if change > tolerance else " "
+            ok = ok and change <= tolerance
+            changes.append(f"{change:+8.1%}{flag}")
+        print(f"{name:<22} {' '.join(changes)}")
+    return ok
+
+
+def format_size(size: Optional[int]) -> str:
+    if size is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1000:
+            break
+        size /= 1000
+    return f"{size:.1f} {unit}"
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--songs", type=int, default=30)
+    parser.add_argument("--charts", type=int, default=5)
+    parser.add_argument("--audio-size", default="1MB")
+    parser.add_argument("--courses", type=int, default=2)
+    parser.add_argument(
+        "--no-junk",
+        dest="junk",
+        action="store_false",
+        help="don't add macOS junk files",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--only", nargs="+", choices=[stage.name for stage in STAGES]
+    )
+    parser.add_argument("--save", metavar="NAME", help="save as a baseline")
+    parser.add_argument(
+        "--compare", metavar="NAME", help="compare with a baseline"
+    )
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stages = [s for s in STAGES if not args.only or s.name in args.only]
+    params = {
+        key: getattr(args, key)
+        for key in ("songs", "charts", "audio_size", "courses", "junk")
+    }
+    results = {
+        "params": params,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "stages": {},
+    }
+    with tempfile.TemporaryDirectory() as temp:
+        fixtures = Path(temp) / "fixtures"
+        make_fixtures(fixtures, args)
+        print(f"{'stage':<22} {'time':>9} {'peak RSS':>9} {'written':>9}")
+        with BenchServer(fixtures) as server:
+            url = server.url("").rstrip("/")
+            for stage in stages:
+                runs = [
+                    run_stage(stage, Path(temp) / "library", fixtures, url)
+                    for _ in range(args.repeat)
+                ]
+                summary = summarize(runs)
+                results["stages"][stage.name] = summary
+                print(
+                    f"{stage.name:<22} {summary['seconds']:8.3f}s"
+                    f" {format_size(summary['peak_rss']):>9}"
+                    f" {format_size(summary['bytes_written']):>9}"
+                )
+
+    ok = True
+    if args.compare:
+        baseline = json.loads((BASELINES / f"{args.compare}.json").read_text())
+        ok = compare(results, baseline, args.tolerance)
+    if args.save:
+        BASELINES.mkdir(exist_ok=True)
+        path = BASELINES / f"{args.save}.json"
+        path.write_text(json.dumps(results, indent=2))
+        print(f"\nSaved baseline: {path}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "--child":
+        child(*sys.argv[2:])
+    else:
+        sys.exit(main())
@@ -0,0 +1,168 @@
+"""
+Generates synthetic packs for benchmarks: `songs` songs with `charts` charts
+each, a dummy audio file of `audio_size` bytes per song, and optionally
+macOS junk files (`__MACOSX` folders and `._` files) and .crs courses.
+
+    python benchmarks/synthetic.py OUT [--songs N] [--charts M]
+        [--audio-size 3MB] [--junk] [--courses N] [--format zip]
+
+Packs are written to OUT/src (next to a Courses folder if there are courses)
+and archived as OUT/NAME.zip, .tar.gz or .tar.xz. Generation is seeded, so
+the same arguments always produce the same files.
+"""
+
+import argparse
+import random
+import sys
+import tarfile
+import zipfile
+from pathlib import Path
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+sys.path.insert(0, str(SRC))
+
+from itg_cli._config import parse_size  # noqa: E402
+
+FORMATS = ("zip", "tar.gz", "tar.xz")
+DIFFICULTIES = ("Beginner", "Easy", "Medium", "Hard", "Challenge", "Edit")
+# Rows of a measure of 16th notes, mostly empty like real charts
+ROWS = ["0000"] * 8 + ["1000", "0100", "0010", "0001", "1001", "0110"]
+# AppleDouble files are small, fixed-size headers
+JUNK_SIZE = 4096
+
+
+def make_simfile(
+    rng: random.Random, title: str, charts: int, measures: int
+) -> str:
+    """Returns an .ssc simfile with `charts` charts of random notes."""
+    lines = [
+        "#VERSION:0.83;",
+        f"#TITLE:{title};",
+        "#ARTIST:Synthetic;",
+        "#MUSIC:song.ogg;",
+        "#BANNER:banner.png;",
+        "#OFFSET:0.000;",
+        f"#BPMS:0.000={rng.choice((120, 150, 174, 180))}.000;",
+    ]
+    for i in range(charts):
+        difficulty = DIFFICULTIES[min(i, len(DIFFICULTIES) - 1)]
+        notes = ",\n".join(
+            "\n".join(rng.choice(ROWS) for _ in range(16))
+            for _ in range(measures)
+        )
+        lines += [
+            "#NOTEDATA:;",
+            "#STEPSTYPE:dance-single;",
+            f"#DIFFICULTY:{difficulty};",
+            f"#DESCRIPTION:{difficulty} {i};",
+            f"#METER:{rng.randint(1, 15)};",
+            f"#NOTES:\n{notes}\n;",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def make_pack(
+    dest: Path,
+    name: str = "Synthetic Pack",
+    songs: int = 20,
+    charts: int = 5,
+    audio_size: int = 1_000_000,
+    junk: bool = False,
+    courses: int = 0,
+    measures: int = 64,
+    seed: int = 0,
+) -> Path:
+    """
+    Writes a pack named `name` to `dest` and returns its path. Courses are
+    written to `dest`/Courses/`name`, and junk to `dest`/__MACOSX and as `._`
+    files next to each song's files.
+    """
+    rng = random.Random(seed)
+    pack = dest / name
+    song_names = [f"Song {i:03}" for i in range(songs)]
+    for song_name in song_names:
+        song = pack / song_name
+        song.mkdir(parents=True)
+        simfile = make_simfile(rng, f"{song_name} ({name})", charts, measures)
+        (song / "song.ssc").write_text(simfile)
+        # Random bytes don't compress, like real audio
+        (song / "song.ogg").write_bytes(rng.randbytes(audio_size))
+        (song / "banner.png").write_bytes(rng.randbytes(16 * 1024))
+        if junk:
+            for file in ("song.ssc", "song.ogg"):
+                (song / f"._{file}").write_bytes(bytes(JUNK_SIZE))
+                macosx = dest / "__MACOSX" / name / song_name
+                macosx.mkdir(parents=True, exist_ok=True)
+                (macosx / f"._{file}").write_bytes(bytes(JUNK_SIZE))
+    if courses:
+        course_dir = dest / "Courses" / name
+        course_dir.mkdir(parents=True)
+        for i in range(courses):
+            entries = "\n".join(
+                f"#SONG:{name}/{song_name}:Hard;"
+                for song_name in rng.sample(song_names, min(4, songs))
+            )
+            (course_dir / f"Course {i}.crs").write_text(
+                f"#COURSE:Course {i};\n{entries}\n"
+            )
+    return pack
+
+
+def make_archive(src: Path, archive: Path) -> Path:
+    """
+    Archives the contents of the folder `src` as `archive`, whose suffix
+    (.zip, .tar.gz or .tar.xz) selects the format.
+    """
+    files = sorted(p for p in src.rglob("*"))
+    if archive.name.endswith(".zip"):
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zip_file:
+            for path in files:
+                zip_file.write(path, path.relative_to(src))
+    elif archive.name.endswith((".tar.gz", ".tar.xz")):
+        mode = "w:gz" if archive.name.endswith(".gz") else "w:xz"
+        # Fast presets: the audio is random and doesn't compress anyway
+        options = {"compresslevel": 1} if mode == "w:gz" else {"preset": 1}
+        with tarfile.open(archive, mode, **options) as tar:
+            for path in files:
+                tar.add(path, path.relative_to(src), recursive=False)
+    else:
+        raise ValueError(f"Unsupported archive format: {archive.name}")
+    return archive
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("out", type=Path, help="folder to write to")
+    parser.add_argument("--name", default="Synthetic Pack")
+    parser.add_argument("--songs", type=int, default=20)
+    parser.add_argument("--charts", type=int, default=5)
+    parser.add_argument("--measures", type=int, default=64)
+    parser.add_argument(
+        "--audio-size", default="1MB", help="size of each song's audio"
+    )
+    parser.add_argument("--junk", action="store_true", help="add macOS junk")
+    parser.add_argument("--courses", type=int, default=0)
+    parser.add_argument(
+        "--format", choices=FORMATS, action="append", help="repeatable"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    src = args.out / "src"
+    make_pack(
+        src,
+        args.name,
+        args.songs,
+        args.charts,
+        parse_size(args.audio_size),
+        args.junk,
+        args.courses,
+        args.measures,
+        args.seed,
+    )
+    for fmt in args.format or ["zip"]:
+        print(make_archive(src, args.out / f"{args.name}.{fmt}"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,87 @@
 from itg_cli.commands import (
     add_pack,
+    add_packs,
     add_song,
+    add_songs,
     censor,
+    censor_songs,
+    find_songs,
     get_censored,
+    list_censored,
     uncensor,
+    uncensor_songs,
     OverwriteException,
     UncensorException,
+    DuplicateException,
 )
+from itg_cli._censored import CensoredSong
+from itg_cli._courses import (
+    Course,
+    SongLookup,
+    UnresolvedSong,
+    check_courses,
+    read_course,
+)
+from itg_cli._dedupe import DedupeResult, dedupe_library
+from itg_cli._download_cache import CacheEntry, DownloadCache
+from itg_cli._hashing import ChartHash, Duplicate
+from itg_cli._index import (
+    ChartEntry,
+    LibraryIndex,
+    LibraryStats,
+    PackStats,
+    SongEntry,
+)
+from itg_cli._itg_cache import SongCache
+from itg_cli._timings import StageTiming
+from itg_cli._trash import empty_trash
+from itg_cli._metadata import (
+    ChartMetadata,
+    SongMetadata,
+    read_pack_metadata,
+    read_song_metadata,
+)
+from itg_cli._utils import ChecksumException
 
 __all__ = [
     "add_pack",
+    "add_packs",
     "add_song",
+    "add_songs",
     "censor",
+    "censor_songs",
+    "find_songs",
     "get_censored",
+    "list_censored",
     "uncensor",
+    "uncensor_songs",
     "OverwriteException",
     "UncensorException",
+    "DuplicateException",
+    "ChecksumException",
+    "CensoredSong",
+    "Course",
+    "SongLookup",
+    "UnresolvedSong",
+    "check_courses",
+    "read_course",
+    "DedupeResult",
+    "dedupe_library",
+    "CacheEntry",
+    "DownloadCache",
+    "ChartHash",
+    "Duplicate",
+    "ChartEntry",
+    "LibraryIndex",
+    "LibraryStats",
+    "PackStats",
+    "SongEntry",
+    "SongCache",
+    "StageTiming",
+    "empty_trash",
+    "ChartMetadata",
+    "SongMetadata",
+    "read_pack_metadata",
+    "read_song_metadata",
 ]
 __version__ = "1.0.4"
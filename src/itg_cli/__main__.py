@@ -1,20 +1,67 @@
+from __future__ import annotations
+
+import click
+import functools
+import json
 import sys
+import time
 import typer
 from pathlib import Path
-from rich.columns import Columns
-from rich.console import Console
-from rich.panel import Panel
-from rich.prompt import Confirm
-from simfile.dir import SimfilePack
-from simfile.types import Simfile
-from typing import Annotated, Callable, Optional, TypeAlias, TypeVar
+from tempfile import gettempdir
+from typing import (
+    TYPE_CHECKING,
+    Annotated,
+    Callable,
+    Optional,
+    TypeAlias,
+    TypeVar,
+    get_args,
+)
 from itg_cli import *
 from itg_cli import __version__
-from itg_cli._config import CLISettings
+from itg_cli._itg_cache import SongCache
+from itg_cli._metadata import iter_song_metadata, song_dirs
+from itg_cli._timings import StageCallback
+from itg_cli._utils import (
+    LinkMode,
+    read_manifest,
+    read_song_list,
+    same_filesystem,
+)
+
+if TYPE_CHECKING:
+    from rich.console import Console
+    from simfile.dir import SimfilePack
+    from simfile.types import Simfile
+    from itg_cli._config import CLISettings
+    from itg_cli._utils import SyncResult
 
+# rich, simfile and tomlkit are imported where they are used so commands that
+# don't need them (e.g. --version) start quickly
 DEFAULT_CONFIG_PATH = Path(typer.get_app_dir("itg-cli")) / "config.toml"
 
-print = Console(highlight=False).print
+
+@functools.cache
+def console() -> Console:
+    from rich.console import Console
+
+    return Console(highlight=False)
+
+
+def print(*objects, **kwargs) -> None:
+    console().print(*objects, **kwargs)
+
+
+def confirm(prompt: str) -> bool:
+    from rich.prompt import Confirm
+
+    return Confirm.ask(prompt, default=True, console=console())
+
+
+def load_config(path: Path, write_default: bool = False) -> CLISettings:
+    from itg_cli._config import CLISettings
+
+    return CLISettings(path, write_default=write_default)
 
 
 ## Overwrite Handlers ##
@@ -33,9 +80,7 @@ def or_callback(
 
 
 def pack_overwrite_handler(new: SimfilePack, old: SimfilePack) -> bool:
-    new_simfiles = list(new.simfiles(strict=False))
-    old_simfiles = list(old.simfiles(strict=False))
-    diff = len(old_simfiles) - len(new_simfiles)
+    diff = len(old.simfile_dir_paths) - len(new.simfile_dir_paths)
     prompt = f"[bold]{new.name}[/bold] already exists (with "
     if diff > 0:
         prompt += f"{diff} fewer songs)."
@@ -44,7 +89,7 @@ def pack_overwrite_handler(new: SimfilePack, old: SimfilePack) -> bool:
     else:
         prompt += "the same number of songs)."
     print(prompt)
-    return Confirm.ask("Overwrite existing pack?", default=True)
+    return confirm("Overwrite existing pack?")
 
 
 def song_overwrite_handler(
@@ -53,7 +98,108 @@ def song_overwrite_handler(
     old_path = Path(old[1])
     pack_and_song_folder = old_path.parent.relative_to(old_path.parents[2])
     print(f"[bold]{pack_and_song_folder}[/] already exists.")
-    return Confirm.ask("Overwrite existing simfile?", default=True)
+    return confirm("Overwrite existing simfile?")
+
+
+def update_handler(
+    updated: set[str],
+) -> Callable[[SimfilePack, SyncResult], None]:
+    """
+    Returns an update handler that prints what an update changed and adds the
+    name of the updated pack to `updated`.
+    """
+
+    def handler(pack: SimfilePack, result: SyncResult) -> None:
+        updated.add(pack.name)
+        print_update(pack, result)
+
+    return handler
+
+
+def print_update(pack: SimfilePack, result: SyncResult) -> None:
+    print(
+        f"Updated [bold green]{pack.name}[/]: {result.added} added,"
+        f" {result.modified} changed, {result.deleted} deleted and"
+        f" {result.unchanged} unchanged files. Wrote"
+        f" {format_size(result.bytes_written)}, saving"
+        f" {format_size(result.bytes_saved)} compared to overwriting."
+    )
+
+
+def duplicates_handler(new: SimfilePack, duplicates: list[Duplicate]) -> bool:
+    from rich.table import Table
+
+    print(
+        f"[bold]{new.name}[/] has [bold]{len(duplicates)}[/] charts already in"
+        " your library:"
+    )
+    table = Table("New chart", "Already in", box=None)
+    for duplicate in duplicates:
+        table.add_row(
+            chart_label(duplicate.chart),
+            "\n".join(map(chart_label, duplicate.matches)),
+        )
+    print(table)
+    return confirm("Add pack anyway?")
+
+
+def unresolved_handler(
+    pack: SimfilePack, missing: list[UnresolvedSong]
+) -> None:
+    print(
+        f"[yellow]Warning[/]: [bold]{len(missing)}[/] course entries of"
+        f" [bold]{pack.name}[/] don't match a song in your packs:"
+    )
+    print_unresolved(missing)
+
+
+def print_unresolved(missing: list[UnresolvedSong]) -> None:
+    from rich.table import Table
+
+    table = Table("Course", "Song", box=None)
+    for entry in missing:
+        course = f"{entry.course.parent.name}/{entry.course.name}"
+        table.add_row(course, entry.reference)
+    print(table)
+
+
+## Summaries ##
+def print_pack_summary(
+    pack: SimfilePack,
+    num_courses: int,
+    workers: Optional[int] = None,
+    updated: bool = False,
+) -> None:
+    """
+    Prints a panel listing the songs and meters of an added (or `updated`)
+    pack. Songs are read in `workers` processes and the panel fills in as they
+    are read.
+    """
+    from rich.columns import Columns
+    from rich.live import Live
+    from rich.panel import Panel
+
+    dirs = song_dirs(Path(pack.pack_dir))
+    # print pack metadata
+    plural = "s" if num_courses != 1 else ""
+    verb = "Updated" if updated else "Added"
+    title = " ".join(
+        (
+            f"\n{verb} [bold green]{pack.name}[/]",
+            f"with [blue]{len(dirs)}[/] songs",
+            f"and [blue]{num_courses}[/] course{plural}",
+        )
+    )
+    lines = []
+
+    def render() -> Panel:
+        return Panel(Columns(lines, expand=True), title=title)
+
+    with Live(render(), console=console()) as live:
+        for song in iter_song_metadata(dirs, workers):
+            meters = [c.meter for c in song.charts if c.meter is not None]
+            lines.append(f"[bold]{meters}[/] {song.title}")
+            live.update(render())
 
 
 ## Typer Setup ##
@@ -69,18 +215,155 @@ OverwriteOption: TypeAlias = Annotated[
         help="automatically overwrite without confirming",
     ),
 ]
+StreamOption: TypeAlias = Annotated[
+    bool,
+    typer.Option(
+        "--stream",
+        help="extract downloaded archives while they are downloading",
+    ),
+]
+Sha256Option: TypeAlias = Annotated[
+    Optional[str],
+    typer.Option(
+        "--sha256",
+        help="expected SHA-256 of the downloaded file",
+    ),
+]
+LinkOption: TypeAlias = Annotated[
+    Optional[str],
+    typer.Option(
+        "--link",
+        click_type=click.Choice(get_args(LinkMode)),
+        help="how local directories are copied (reflink = copy-on-write;"
+        " simfiles are never hardlinked) [default: copy]",
+        show_default=False,
+    ),
+]
+WorkersOption: TypeAlias = Annotated[
+    Optional[int],
+    typer.Option(
+        "--workers",
+        min=1,
+        help="processes used to read songs for summaries (default: CPUs)",
+    ),
+]
+UpdateOption: TypeAlias = Annotated[
+    bool,
+    typer.Option(
+        "--update",
+        "-u",
+        help="update an existing pack in place, only writing changed files",
+    ),
+]
+DedupeOption: TypeAlias = Annotated[
+    bool,
+    typer.Option(
+        "--dedupe",
+        help="hardlink audio/images/videos identical to ones in your library",
+    ),
+]
+FullRescanOption: TypeAlias = Annotated[
+    bool,
+    typer.Option(
+        "--full-rescan",
+        help="check every song folder, not just those in changed packs, e.g."
+        " after editing simfiles in place",
+    ),
+]
+StageOption: TypeAlias = Annotated[
+    Optional[bool],
+    typer.Option(
+        "--stage-in-dest/--stage-in-temp",
+        help="stage in the packs folder so installing is a rename, or in the"
+        " system's temporary folder [default: packs folder if the temporary"
+        " folder is on another filesystem]",
+        show_default=False,
+    ),
+]
 cli = typer.Typer(no_args_is_help=True)
 
 
 ## Version Flag ##
 def version_callback(run: bool):
     if run:
-        print(f"itg-cli [white][bold]{__version__}")
+        typer.echo(f"itg-cli {__version__}")
         raise typer.Exit()
 
 
+## Timings ##
+class StageRecorder:
+    """
+    Collects the StageTimings reported by the library functions for
+    --timings. With `json_lines`, each one is also written to stderr as a
+    JSON line as soon as it finishes.
+    """
+
+    def __init__(self, json_lines: bool):
+        from threading import Lock
+
+        self.json_lines = json_lines
+        self.timings: list[StageTiming] = []
+        self.lock = Lock()
+        self.started = time.perf_counter()
+
+    def __call__(self, timing: StageTiming) -> None:
+        with self.lock:
+            self.timings.append(timing)
+            if self.json_lines:
+                line = {
+                    **timing._asdict(),
+                    "bytes_per_second": timing.bytes_per_second,
+                }
+                sys.stderr.write(json.dumps(line) + "\n")
+                sys.stderr.flush()
+
+    def print_table(self) -> None:
+        """Prints the total time, bytes and throughput of each stage."""
+        from rich.table import Table
+
+        stages: dict[str, list[StageTiming]] = {}
+        for timing in self.timings:
+            stages.setdefault(timing.stage, []).append(timing)
+        wall = time.perf_counter() - self.started
+        table = Table(title=f"Stage timings ({wall:.2f}s wall time)")
+        table.add_column("Stage")
+        table.add_column("Count", justify="right")
+        table.add_column("Time", justify="right")
+        table.add_column("Bytes", justify="right")
+        table.add_column("Throughput", justify="right")
+        print()
+        for stage, timings in stages.items():
+            seconds = sum(t.seconds for t in timings)
+            sized = [t for t in timings if t.bytes is not None]
+            size = sum(t.bytes for t in sized)
+            sized_seconds = sum(t.seconds for t in sized)
+            failed = sum(not t.ok for t in timings)
+            table.add_row(
+                stage,
+                f"{len(timings)}"
+                + (f" ([red]{failed} failed[/])" if failed else ""),
+                f"{seconds:.3f}s",
+                format_size(size) if sized else "-",
+                (
+                    f"{format_size(int(size / sized_seconds))}/s"
+                    if sized and sized_seconds > 0
+                    else "-"
+                ),
+            )
+        print(table)
+
+
+recorder: Optional[StageRecorder] = None
+
+
+def on_stage() -> Optional[StageCallback]:
+    """Returns the callback that records stage timings if --timings is set."""
+    return recorder
+
+
 @cli.callback()
 def typer_entry(
+    ctx: typer.Context,
     version: Annotated[
         bool,
         typer.Option(
@@ -90,7 +373,41 @@ def typer_entry(
             help="Display the version and exit.",
         ),
     ] = False,
+    timings: Annotated[
+        Optional[str],
+        typer.Option(
+            "--timings",
+            click_type=click.Choice(["table", "json"]),
+            help="report the time, bytes and throughput of each stage of"
+            " adds, censors and uncensors (json: JSON lines on stderr)",
+        ),
+    ] = None,
+    profile: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--profile",
+            dir_okay=False,
+            help="write cProfile stats of the main thread to this file",
+        ),
+    ] = None,
 ):
+    global recorder
+    if timings is not None:
+        recorder = StageRecorder(json_lines=timings == "json")
+        if timings == "table":
+            ctx.call_on_close(recorder.print_table)
+    if profile is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+
+        def dump_profile() -> None:
+            profiler.disable()
+            profiler.dump_stats(profile)
+            print(f"Wrote profile to [bold]{profile}[/]")
+
+        ctx.call_on_close(dump_profile)
+        profiler.enable()
     # Initialize config if it doesn't exist
     if not DEFAULT_CONFIG_PATH.exists() and "init-config" not in sys.argv:
         init_config_command(DEFAULT_CONFIG_PATH)
@@ -109,13 +426,13 @@ def init_config_command(
     if (
         path.exists()
         and not overwrite
-        and not Confirm.ask(
-            f"Overwrite existing config with default?", default=True
-        )
+        and not confirm(f"Overwrite existing config with default?")
     ):
         print(f"[green]Keeping existing config file: [bright_white]{path}")
         raise typer.Exit()
-    cfg = CLISettings(path, write_default=True)
+    from rich.panel import Panel
+
+    cfg = load_config(path, write_default=True)
     print(
         Panel(
             f"Initialized config: [bright_white]{str(cfg.location)}",
@@ -132,9 +449,29 @@ def add_pack_command(
     ],
     config_path: ConfigOption = DEFAULT_CONFIG_PATH,
     overwrite: OverwriteOption = None,
+    stream: StreamOption = False,
+    sha256: Sha256Option = None,
+    link: LinkOption = None,
+    stage_in_dest: StageOption = None,
+    workers: WorkersOption = None,
+    update: UpdateOption = False,
+    dedupe: DedupeOption = False,
+    check_dupes: Annotated[
+        bool,
+        typer.Option(
+            "--check-dupes",
+            help="look for charts that are already in your library first",
+        ),
+    ] = False,
 ):
     """Add a pack from a supplied link or path."""
-    config = CLISettings(config_path)
+    config = load_config(config_path)
+    staging, link = staging_options(config, stage_in_dest, link)
+    updated: set[str] = set()
+    index = library_index(config)
+    if check_dupes:
+        index.rescan(workers)
+        index.hash_charts(workers)
     try:
         pack, num_courses = add_pack(
             path_or_url,
@@ -143,28 +480,116 @@ def add_pack_command(
             downloads=config.downloads,
             overwrite=or_callback(overwrite, pack_overwrite_handler),
             delete_macos_files_flag=config.delete_macos_files,
+            stream=stream,
+            sha256=sha256,
+            staging=staging,
+            link=link,
+            index=index,
+            download_cache=download_cache(config),
+            duplicates=duplicates_handler if check_dupes else None,
+            cache=config.cache,
+            on_stage=on_stage(),
+            update=update_handler(updated) if update else None,
+            dedupe=dedupe,
+            unresolved=unresolved_handler,
         )
     except OverwriteException:
         print("Keeping old pack.")
         raise typer.Exit(1)
-    songs = list(pack.simfiles(strict=False))
-    # print pack metadata
-    plural = "s" if num_courses != 1 else ""
-    title = " ".join(
-        (
-            f"\nAdded [bold green]{pack.name}[/]",
-            f"with [blue]{len(songs)}[/] songs",
-            f"and [blue]{num_courses}[/] course{plural}",
-        )
-    )
-    columns = Columns(
-        (
-            f"[bold]{[int(c.meter) for c in song.charts]}[/] {song.title}"
-            for song in songs
+    except DuplicateException:
+        print("Not adding pack.")
+        raise typer.Exit(1)
+    print_pack_summary(pack, num_courses, workers, pack.name in updated)
+
+
+@cli.command("add-packs")
+def add_packs_command(
+    paths_or_urls: Annotated[
+        Optional[list[str]],
+        typer.Argument(help="paths or URLs to the packs to add"),
+    ] = None,
+    manifest: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--manifest",
+            "-m",
+            help="file listing one path or URL (and optional SHA-256) per line",
         ),
-        expand=True,
+    ] = None,
+    download_jobs: Annotated[
+        int, typer.Option(min=1, help="number of simultaneous downloads")
+    ] = 2,
+    extract_jobs: Annotated[
+        int, typer.Option(min=1, help="number of simultaneous extractions")
+    ] = 2,
+    install_jobs: Annotated[
+        int, typer.Option(min=1, help="number of simultaneous installs")
+    ] = 1,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+    overwrite: OverwriteOption = None,
+    stream: StreamOption = False,
+    link: LinkOption = None,
+    stage_in_dest: StageOption = None,
+    workers: WorkersOption = None,
+    update: UpdateOption = False,
+    dedupe: DedupeOption = False,
+):
+    """Add several packs from supplied links or paths and/or a manifest file."""
+    config = load_config(config_path)
+    staging, link = staging_options(config, stage_in_dest, link)
+    updated: set[str] = set()
+    sources = dict.fromkeys(paths_or_urls or [])
+    if manifest is not None:
+        sources.update(read_manifest(manifest))
+    if not sources:
+        print("No packs supplied.")
+        raise typer.Exit(1)
+    results = add_packs(
+        sources,
+        config.packs,
+        config.courses,
+        downloads=config.downloads,
+        overwrite=or_callback(overwrite, pack_overwrite_handler),
+        delete_macos_files_flag=config.delete_macos_files,
+        download_jobs=download_jobs,
+        extract_jobs=extract_jobs,
+        install_jobs=install_jobs,
+        stream=stream,
+        checksums={k: v for k, v in sources.items() if v is not None},
+        staging=staging,
+        link=link,
+        index=library_index(config),
+        download_cache=download_cache(config),
+        cache=config.cache,
+        on_stage=on_stage(),
+        update=update_handler(updated) if update else None,
+        dedupe=dedupe,
+        unresolved=unresolved_handler,
     )
-    print(Panel(columns, title=title))
+    failed = {}
+    for source, result in results.items():
+        if isinstance(result, Exception):
+            failed[source] = result
+        else:
+            pack, num_courses = result
+            print_pack_summary(
+                pack, num_courses, workers, pack.name in updated
+            )
+    if failed:
+        from rich.panel import Panel
+
+        lines = (
+            f"[bold]{source}[/]: "
+            + (
+                "kept old pack"
+                if isinstance(e, OverwriteException)
+                else str(e)
+            )
+            for source, e in failed.items()
+        )
+        title = f"[red]{len(failed)}[/] of {len(results)} packs not added"
+        print(Panel("\n".join(lines), title=title, style="red"))
+        raise typer.Exit(1)
 
 
 @cli.command("add-song")
@@ -174,11 +599,25 @@ def add_song_command(
     ],
     config_path: ConfigOption = DEFAULT_CONFIG_PATH,
     overwrite: OverwriteOption = None,
+    stream: StreamOption = False,
+    sha256: Sha256Option = None,
+    link: LinkOption = None,
+    stage_in_dest: StageOption = None,
+    dedupe: DedupeOption = False,
+    song: Annotated[
+        Optional[str],
+        typer.Option(
+            "--song",
+            "-s",
+            help="folder name or title of the song to add from a pack",
+        ),
+    ] = None,
 ):
     """
     Add a song from a supplied link or path to your configured Singles pack.
     """
-    config = CLISettings(config_path)
+    config = load_config(config_path)
+    staging, link = staging_options(config, stage_in_dest, link)
     try:
         sf, loc = add_song(
             path_or_url,
@@ -187,10 +626,21 @@ def add_song_command(
             downloads=config.downloads,
             overwrite=or_callback(overwrite, song_overwrite_handler),
             delete_macos_files_flag=config.delete_macos_files,
+            stream=stream,
+            sha256=sha256,
+            staging=staging,
+            link=link,
+            index=library_index(config),
+            song=song,
+            download_cache=download_cache(config),
+            on_stage=on_stage(),
+            dedupe=dedupe,
         )
     except OverwriteException:
         print("Keeping old song.")
         raise typer.Exit(1)
+    from rich.panel import Panel
+
     title = " ".join(
         (
             f"Added [bold green]{sf.title}[/]",
@@ -210,32 +660,697 @@ def add_song_command(
     print(Panel(content, title=title, expand=False))
 
 
+@cli.command("add-songs")
+def add_songs_command(
+    paths_or_urls: Annotated[
+        Optional[list[str]],
+        typer.Argument(help="paths or URLs to the songs to add"),
+    ] = None,
+    song_list: Annotated[
+        Optional[Path],
+        typer.Option(
+            "--list",
+            "-l",
+            help="CSV/TSV export with a URL per row, or a manifest file",
+        ),
+    ] = None,
+    jobs: Annotated[
+        int, typer.Option(min=1, help="number of songs added at a time")
+    ] = 4,
+    host_jobs: Annotated[
+        int,
+        typer.Option(min=1, help="number of simultaneous downloads per host"),
+    ] = 2,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+    overwrite: OverwriteOption = None,
+    stream: StreamOption = False,
+    link: LinkOption = None,
+    stage_in_dest: StageOption = None,
+    dedupe: DedupeOption = False,
+):
+    """
+    Add several songs from supplied links or paths and/or a list to your
+    configured Singles pack.
+    """
+    config = load_config(config_path)
+    staging, link = staging_options(config, stage_in_dest, link)
+    sources = dict.fromkeys(paths_or_urls or [])
+    if song_list is not None:
+        sources.update(read_song_list(song_list))
+    if not sources:
+        print("No songs supplied.")
+        raise typer.Exit(1)
+    results = add_songs(
+        sources,
+        config.singles,
+        cache=config.cache,
+        downloads=config.downloads,
+        overwrite=or_callback(overwrite, song_overwrite_handler),
+        delete_macos_files_flag=config.delete_macos_files,
+        jobs=jobs,
+        host_jobs=host_jobs,
+        stream=stream,
+        checksums={k: v for k, v in sources.items() if v is not None},
+        staging=staging,
+        link=link,
+        index=library_index(config),
+        download_cache=download_cache(config),
+        on_stage=on_stage(),
+        dedupe=dedupe,
+    )
+    added, skipped, failed = [], [], {}
+    for source, result in results.items():
+        if isinstance(result, OverwriteException):
+            skipped.append(source)
+        elif isinstance(result, Exception):
+            failed[source] = result
+        else:
+            added.append(result[0])
+    for sf in added:
+        print(f"Added [bold green]{sf.title}[/] by {sf.artist}")
+    for source in skipped:
+        print(f"Kept old song for [bold]{source}[/]")
+    if failed:
+        from rich.panel import Panel
+
+        lines = (f"[bold]{source}[/]: {e}" for source, e in failed.items())
+        title = f"[red]{len(failed)}[/] of {len(results)} songs failed"
+        print(Panel("\n".join(lines), title=title, style="red"))
+    print(
+        f"[bold green]{len(added)}[/] added, [bold]{len(skipped)}[/] skipped"
+        f" (already in {config.singles.name}), [bold red]{len(failed)}[/]"
+        " failed"
+    )
+    if failed:
+        raise typer.Exit(1)
+
+
+@cli.command("watch")
+def watch_command(
+    inbox: Annotated[
+        Optional[Path],
+        typer.Option(help="folder to watch (default: inbox from config)"),
+    ] = None,
+    jobs: Annotated[
+        int, typer.Option(min=1, help="number of archives added at once")
+    ] = 2,
+    overwrite: Annotated[
+        bool,
+        typer.Option(
+            "--overwrite",
+            "-o",
+            help="replace existing packs and songs instead of keeping them",
+        ),
+    ] = False,
+    settle: Annotated[
+        float,
+        typer.Option(
+            min=0, help="seconds a file must stay unchanged before it's added"
+        ),
+    ] = 2.0,
+    poll: Annotated[
+        Optional[float],
+        typer.Option(
+            min=0.1,
+            help="poll every this many seconds instead of using inotify",
+        ),
+    ] = None,
+    status: Annotated[
+        Optional[Path],
+        typer.Option(help="status file (default: inbox/.itg-cli-watch.json)"),
+    ] = None,
+    once: Annotated[
+        bool,
+        typer.Option(
+            "--once", help="add the archives already in the inbox and exit"
+        ),
+    ] = False,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    Watch a folder and add the pack archives dropped into it, and the song
+    archives dropped into its songs subfolder.
+    """
+    from itg_cli._watch import InboxWatcher, IngestResult
+
+    config = load_config(config_path)
+    inbox = inbox or config.inbox
+    if inbox is None:
+        print("No inbox is set in the config or supplied with --inbox.")
+        raise typer.Exit(1)
+    index = library_index(config)
+
+    def ingest_pack(path: Path) -> str:
+        pack, _num_courses = add_pack(
+            str(path),
+            config.packs,
+            config.courses,
+            overwrite=lambda _new, _old: overwrite,
+            delete_macos_files_flag=config.delete_macos_files,
+            index=index,
+            cache=config.cache,
+            on_stage=on_stage(),
+        )
+        return pack.name
+
+    def ingest_song(path: Path) -> str:
+        sf, _loc = add_song(
+            str(path),
+            config.singles,
+            cache=config.cache,
+            overwrite=lambda _new, _old: overwrite,
+            delete_macos_files_flag=config.delete_macos_files,
+            index=index,
+            on_stage=on_stage(),
+        )
+        return sf.title
+
+    def report(result: IngestResult) -> None:
+        name = result.path.name
+        if result.error is not None:
+            print(f"[red]Failed[/] {name}: {result.error}")
+            return
+        rate = format_size(int(result.size / max(result.seconds, 1e-3)))
+        print(
+            f"Added {result.kind} [bold green]{result.added}[/] from {name}"
+            f" ({result.seconds:.1f}s, {rate}/s)"
+        )
+
+    watcher = InboxWatcher(
+        inbox,
+        ingest_pack,
+        ingest_song,
+        jobs=jobs,
+        settle=settle,
+        poll=poll,
+        status=status,
+        on_result=report,
+    )
+    if not once:
+        print(f"Watching [bold]{inbox}[/] ({watcher.mode}). Ctrl+C to stop.")
+    try:
+        watcher.run(once=once)
+    except KeyboardInterrupt:
+        pass
+    if watcher.failed:
+        raise typer.Exit(1)
+
+
 @cli.command("censor")
 def censor_command(
-    path: Annotated[str, typer.Argument(help="path to the song to censor")],
+    targets: Annotated[
+        list[str],
+        typer.Argument(
+            help="song folders, glob patterns relative to your packs folder"
+            " (e.g. 'Pack/*') or text found in song titles and artists",
+        ),
+    ],
+    yes: Annotated[
+        bool,
+        typer.Option(
+            "--yes", "-y", help="censor several songs without asking"
+        ),
+    ] = False,
     config_path: ConfigOption = DEFAULT_CONFIG_PATH,
 ):
     """
-    Move a song in your packs folder to packs/.censored/Pack/Song, hiding it
+    Move songs in your packs folder to packs/.censored/Pack/Song, hiding them
     from players.
     """
-    config = CLISettings(config_path)
-    sm = censor(Path(path), config.packs, config.cache)
-    print(f"Censored [bold]{sm.title}.[/]")
+    config = load_config(config_path)
+    index = library_index(config)
+    paths = find_songs(targets, config.packs, index)
+    if len(paths) > 1 and not yes:
+        for path in paths:
+            print(f"{path.parent.name}/{path.name}")
+        if not confirm(f"Censor these {len(paths)} songs?"):
+            raise typer.Exit(1)
+    songs = censor_songs(
+        paths, config.packs, config.cache, index, on_stage=on_stage()
+    )
+    for song in songs:
+        print(f"Censored [bold]{song.title}.[/]")
 
 
 @cli.command("uncensor")
-def uncensor_command(config_path: ConfigOption = DEFAULT_CONFIG_PATH):
+def uncensor_command(
+    targets: Annotated[
+        Optional[list[str]],
+        typer.Argument(
+            help="Pack/Song folders, glob patterns (e.g. 'Pack/*') or text"
+            " found in censored song titles and artists",
+        ),
+    ] = None,
+    all_songs: Annotated[
+        bool, typer.Option("--all", help="uncensor every censored song")
+    ] = False,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
     """
-    Select a song to uncensor from those currently censored.
+    Uncensor the supplied songs, or select one from those currently censored.
     """
-    config = CLISettings(config_path)
+    config = load_config(config_path)
+    index = library_index(config)
     try:
-        sm = uncensor(config.packs)
-    except UncensorException:
-        print("No censored songs.")
+        if all_songs or targets:
+            songs = uncensor_songs(
+                config.packs,
+                None if all_songs else targets,
+                index,
+                on_stage=on_stage(),
+            )
+            titles = [song.title for song in songs]
+        else:
+            titles = [
+                uncensor(config.packs, index=index, on_stage=on_stage()).title
+            ]
+    except UncensorException as e:
+        print(str(e))
+        raise typer.Exit(1)
+    for title in titles:
+        print(f"Uncensored [bold]{title}[/].")
+
+
+@cli.command("search")
+def search_command(
+    query: Annotated[
+        str,
+        typer.Argument(
+            help="text to find in song titles, artists and credits"
+        ),
+    ] = "",
+    meter: Annotated[
+        Optional[str],
+        typer.Option(
+            "--meter", "-m", help="meter or range of meters, e.g. 12 or 10-12"
+        ),
+    ] = None,
+    stepstype: Annotated[
+        Optional[str],
+        typer.Option("--stepstype", "-t", help="e.g. dance-single"),
+    ] = None,
+    pack: Annotated[
+        Optional[str],
+        typer.Option("--pack", "-p", help="text to find in pack names"),
+    ] = None,
+    limit: Annotated[
+        int, typer.Option(min=1, help="maximum number of songs to show")
+    ] = 100,
+    rescan: Annotated[
+        bool, typer.Option(help="update the library index before searching")
+    ] = True,
+    full_rescan: FullRescanOption = False,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    Search the songs in your packs folder using the library index.
+    """
+    config = load_config(config_path)
+    meter_range = None
+    if meter is not None:
+        low, _, high = meter.partition("-")
+        if not (low.isdigit() and (high.isdigit() or not high)):
+            raise typer.BadParameter(f"Invalid meter: {meter}")
+        meter_range = (int(low), int(high or low))
+    index = library_index(config)
+    if rescan:
+        index.rescan(full=full_rescan)
+    songs = index.search(query, meter_range, stepstype, pack, limit)
+    if not songs:
+        print("No songs found.")
+        raise typer.Exit(1)
+    from rich.table import Table
+
+    table = Table("Pack", "Title", "Artist", "Meters", box=None)
+    for song in songs:
+        meters = [c.meter for c in song.charts if c.meter is not None]
+        table.add_row(song.pack, song.title, song.artist, str(meters))
+    print(table)
+
+
+@cli.command("dupes")
+def dupes_command(
+    rescan: Annotated[
+        bool, typer.Option(help="update the library index before comparing")
+    ] = True,
+    full_rescan: FullRescanOption = False,
+    workers: WorkersOption = None,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    List charts that appear in more than one song in your packs folder.
+    """
+    config = load_config(config_path)
+    index = library_index(config)
+    if rescan:
+        index.rescan(workers, full_rescan)
+    index.hash_charts(workers)
+    groups = index.duplicates()
+    if not groups:
+        print("No duplicate charts found.")
+        raise typer.Exit()
+    from rich.table import Table
+
+    table = Table("Hash", "Chart", box=None)
+    for group in groups:
+        table.add_row(
+            group[0].hash,
+            "\n".join(map(chart_label, group)),
+            end_section=True,
+        )
+    print(table)
+    print(f"[bold]{len(groups)}[/] charts appear in more than one song.")
+
+
+@cli.command("stats")
+def stats_command(
+    output_format: Annotated[
+        str,
+        typer.Option(
+            "--format",
+            "-f",
+            click_type=click.Choice(["table", "csv", "json"]),
+            help="csv lists one row per pack; json includes meter counts",
+        ),
+    ] = "table",
+    output: Annotated[
+        Optional[Path],
+        typer.Option("--output", "-o", help="file to write csv/json to"),
+    ] = None,
+    rescan: Annotated[
+        bool, typer.Option(help="update the library index before counting")
+    ] = True,
+    full_rescan: FullRescanOption = False,
+    workers: WorkersOption = None,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    Show the songs, charts, disk use and BPM and meter ranges of each pack,
+    and the meter distribution of each steps type.
+    """
+    config = load_config(config_path)
+    index = library_index(config)
+    if rescan:
+        index.rescan(workers, full_rescan)
+    stats = index.stats()
+    if output_format == "table":
+        if not stats.packs:
+            print("No songs found.")
+            raise typer.Exit(1)
+        print_stats(stats)
+        return
+    file = output.open("w", newline="") if output else sys.stdout
+    try:
+        if output_format == "json":
+            json.dump(
+                {
+                    "packs": [pack._asdict() for pack in stats.packs],
+                    "total": stats.total._asdict(),
+                    "meters": stats.meters,
+                },
+                file,
+                indent=2,
+            )
+            file.write("\n")
+        else:
+            import csv
+
+            writer = csv.writer(file)
+            writer.writerow(PackStats._fields)
+            writer.writerows(stats.packs)
+    finally:
+        if output:
+            file.close()
+
+
+def print_stats(stats: LibraryStats) -> None:
+    """Prints the per-pack and meter tables of `stats`."""
+    from rich.table import Table
+
+    def span(low, high) -> str:
+        if low is None:
+            return "-"
+        low, high = f"{low:g}", f"{high:g}"
+        return low if low == high else f"{low}-{high}"
+
+    table = Table("Pack", "Songs", "Charts", "Size", "BPM", "Meters", box=None)
+    for column in table.columns[1:4]:
+        column.justify = "right"
+    total = stats.total
+    for pack in (*stats.packs, total):
+        table.add_row(
+            f"[bold]{pack.name}[/]" if pack is total else pack.name,
+            str(pack.songs),
+            str(pack.charts),
+            format_size(pack.size),
+            span(pack.min_bpm, pack.max_bpm),
+            span(pack.min_meter, pack.max_meter),
+            end_section=pack is stats.packs[-1],
+        )
+    print(table)
+    for stepstype, counts in stats.meters.items():
+        most = max(counts.values())
+        meters = Table(
+            "Meter",
+            "Charts",
+            "",
+            title=stepstype or "(no steps type)",
+            box=None,
+        )
+        for meter, count in counts.items():
+            bar = "█" * max(1, round(count / most * 40))
+            meters.add_row(
+                "?" if meter is None else str(meter),
+                str(count),
+                f"[blue]{bar}[/]",
+            )
+        print()
+        print(meters)
+
+
+def chart_label(chart: ChartHash) -> str:
+    """Formats a chart as Pack/Song [steps type difficulty]."""
+    song = chart.simfile.parent
+    return (
+        f"{song.parent.name}/{song.name} "
+        f"[blue]\\[{chart.stepstype} {chart.difficulty}][/]"
+    )
+
+
+@cli.command("gc")
+def gc_command(
+    dry_run: Annotated[
+        bool,
+        typer.Option("--dry-run", help="report the size without deleting"),
+    ] = False,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    Delete overwritten packs and songs left in the trash, e.g. if itg-cli
+    was stopped while deleting them in the background, and staging folders
+    left by killed adds.
+    """
+    config = load_config(config_path)
+    count, size = empty_trash(config.packs, dry_run)
+    action = "Found" if dry_run else "Deleted"
+    print(
+        f"{action} [bold]{count}[/] trashed packs and songs"
+        f" ({format_size(size)})."
+    )
+
+
+@cli.command("dedupe")
+def dedupe_command(
+    dry_run: Annotated[
+        bool,
+        typer.Option(
+            "--dry-run", help="report the duplicates without linking"
+        ),
+    ] = False,
+    min_size: Annotated[
+        str,
+        typer.Option("--min-size", help="ignore files smaller than this"),
+    ] = "64KB",
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    Replace identical audio, images and videos in your packs with hardlinks
+    to a single copy.
+    """
+    from itg_cli._config import parse_size
+
+    config = load_config(config_path)
+    result = dedupe_library(
+        config.packs, library_index(config), dry_run, parse_size(min_size)
+    )
+    action = "Would link" if dry_run else "Linked"
+    print(
+        f"Compared [bold]{result.files}[/] files ({result.hashed} hashed):"
+        f" [bold]{result.groups}[/] sets of identical files."
+    )
+    print(
+        f"{action} [bold]{result.linked}[/] files, reclaiming"
+        f" [bold green]{format_size(result.bytes_reclaimed)}[/]."
+    )
+
+
+## Course Commands ##
+courses_cli = typer.Typer(
+    no_args_is_help=True, help="Check the courses in your courses folder."
+)
+cli.add_typer(courses_cli, name="courses")
+
+
+@courses_cli.command("check")
+def courses_check_command(config_path: ConfigOption = DEFAULT_CONFIG_PATH):
+    """
+    List course entries that don't match a song in your packs folder, e.g.
+    after packs were removed or renamed.
+    """
+    from itg_cli._courses import course_files
+
+    config = load_config(config_path)
+    files = course_files(config.courses)
+    missing = check_courses(files, SongLookup(config.packs))
+    if missing:
+        print_unresolved(missing)
+    courses = len({entry.course for entry in missing})
+    print(
+        f"Checked [bold]{len(files)}[/] courses: [bold]{len(missing)}[/]"
+        f" entries in [bold]{courses}[/] courses don't match a song."
+    )
+    if missing:
+        raise typer.Exit(1)
+
+
+## Download Cache Commands ##
+cache_cli = typer.Typer(
+    no_args_is_help=True,
+    help="Manage the archives kept in downloads and the ITGmania song cache.",
+)
+cli.add_typer(cache_cli, name="cache")
+
+
+@cache_cli.command("ls")
+def cache_ls_command(config_path: ConfigOption = DEFAULT_CONFIG_PATH):
+    """
+    List the cached downloads, most recently used first.
+    """
+    config = load_config(config_path)
+    cache = require_download_cache(config)
+    entries = cache.entries()
+    if not entries:
+        print("The download cache is empty.")
+        raise typer.Exit()
+    from rich.table import Table
+
+    table = Table("File", "Size", "Last used", "URL", box=None)
+    for entry in entries:
+        last_used = time.strftime(
+            "%Y-%m-%d %H:%M", time.localtime(entry.last_used)
+        )
+        table.add_row(
+            entry.filename, format_size(entry.size), last_used, entry.url
+        )
+    print(table)
+    total = format_size(sum(entry.size for entry in entries))
+    limit = config.downloads_max_size
+    print(
+        f"[bold]{len(entries)}[/] files, [bold]{total}[/]"
+        + (f" of {format_size(limit)}" if limit is not None else "")
+    )
+
+
+@cache_cli.command("prune")
+def cache_prune_command(
+    max_size: Annotated[
+        Optional[str],
+        typer.Option(
+            "--max-size",
+            help="size to shrink the cache to, e.g. 10GB (default: config)",
+        ),
+    ] = None,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    Delete the least recently used downloads until the cache fits its size
+    limit.
+    """
+    from itg_cli._config import parse_size
+
+    config = load_config(config_path)
+    cache = require_download_cache(config)
+    removed = cache.prune(parse_size(max_size) if max_size else None)
+    freed = format_size(sum(entry.size for entry in removed))
+    print(f"Deleted [bold]{len(removed)}[/] files ({freed}).")
+
+
+@cache_cli.command("gc")
+def cache_gc_command(
+    dry_run: Annotated[
+        bool,
+        typer.Option("--dry-run", help="list the entries without deleting"),
+    ] = False,
+    config_path: ConfigOption = DEFAULT_CONFIG_PATH,
+):
+    """
+    Delete ITGmania song cache entries whose song folders no longer exist.
+    """
+    config = load_config(config_path)
+    song_cache = SongCache(config.cache, config.packs)
+    orphans = song_cache.orphans() if dry_run else song_cache.gc()
+    for entry in orphans:
+        print(entry.name)
+    action = "Found" if dry_run else "Deleted"
+    print(f"{action} [bold]{len(orphans)}[/] orphaned cache entries.")
+
+
+def format_size(size: int) -> str:
+    """Formats a number of bytes for display, e.g. 1.5 GB."""
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1000:
+            break
+        size /= 1000
+    else:
+        unit = "TB"
+    return f"{size:.1f} {unit}" if unit != "B" else f"{size} B"
+
+
+def library_index(config: CLISettings) -> LibraryIndex:
+    """Opens the library index of the packs folder in `config`."""
+    return LibraryIndex(config.index, config.packs)
+
+
+def staging_options(
+    config: CLISettings, stage_in_dest: Optional[bool], link: Optional[str]
+) -> tuple[Optional[Path], LinkMode]:
+    """
+    Returns the staging folder and link mode for an add from the
+    `--stage-in-dest` and `--link` flags. Unset, adds stage in the packs
+    folder when the system's temporary folder is on another filesystem, so
+    installing is still a rename, and local directories are copied.
+    """
+    if stage_in_dest is None:
+        stage_in_dest = not same_filesystem(Path(gettempdir()), config.packs)
+    return (config.packs if stage_in_dest else None), link or "copy"
+
+
+def download_cache(config: CLISettings) -> Optional[DownloadCache]:
+    """
+    Returns the download cache of the downloads folder in `config`, or None if
+    downloads are not kept.
+    """
+    if config.downloads is None:
+        return None
+    return DownloadCache(config.downloads, config.downloads_max_size)
+
+
+def require_download_cache(config: CLISettings) -> DownloadCache:
+    cache = download_cache(config)
+    if cache is None:
+        print("No downloads folder is set in the config.")
         raise typer.Exit(1)
-    print(f"Uncensored [bold]{sm.title}[/].")
+    return cache
 
 
 if __name__ == "__main__":
@@ -0,0 +1,86 @@
+import json
+import os
+import time
+from pathlib import Path
+from typing import NamedTuple
+from itg_cli._metadata import SongMetadata, read_song_metadata, subdirs
+
+
+class CensoredSong(NamedTuple):
+    path: str  # Pack/Song, relative to both packs and packs/.censored
+    title: str
+    artist: str
+    simfile: str  # Name of the .sm/.ssc file
+    censored_at: float
+
+
+class CensorManifest:
+    """
+    Record of the songs in `packs`/.censored, stored in manifest.json inside
+    it, so censored songs can be listed without parsing their simfiles.
+
+    The manifest is reconciled with the folders in .censored when it is
+    loaded: entries whose folder is gone are dropped, and folders censored
+    by hand or before the manifest existed are read and added.
+    """
+
+    NAME = "manifest.json"
+
+    def __init__(self, packs: Path):
+        self.censored = packs / ".censored"
+        self.path = self.censored / self.NAME
+        self.songs: dict[str, CensoredSong] = self._load()
+
+    def entries(self) -> list[CensoredSong]:
+        """Returns the censored songs, sorted by pack and folder."""
+        return [self.songs[key] for key in sorted(self.songs)]
+
+    def add(self, key: str, metadata: SongMetadata) -> CensoredSong:
+        song = CensoredSong(
+            key,
+            metadata.title,
+            metadata.artist,
+            metadata.path.name,
+            time.time(),
+        )
+        self.songs[key] = song
+        return song
+
+    def remove(self, key: str) -> None:
+        self.songs.pop(key, None)
+
+    def save(self) -> None:
+        self.censored.mkdir(parents=True, exist_ok=True)
+        data = {key: song._asdict() for key, song in self.songs.items()}
+        # Write atomically so an interrupted write can't corrupt the manifest
+        temp = self.path.with_suffix(".tmp")
+        temp.write_text(json.dumps(data, indent=2))
+        os.replace(temp, self.path)
+
+    def _load(self) -> dict[str, CensoredSong]:
+        songs = {}
+        if self.path.exists():
+            try:
+                data = json.loads(self.path.read_text())
+                songs = {key: CensoredSong(**s) for key, s in data.items()}
+            except (ValueError, TypeError):
+                print(f"Warning | Rebuilding invalid manifest: {self.path}")
+        on_disk = {
+            f"{pack.name}/{song.name}": Path(song.path)
+            for pack in subdirs(self.censored)
+            for song in subdirs(Path(pack.path))
+        }
+        songs = {key: s for key, s in songs.items() if key in on_disk}
+        for key in on_disk.keys() - songs.keys():
+            try:
+                metadata = read_song_metadata(on_disk[key])
+            except FileNotFoundError:
+                continue
+            songs[key] = CensoredSong(
+                key,
+                metadata.title,
+                metadata.artist,
+                metadata.path.name,
+                on_disk[key].stat().st_mtime,
+            )
+        return songs
@@ -19,9 +19,12 @@ class CLISettings:
     singles: Path
     delete_macos_files: bool
     downloads: Optional[Path]
+    downloads_max_size: Optional[int]  # In bytes
+    inbox: Optional[Path]  # The folder watched by the watch command
     packs: Path
     courses: Path
     cache: Path
+    index: Path  # The library index database, next to the .toml file
 
     TEMPLATE_PATH = files("itg_cli").joinpath("config_template.toml")
 
@@ -62,10 +65,17 @@ class CLISettings:
         self.downloads = (
             Path(optional["downloads"]) if optional.get("downloads") else None
         )
+        self.downloads_max_size = (
+            parse_size(optional["downloads_max_size"])
+            if optional.get("downloads_max_size")
+            else None
+        )
+        self.inbox = Path(optional["inbox"]) if optional.get("inbox") else None
         self.packs = Path(optional.get("packs") or self.root / "Songs")
         self.courses = Path(optional.get("courses") or self.root / "Courses")
         self.cache = Path(optional.get("cache") or self.root / "Cache")
         self.singles = self.packs / required["singles_pack_name"]
+        self.index = self.location.parent / "library.sqlite"
 
         self.__validate_dirs()
 
@@ -103,6 +113,7 @@ class CLISettings:
             "courses": self.courses,
             "cache": self.cache,
             "downloads": self.downloads,
+            "inbox": self.inbox,
         }
         # Conditionally add singles because it might not yet exist
         if self.singles.exists():
@@ -118,3 +129,22 @@ class CLISettings:
                 + "\n".join(f"{name}: {str(path)}" for name, path in invalid.items())
                 + f"\nPlease edit your config file: {self.location}"
             )
+
+
+SIZE_UNITS = {"B": 1, "KB": 1000, "MB": 1000**2, "GB": 1000**3, "TB": 1000**4}
+
+
+def parse_size(size: str | int) -> int:
+    """
+    Parses a size like '500MB' or '20GB' (or a plain number of bytes) into a
+    number of bytes.
+    """
+    if isinstance(size, int):
+        return size
+    text = size.strip().upper().replace(" ", "")
+    number = text.rstrip("KMGTB")
+    unit = text[len(number):] or "B"
+    try:
+        return int(float(number) * SIZE_UNITS[unit])
+    except (KeyError, ValueError):
+        raise ConfigError(f"Invalid size: {size}")
@@ -0,0 +1,104 @@
+import re
+from pathlib import Path
+from typing import Iterable, NamedTuple, Optional
+from itg_cli._metadata import decode_value, iter_tags, subdirs
+
+# #SONG entries picked at play time (by rank or at random) rather than naming
+# a song, e.g. BEST3 or *
+DYNAMIC_SONG = re.compile(r"\*|(GRADE)?(BEST|WORST)\d+", re.IGNORECASE)
+
+
+class Course(NamedTuple):
+    path: Path  # The .crs file
+    name: str
+    songs: list[str]  # Song references as written, e.g. "Pack/Song"
+
+
+class UnresolvedSong(NamedTuple):
+    course: Path  # The .crs file
+    reference: str  # The #SONG entry that doesn't match a song
+
+
+class SongLookup:
+    """
+    Case-insensitive lookup of the song folders in `packs` by pack and song
+    folder name, built with a single scan of `packs` (hidden folders like
+    `.censored` are skipped, as ITGmania doesn't load them).
+    """
+
+    def __init__(self, packs: Path):
+        self.packs: dict[str, Path] = {}
+        self.songs: dict[tuple[str, str], Path] = {}
+        self.songs_by_name: dict[str, list[Path]] = {}
+        for pack in subdirs(packs):
+            self.packs[pack.name.lower()] = Path(pack.path)
+            for song in subdirs(Path(pack.path)):
+                key = (pack.name.lower(), song.name.lower())
+                self.songs[key] = Path(song.path)
+                self.songs_by_name.setdefault(song.name.lower(), []).append(
+                    Path(song.path)
+                )
+
+    def resolve(self, reference: str) -> Optional[Path]:
+        """
+        Returns the song folder a course's #SONG entry `reference` refers to
+        (`Pack/Song`, or `Song` in any pack), or the pack folder for `Pack/*`.
+        Returns None if there is no such song or pack.
+        """
+        parts = reference.replace("\\", "/").strip("/").split("/")
+        if len(parts) > 2 and parts[0].lower() == "songs":
+            parts = parts[1:]
+        if len(parts) == 1:
+            matches = self.songs_by_name.get(parts[0].lower())
+            return matches[0] if matches else None
+        pack, song = parts[-2].lower(), parts[-1].lower()
+        if song == "*":
+            return self.packs.get(pack)
+        return self.songs.get((pack, song))
+
+
+def read_course(path: Path) -> Course:
+    """Reads the name and #SONG entries of the .crs file at `path`."""
+    data = path.read_bytes()
+    name, songs = "", []
+    for key, start, end in iter_tags(data):
+        if key == b"COURSE":
+            name = decode_value(data[start:end])
+        elif key == b"SONG":
+            # #SONG:Pack/Song:difficulty:modifiers;
+            songs.append(decode_value(data[start:end]).split(":")[0].strip())
+    return Course(path, name or path.stem, songs)
+
+
+def course_files(courses: Path) -> list[Path]:
+    """Returns the .crs files in `courses` and its subfolders, sorted."""
+    return sorted(
+        path
+        for path in courses.rglob("*")
+        if path.suffix.lower() == ".crs"
+        and not path.name.startswith(".")
+        and path.is_file()
+    )
+
+
+def check_courses(
+    paths: Iterable[Path], lookup: SongLookup
+) -> list[UnresolvedSong]:
+    """
+    Returns the #SONG entries of the .crs files at `paths` that don't match
+    a song (or pack) in `lookup`. Entries picked at play time (`*`, `BEST1`,
+    ...) are not checked, and unreadable files are reported as a whole.
+    """
+    unresolved = []
+    for path in paths:
+        try:
+            course = read_course(path)
+        except OSError as e:
+            unresolved.append(UnresolvedSong(path, f"({e.strerror})"))
+            continue
+        for reference in course.songs:
+            if DYNAMIC_SONG.fullmatch(reference) is not None:
+                continue
+            if lookup.resolve(reference) is None:
+                unresolved.append(UnresolvedSong(path, reference))
+    return unresolved
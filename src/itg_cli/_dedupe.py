@@ -0,0 +1,276 @@
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from threading import Lock
+from typing import Callable, Iterable, Iterator, NamedTuple
+from itg_cli._index import AssetEntry, LibraryIndex
+
+# Files that packs share: audio, images and videos. Simfiles are small and
+# edited by hand, so they are never linked.
+ASSET_SUFFIXES = frozenset(
+    {
+        *(".ogg", ".mp3", ".wav", ".flac", ".opus"),
+        *(".png", ".jpg", ".jpeg", ".bmp", ".gif", ".webp"),
+        *(".mp4", ".avi", ".mpg", ".mpeg", ".webm", ".m4v", ".mkv", ".mov"),
+        *(".flv", ".wmv"),
+    }
+)
+# Smaller files aren't worth linking
+MIN_SIZE = 64_000
+# Bytes read from each end of a file for its partial hash
+PARTIAL_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+# Held while files are linked so concurrent installs don't race
+_link_lock = Lock()
+
+
+class DedupeResult(NamedTuple):
+    files: int  # Asset files compared
+    hashed: int  # Partial and full hashes computed (not taken from the index)
+    groups: int  # Sets of identical files that weren't all linked already
+    linked: int  # Files replaced with hardlinks (or that would be)
+    bytes_reclaimed: int
+
+
+def dedupe_library(
+    packs: Path,
+    index: LibraryIndex,
+    dry_run: bool = False,
+    min_size: int = MIN_SIZE,
+) -> DedupeResult:
+    """
+    Replaces byte-identical asset files (audio, images and videos) of at
+    least `min_size` bytes across the packs in `packs` with hardlinks to a
+    single copy. Hidden folders (like `.censored`) are skipped.
+
+    Files are grouped by size, then by a hash of their first and last 64 KiB,
+    then by a hash of their whole contents, so only files that share their
+    size with another file are read at all. The hashes are cached in `index`
+    keyed on each file's size and mtime, so later runs only read new and
+    changed files. Files on different filesystems are never linked.
+
+    Linked files share their contents, so editing one in place changes it in
+    every pack; replacing it (as `add_pack` does) doesn't. If `dry_run` is
+    true, nothing is linked and the result reports what would be.
+    """
+    known = index.assets()
+    current = {
+        path: _entry(path, stat, known.get(path))
+        for path, stat in _walk_assets(packs, min_size)
+    }
+    index.remove_assets(known.keys() - current.keys())
+    index.store_assets(
+        entry for path, entry in current.items() if known.get(path) != entry
+    )
+    with _link_lock:
+        return _link_identical(list(current.values()), index, dry_run)
+
+
+def dedupe_new(
+    dirs: Iterable[Path], index: LibraryIndex, min_size: int = MIN_SIZE
+) -> DedupeResult:
+    """
+    Links the asset files in `dirs` (e.g. a newly added pack) to identical
+    files recorded in `index` by an earlier `dedupe_library`, and records
+    them. Only the recorded files whose size matches a new file are checked.
+    """
+    new = {
+        path: _entry(path, stat, None)
+        for folder in dirs
+        for path, stat in _walk_assets(folder, min_size)
+    }
+    if not new:
+        return DedupeResult(0, 0, 0, 0, 0)
+    sizes: dict[int, set[int]] = {}
+    for entry in new.values():
+        sizes.setdefault(entry.device, set()).add(entry.size)
+    candidates = dict(new)
+    removed = []
+    for device, device_sizes in sizes.items():
+        for entry in index.assets_of_size(device, device_sizes):
+            if entry.path in candidates:
+                continue
+            try:
+                stat = os.stat(entry.path)
+            except FileNotFoundError:
+                removed.append(entry.path)
+                continue
+            candidates[entry.path] = _entry(entry.path, stat, entry)
+    index.remove_assets(removed)
+    index.store_assets(new.values())
+    with _link_lock:
+        return _link_identical(list(candidates.values()), index, False)
+
+
+def _link_identical(
+    entries: list[AssetEntry], index: LibraryIndex, dry_run: bool
+) -> DedupeResult:
+    """
+    Links the identical files among `entries` and stores the hashes it
+    computes and the links it makes in `index`.
+    """
+    by_size: dict[tuple[int, int], dict[int, list[AssetEntry]]] = {}
+    for entry in entries:
+        inodes = by_size.setdefault((entry.device, entry.size), {})
+        inodes.setdefault(entry.inode, []).append(entry)
+    hashed = groups = linked = reclaimed = 0
+    updated: list[AssetEntry] = []
+
+    def with_hash(links, field: str, digest: Callable[[str], str]):
+        """Returns `links` (one inode) with `field` set, hashing if needed."""
+        nonlocal hashed
+        value = next(
+            (getattr(e, field) for e in links if getattr(e, field)), None
+        )
+        if value is None:
+            value = digest(links[0].path)
+            hashed += digest is _partial_hash or digest is _full_hash
+        if all(getattr(e, field) == value for e in links):
+            return links
+        links = [e._replace(**{field: value}) for e in links]
+        updated.extend(links)
+        return links
+
+    for (_device, size), inodes in by_size.items():
+        if len(inodes) < 2:
+            continue
+        by_partial: dict[str, list[list[AssetEntry]]] = {}
+        for links in inodes.values():
+            links = with_hash(links, "partial_hash", _partial_hash)
+            by_partial.setdefault(links[0].partial_hash, []).append(links)
+        for candidates in by_partial.values():
+            if len(candidates) < 2:
+                continue
+            by_hash: dict[str, list[list[AssetEntry]]] = {}
+            for links in candidates:
+                if size <= 2 * PARTIAL_SIZE:
+                    # The partial hash already covers the whole file
+                    partial = links[0].partial_hash
+                    links = with_hash(links, "hash", lambda _: partial)
+                else:
+                    links = with_hash(links, "hash", _full_hash)
+                by_hash.setdefault(links[0].hash, []).append(links)
+            for identical in by_hash.values():
+                if len(identical) < 2:
+                    continue
+                groups += 1
+                # Keep the copy with the most links so fewer are replaced
+                identical.sort(key=lambda links: (-len(links), links[0].path))
+                keeper = identical[0][0]
+                for links in identical[1:]:
+                    count, freed, relinked = _replace_with_links(
+                        keeper, links, dry_run
+                    )
+                    linked += count
+                    reclaimed += freed
+                    updated.extend(relinked)
+    index.store_assets(updated)
+    return DedupeResult(len(entries), hashed, groups, linked, reclaimed)
+
+
+def _replace_with_links(
+    keeper: AssetEntry, links: list[AssetEntry], dry_run: bool
+) -> tuple[int, int, list[AssetEntry]]:
+    """
+    Replaces the files in `links`, which share an inode, with hardlinks to
+    `keeper`. Returns the number of files replaced, the bytes freed (only if
+    every link to the inode was replaced) and the updated entries.
+    """
+    try:
+        keeper_stat = os.stat(keeper.path)
+        nlink = os.stat(links[0].path).st_nlink
+    except FileNotFoundError:
+        return 0, 0, []
+    if (keeper_stat.st_size, keeper_stat.st_mtime) != (
+        keeper.size,
+        keeper.mtime,
+    ):
+        return 0, 0, []  # Changed since it was hashed
+    replaced = []
+    for entry in links:
+        if dry_run:
+            replaced.append(entry)
+            continue
+        try:
+            stat = os.stat(entry.path)
+            if (stat.st_size, stat.st_mtime) != (entry.size, entry.mtime):
+                continue  # Changed since it was hashed
+            _link(Path(keeper.path), Path(entry.path))
+        except OSError as e:
+            print(f"Warning | Could not link {entry.path}: {e}")
+            continue
+        replaced.append(
+            entry._replace(mtime=keeper_stat.st_mtime, inode=keeper.inode)
+        )
+    freed = keeper.size if len(replaced) == nlink else 0
+    return len(replaced), freed, [] if dry_run else replaced
+
+
+def _link(src: Path, dest: Path) -> None:
+    """Atomically replaces `dest` with a hardlink to `src`."""
+    temp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex[:8]}.tmp")
+    os.link(src, temp)
+    try:
+        os.replace(temp, dest)
+    except OSError:
+        temp.unlink(missing_ok=True)
+        raise
+
+
+def _entry(path: str, stat: os.stat_result, known) -> AssetEntry:
+    """
+    Returns the AssetEntry of the file at `path`, keeping the hashes of its
+    `known` entry if the file hasn't changed since.
+    """
+    entry = AssetEntry(
+        path, stat.st_size, stat.st_mtime, stat.st_dev, stat.st_ino, None, None
+    )
+    if known is not None and known[:5] == entry[:5]:
+        return known
+    return entry
+
+
+def _walk_assets(
+    root: Path, min_size: int
+) -> Iterator[tuple[str, os.stat_result]]:
+    """
+    Yields the asset files under `root` of at least `min_size` bytes and
+    their stats, skipping hidden files and folders and symlinks.
+    """
+    stack = [str(root.absolute())]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.name.startswith("."):
+                    continue
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif (
+                    entry.is_file(follow_symlinks=False)
+                    and os.path.splitext(entry.name)[1].lower()
+                    in ASSET_SUFFIXES
+                ):
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_size >= min_size:
+                        yield entry.path, stat
+
+
+def _partial_hash(path: str) -> str:
+    # blake2b is faster than sha256, and these hashes never leave the index
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        digest.update(file.read(PARTIAL_SIZE))
+        size = os.fstat(file.fileno()).st_size
+        if size > PARTIAL_SIZE:
+            file.seek(max(PARTIAL_SIZE, size - PARTIAL_SIZE))
+            digest.update(file.read(PARTIAL_SIZE))
+    return digest.hexdigest()
+
+
+def _full_hash(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,217 @@
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+from threading import Lock
+from typing import NamedTuple, Optional
+from urllib.parse import parse_qs, urlparse, urlunparse
+from itg_cli._utils import is_google_drive, remote_validators, resolve_redirect
+
+
+class CacheEntry(NamedTuple):
+    key: str
+    url: str
+    filename: str
+    size: int
+    last_used: float
+    # What the server reported for the download, to detect re-uploads
+    etag: Optional[str] = None
+    content_length: Optional[int] = None
+
+
+class DownloadCache:
+    """
+    Cache of the archives downloaded to `downloads`, keyed by the URL they
+    were downloaded from (see `cache_key`). Entries are recorded in a hidden
+    index file in `downloads` and validated against the size of the file on
+    disk. The ETag and Content-Length the server reported are recorded too,
+    and an entry is only reused while the server still reports the same ones
+    (so a pack re-uploaded to the same link is downloaded again).
+
+    If `max_size` (in bytes) is set, the least recently used archives are
+    deleted whenever the cache grows past it.
+    """
+
+    INDEX_NAME = ".itg-cli-cache.json"
+
+    def __init__(self, downloads: Path, max_size: Optional[int] = None):
+        self.downloads = downloads
+        self.max_size = max_size
+        self.index_path = downloads / self.INDEX_NAME
+        self.lock = Lock()
+
+    def get(self, url: str) -> Optional[Path]:
+        """
+        Returns the path to the cached download of `url` and marks it as
+        recently used, or returns None if it is not cached or the server
+        reports a different ETag or Content-Length than when it was cached.
+        If the server can't be reached, the cached download is used.
+        """
+        key = cache_key(url)
+        with self.lock:
+            entries = self._read()
+            entry = entries.get(key)
+            if entry is None:
+                return None
+            path = self.downloads / entry.filename
+            if not path.is_file() or path.stat().st_size != entry.size:
+                # The file was deleted or replaced by another download
+                del entries[key]
+                self._write(entries)
+                return None
+        # Checked without the lock so other downloads aren't held up
+        fresh = _is_fresh(entry)
+        with self.lock:
+            entries = self._read()
+            if not fresh:
+                print(f"Cached download is out of date: {path}")
+                entries.pop(key, None)
+                self._write(entries)
+                return None
+            entries[key] = entry._replace(last_used=time.time())
+            self._write(entries)
+        print(f"Using cached download: {path}")
+        return path
+
+    def contains(self, url: str) -> bool:
+        """
+        Returns whether `url` is cached without marking it as used or asking
+        the server whether it changed (see `get`).
+        """
+        entry = self._read().get(cache_key(url))
+        if entry is None:
+            return False
+        path = self.downloads / entry.filename
+        return path.is_file() and path.stat().st_size == entry.size
+
+    def put(
+        self,
+        url: str,
+        path: Path,
+        validators: Optional[tuple[Optional[str], Optional[int]]] = None,
+    ) -> None:
+        """
+        Records `path` (a file in `downloads`) as the download of `url`, then
+        evicts old entries if the cache is larger than `max_size`.
+        `validators` are the ETag and Content-Length of the response it was
+        downloaded from; if they aren't supplied, the server is asked for
+        them. They aren't recorded for Google Drive links, whose share pages
+        don't describe the file.
+        """
+        key = cache_key(url)
+        if key.startswith("gdrive:"):
+            validators = None
+        elif validators is None:
+            validators = remote_validators(url)
+        entry = CacheEntry(
+            key,
+            url,
+            path.name,
+            path.stat().st_size,
+            time.time(),
+            *(validators or (None, None)),
+        )
+        with self.lock:
+            entries = self._read()
+            # Forget other entries that pointed to a file that was overwritten
+            for other in list(entries.values()):
+                if other.filename == path.name:
+                    del entries[other.key]
+            entries[key] = entry
+            self._write(entries)
+        if self.max_size is not None:
+            self.prune(self.max_size, keep=key)
+
+    def entries(self) -> list[CacheEntry]:
+        """Returns the cache entries, most recently used first."""
+        entries = self._read().values()
+        return sorted(entries, key=lambda e: e.last_used, reverse=True)
+
+    def prune(
+        self, max_size: Optional[int] = None, keep: Optional[str] = None
+    ) -> list[CacheEntry]:
+        """
+        Deletes the least recently used archives until the cache is no larger
+        than `max_size` bytes (defaults to the cache's `max_size`) and drops
+        entries whose file is missing. The entry with key `keep` is never
+        deleted. Returns the deleted entries.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        removed = []
+        with self.lock:
+            entries = self._read()
+            for entry in list(entries.values()):
+                path = self.downloads / entry.filename
+                if not path.is_file() or path.stat().st_size != entry.size:
+                    del entries[entry.key]
+            total = sum(e.size for e in entries.values())
+            lru = sorted(entries.values(), key=lambda e: e.last_used)
+            for entry in lru:
+                if max_size is None or total <= max_size:
+                    break
+                if entry.key == keep:
+                    continue
+                (self.downloads / entry.filename).unlink(missing_ok=True)
+                del entries[entry.key]
+                total -= entry.size
+                removed.append(entry)
+            self._write(entries)
+        return removed
+
+    def _read(self) -> dict[str, CacheEntry]:
+        if not self.index_path.exists():
+            return {}
+        try:
+            data = json.loads(self.index_path.read_text())
+        except ValueError:
+            return {}
+        return {key: CacheEntry(key, **value) for key, value in data.items()}
+
+    def _write(self, entries: dict[str, CacheEntry]) -> None:
+        data = {
+            key: {k: v for k, v in entry._asdict().items() if k != "key"}
+            for key, entry in entries.items()
+        }
+        # Write atomically so an interrupted write can't corrupt the index
+        temp = self.index_path.with_suffix(".tmp")
+        temp.write_text(json.dumps(data, indent=2))
+        os.replace(temp, self.index_path)
+
+
+def _is_fresh(entry: CacheEntry) -> bool:
+    """
+    Returns whether the server still reports the ETag (or, without one, the
+    Content-Length) recorded for `entry`. Entries without either, and
+    servers that can't be reached, count as fresh.
+    """
+    if entry.etag is None and entry.content_length is None:
+        return True
+    current = remote_validators(entry.url)
+    if current is None:
+        return True
+    etag, length = current
+    if entry.etag is not None and etag is not None:
+        return etag == entry.etag
+    if entry.content_length is not None and length is not None:
+        return length == entry.content_length
+    return True
+
+
+def cache_key(url: str) -> str:
+    """
+    Returns the cache key of `url`. Google Sheets redirects are unwrapped and
+    Google Drive links are reduced to their file ID, so different links to
+    the same Drive file share a key.
+    """
+    url = resolve_redirect(url, verbose=False)
+    parsed = urlparse(url)
+    if is_google_drive(url):
+        file_id = parse_qs(parsed.query).get("id", [None])[0]
+        parts = parsed.path.split("/")
+        if "d" in parts and parts.index("d") + 1 < len(parts):
+            file_id = parts[parts.index("d") + 1]
+        if file_id is not None:
+            return f"gdrive:{file_id}"
+    normalized = urlunparse(parsed._replace(fragment=""))
+    return hashlib.sha256(normalized.encode()).hexdigest()
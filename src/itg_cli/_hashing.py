@@ -0,0 +1,102 @@
+import hashlib
+from pathlib import Path
+from typing import NamedTuple, Optional
+from itg_cli._metadata import parallel_map
+
+
+class ChartHash(NamedTuple):
+    simfile: Path
+    stepstype: str
+    difficulty: str
+    description: str
+    hash: str
+
+
+class Duplicate(NamedTuple):
+    chart: ChartHash  # The incoming chart
+    matches: list[ChartHash]  # Charts with the same hash in the library
+
+
+def hash_simfile(simfile_path: Path) -> list[ChartHash]:
+    """
+    Returns the hashes of the charts in the .sm/.ssc file at `simfile_path`,
+    or an empty list if it can't be parsed. A chart's hash covers its steps
+    type, its normalized note data (see `normalize_notes`) and the BPMs it is
+    played at, so the same chart hashes the same in any pack.
+    """
+    import simfile
+
+    try:
+        sm = simfile.open(str(simfile_path), strict=False)
+    except Exception:
+        return []
+    hashes = []
+    for chart in sm.charts:
+        bpms = chart.get("BPMS") or sm.bpms or ""
+        data = "\n".join(
+            (
+                (chart.stepstype or "").strip(),
+                normalize_bpms(bpms),
+                normalize_notes(chart.notes or ""),
+            )
+        )
+        hashes.append(
+            ChartHash(
+                simfile_path,
+                (chart.stepstype or "").strip(),
+                (chart.difficulty or "").strip(),
+                (chart.description or "").strip(),
+                hashlib.sha1(data.encode()).hexdigest()[:16],
+            )
+        )
+    return hashes
+
+
+def hash_simfiles(
+    simfile_paths: list[Path], workers: Optional[int] = None
+) -> dict[Path, list[ChartHash]]:
+    """
+    Hashes the charts of every simfile in `simfile_paths` in a pool of
+    `workers` processes (see `parallel_map`).
+    """
+    return dict(
+        zip(simfile_paths, parallel_map(hash_simfile, simfile_paths, workers))
+    )
+
+
+def normalize_notes(notes: str) -> str:
+    """
+    Normalizes the note data of a chart: comments and whitespace are removed
+    and each measure is reduced to the fewest rows that hold its notes, so
+    e.g. a measure of quarter notes written with 8th note rows hashes the same
+    as one written with 4th note rows.
+    """
+    measures = []
+    for measure in notes.split(","):
+        rows = (
+            line.partition("//")[0].strip() for line in measure.splitlines()
+        )
+        rows = [row for row in rows if row]
+        while (
+            len(rows) > 1
+            and len(rows) % 2 == 0
+            and not any(row.strip("0") for row in rows[1::2])
+        ):
+            rows = rows[::2]
+        measures.append("\n".join(rows))
+    # Trailing empty measures don't change the chart
+    while measures and not measures[-1].strip("0\n"):
+        measures.pop()
+    return ",".join(measures)
+
+
+def normalize_bpms(bpms: str) -> str:
+    """Normalizes a BPMS value to `beat=bpm` pairs with 3 decimal places."""
+    pairs = []
+    for pair in bpms.split(","):
+        beat, _, bpm = pair.partition("=")
+        try:
+            pairs.append(f"{float(beat):.3f}={float(bpm):.3f}")
+        except ValueError:
+            continue
+    return ",".join(pairs)
@@ -0,0 +1,596 @@
+import json
+import os
+import sqlite3
+from itertools import groupby, islice
+from pathlib import Path
+from threading import Lock
+from typing import Iterable, NamedTuple, Optional
+from itg_cli._hashing import ChartHash, Duplicate, hash_simfiles
+from itg_cli._metadata import (
+    SongMetadata,
+    parallel_map,
+    read_song_metadata,
+    subdirs,
+)
+
+SCHEMA_VERSION = 3
+# Songs written per transaction by `rescan`
+STORE_BATCH = 500
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS packs (
+    path TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS songs (
+    path TEXT PRIMARY KEY,
+    pack TEXT NOT NULL,
+    simfile TEXT NOT NULL,
+    title TEXT,
+    artist TEXT,
+    credit TEXT,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    min_bpm REAL,
+    max_bpm REAL
+);
+CREATE TABLE IF NOT EXISTS unreadable (
+    path TEXT PRIMARY KEY,
+    pack TEXT NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS charts (
+    song TEXT NOT NULL,
+    stepstype TEXT,
+    difficulty TEXT,
+    meter INTEGER,
+    description TEXT,
+    credit TEXT
+);
+CREATE TABLE IF NOT EXISTS hashed_simfiles (
+    simfile TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chart_hashes (
+    simfile TEXT NOT NULL,
+    stepstype TEXT,
+    difficulty TEXT,
+    description TEXT,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS assets (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL,
+    device INTEGER NOT NULL,
+    inode INTEGER NOT NULL,
+    partial_hash TEXT,
+    hash TEXT
+);
+CREATE INDEX IF NOT EXISTS songs_pack ON songs (pack);
+CREATE INDEX IF NOT EXISTS unreadable_pack ON unreadable (pack);
+CREATE INDEX IF NOT EXISTS songs_simfile ON songs (simfile);
+CREATE INDEX IF NOT EXISTS chart_hashes_simfile ON chart_hashes (simfile);
+CREATE INDEX IF NOT EXISTS chart_hashes_hash ON chart_hashes (hash);
+CREATE INDEX IF NOT EXISTS charts_song ON charts (song);
+CREATE INDEX IF NOT EXISTS charts_meter ON charts (meter);
+CREATE INDEX IF NOT EXISTS assets_size ON assets (device, size);
+"""
+
+
+class ChartEntry(NamedTuple):
+    stepstype: str
+    difficulty: str
+    meter: Optional[int]
+    description: str
+    credit: str
+
+
+class AssetEntry(NamedTuple):
+    path: str
+    size: int
+    mtime: float
+    device: int
+    inode: int
+    partial_hash: Optional[str]  # See `dedupe_library`
+    hash: Optional[str]
+
+
+class SongEntry(NamedTuple):
+    path: Path
+    pack: str
+    title: str
+    artist: str
+    credit: str
+    charts: list[ChartEntry]
+
+
+class PackStats(NamedTuple):
+    name: str
+    songs: int
+    charts: int
+    size: int  # Bytes of the files in the song folders
+    min_bpm: Optional[float]
+    max_bpm: Optional[float]
+    min_meter: Optional[int]
+    max_meter: Optional[int]
+
+
+class LibraryStats(NamedTuple):
+    packs: list[PackStats]
+    # Number of charts of each meter, by steps type
+    meters: dict[str, dict[Optional[int], int]]
+
+    @property
+    def total(self) -> PackStats:
+        """The stats of every pack combined."""
+
+        def extreme(function, values):
+            return function((v for v in values if v is not None), default=None)
+
+        return PackStats(
+            "Total",
+            sum(pack.songs for pack in self.packs),
+            sum(pack.charts for pack in self.packs),
+            sum(pack.size for pack in self.packs),
+            extreme(min, (pack.min_bpm for pack in self.packs)),
+            extreme(max, (pack.max_bpm for pack in self.packs)),
+            extreme(min, (pack.min_meter for pack in self.packs)),
+            extreme(max, (pack.max_meter for pack in self.packs)),
+        )
+
+
+class LibraryIndex:
+    """
+    On-disk SQLite index of the packs, songs and charts in `packs`.
+
+    Packs and songs are keyed on their directory's mtime, so `rescan` only
+    looks inside packs that changed and only parses the songs that were
+    added or changed since the last scan. Song directories without a
+    readable simfile are recorded too, so they aren't read again until they
+    change. Hidden directories (like `.censored`) are not indexed.
+
+    Chart hashes (see `hash_simfile`) are cached per simfile and keyed on its
+    size and mtime, so `hash_charts` only rehashes changed simfiles. The
+    asset files seen by `dedupe_library` and their hashes are cached the same
+    way.
+    """
+
+    def __init__(self, db: Path, packs: Path):
+        self.packs = packs.absolute()
+        db.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(db, check_same_thread=False)
+        self.lock = Lock()
+        with self.lock, self.connection:
+            version = self.connection.execute(
+                "PRAGMA user_version"
+            ).fetchone()[0]
+            if version != SCHEMA_VERSION:
+                # Rebuild the index from scratch when the schema changes
+                for table in (
+                    "packs",
+                    "songs",
+                    "unreadable",
+                    "charts",
+                    "hashed_simfiles",
+                    "chart_hashes",
+                    "assets",
+                ):
+                    self.connection.execute(f"DROP TABLE IF EXISTS {table}")
+                self.connection.execute(
+                    f"PRAGMA user_version = {SCHEMA_VERSION}"
+                )
+            self.connection.executescript(SCHEMA)
+
+    def rescan(self, workers: Optional[int] = None, full: bool = False) -> int:
+        """
+        Brings the index up to date with `packs`, reading the changed songs in
+        a pool of `workers` processes (see `parallel_map`). Returns the number
+        of songs that were (re)parsed.
+
+        Packs whose directory's mtime hasn't changed are skipped, so songs
+        edited in place (without adding, removing or renaming a song folder)
+        are only picked up if `full` is true, which checks every song folder.
+        """
+        with self.lock:
+            known_packs = dict(
+                self.connection.execute("SELECT path, mtime FROM packs")
+            )
+            known: dict[str, float] = {}
+            songs_by_pack: dict[str, list[str]] = {}
+            for path, pack, mtime in self.connection.execute(
+                "SELECT path, pack, mtime FROM songs UNION ALL "
+                "SELECT path, pack, mtime FROM unreadable"
+            ):
+                known[path] = mtime
+                songs_by_pack.setdefault(pack, []).append(path)
+        seen_packs, seen_songs = set(), set()
+        changed_packs, changed = [], []
+        for pack in subdirs(self.packs):
+            seen_packs.add(pack.path)
+            if not full and known_packs.get(pack.path) == pack.stat().st_mtime:
+                seen_songs.update(songs_by_pack.get(pack.path, []))
+                continue
+            changed_packs.append(pack.path)
+            for song in subdirs(Path(pack.path)):
+                seen_songs.add(song.path)
+                if known.get(song.path) != song.stat().st_mtime:
+                    changed.append(Path(song.path))
+        # Songs are written in batches; a transaction per song would spend
+        # most of the scan waiting on commits
+        read = zip(changed, parallel_map(_read_song, changed, workers))
+        while batch := list(islice(read, STORE_BATCH)):
+            self._store_songs(batch)
+        with self.lock, self.connection:
+            for path in set(known) - seen_songs:
+                self._delete(path)
+            for path in set(known_packs) - seen_packs:
+                self._delete(path)
+            for pack in changed_packs:
+                self._upsert_pack(Path(pack))
+        return len(changed)
+
+    def update_pack(self, pack_dir: Path) -> None:
+        """(Re)indexes every song in `pack_dir`."""
+        pack_dir = pack_dir.absolute()
+        with self.lock, self.connection:
+            self._delete(str(pack_dir))
+            self._upsert_pack(pack_dir)
+        self._store_songs(
+            [
+                (Path(song.path), _read_song(Path(song.path)))
+                for song in subdirs(pack_dir)
+            ]
+        )
+
+    def update_song(self, song_dir: Path) -> None:
+        """
+        (Re)indexes the song in `song_dir`. Directories without a simfile are
+        recorded as unreadable, and missing ones removed from the index.
+        """
+        song_dir = song_dir.absolute()
+        self._store_songs([(song_dir, _read_song(song_dir))])
+
+    def _store_songs(
+        self,
+        songs: list[tuple[Path, Optional[tuple[SongMetadata, int, float]]]],
+    ) -> None:
+        """
+        Replaces the rows of each song directory in `songs` with the result of
+        `_read_song` for it, in one transaction.
+        """
+        with self.lock, self.connection:
+            for song_dir, read in songs:
+                self._insert_song(song_dir, read)
+
+    def _insert_song(
+        self,
+        song_dir: Path,
+        read: Optional[tuple[SongMetadata, int, float]],
+    ) -> None:
+        self._delete(str(song_dir))
+        if read is None:
+            try:
+                mtime = song_dir.stat().st_mtime
+            except FileNotFoundError:
+                return
+            self.connection.execute(
+                "INSERT INTO unreadable VALUES (?, ?, ?)",
+                (str(song_dir), str(song_dir.parent), mtime),
+            )
+            return
+        song, size, mtime = read
+        self.connection.execute(
+            "INSERT INTO songs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                str(song_dir),
+                str(song_dir.parent),
+                str(song.path),
+                song.title,
+                song.artist,
+                song.credit,
+                size,
+                mtime,
+                song.min_bpm,
+                song.max_bpm,
+            ),
+        )
+        self.connection.executemany(
+            "INSERT INTO charts VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    str(song_dir),
+                    chart.stepstype,
+                    chart.difficulty,
+                    chart.meter,
+                    chart.description,
+                    chart.credit,
+                )
+                for chart in song.charts
+            ),
+        )
+
+    def remove(self, path: Path) -> None:
+        """Removes the pack or song directory `path` from the index."""
+        with self.lock, self.connection:
+            self._delete(str(path.absolute()))
+
+    def search(
+        self,
+        query: str = "",
+        meter: Optional[tuple[int, int]] = None,
+        stepstype: Optional[str] = None,
+        pack: Optional[str] = None,
+        limit: Optional[int] = None,
+    ) -> list[SongEntry]:
+        """
+        Returns the indexed songs whose title, artist or credit contains
+        `query` (case-insensitive), that have a chart with a meter in
+        the inclusive range `meter` and of type `stepstype`, and whose pack
+        name contains `pack`.
+        """
+        conditions = [
+            "(s.title LIKE :q ESCAPE '\\' OR s.artist LIKE :q ESCAPE '\\' "
+            "OR s.credit LIKE :q ESCAPE '\\')"
+        ]
+        params = {"q": _contains(query)}
+        if pack is not None:
+            conditions.append("p.name LIKE :pack ESCAPE '\\'")
+            params["pack"] = _contains(pack)
+        chart_conditions = []
+        if meter is not None:
+            chart_conditions.append("c.meter BETWEEN :low AND :high")
+            params["low"], params["high"] = meter
+        if stepstype is not None:
+            chart_conditions.append("c.stepstype = :stepstype")
+            params["stepstype"] = stepstype
+        if chart_conditions:
+            conditions.append(
+                "EXISTS (SELECT 1 FROM charts c WHERE c.song = s.path AND "
+                + " AND ".join(chart_conditions)
+                + ")"
+            )
+        sql = (
+            "SELECT s.path, p.name, s.title, s.artist, s.credit "
+            "FROM songs s JOIN packs p ON p.path = s.pack WHERE "
+            + " AND ".join(conditions)
+            + " ORDER BY p.name, s.title"
+        )
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        with self.lock:
+            songs = self.connection.execute(sql, params).fetchall()
+            charts: dict[str, list[ChartEntry]] = {s[0]: [] for s in songs}
+            for row in self.connection.execute(
+                "SELECT song, stepstype, difficulty, meter, description, "
+                "credit FROM charts WHERE song IN (SELECT value FROM "
+                "json_each(?)) ORDER BY song, stepstype, meter",
+                (json.dumps(list(charts)),),
+            ):
+                charts[row[0]].append(ChartEntry(*row[1:]))
+        return [
+            SongEntry(Path(path), *values, charts[path])
+            for path, *values in songs
+        ]
+
+    def stats(self) -> LibraryStats:
+        """
+        Returns the number of songs and charts, the disk use and the BPM and
+        meter ranges of each indexed pack, and the number of charts of each
+        meter by steps type, as of the last `rescan`.
+        """
+        with self.lock:
+            packs = self.connection.execute(
+                "SELECT p.name, COUNT(*), COALESCE(SUM(c.charts), 0), "
+                "SUM(s.size), MIN(s.min_bpm), MAX(s.max_bpm), MIN(c.low), "
+                "MAX(c.high) FROM songs s JOIN packs p ON p.path = s.pack "
+                "LEFT JOIN (SELECT song, COUNT(*) AS charts, MIN(meter) AS "
+                "low, MAX(meter) AS high FROM charts GROUP BY song) c ON "
+                "c.song = s.path GROUP BY s.pack ORDER BY p.name"
+            ).fetchall()
+            meters = self.connection.execute(
+                "SELECT stepstype, meter, COUNT(*) FROM charts GROUP BY "
+                "stepstype, meter ORDER BY stepstype, meter"
+            ).fetchall()
+        counts: dict[str, dict[Optional[int], int]] = {}
+        for stepstype, meter, count in meters:
+            counts.setdefault(stepstype, {})[meter] = count
+        return LibraryStats([PackStats(*row) for row in packs], counts)
+
+    def hash_charts(self, workers: Optional[int] = None) -> int:
+        """
+        Hashes the charts of the indexed songs whose simfile changed since it
+        was last hashed, in a pool of `workers` processes (see
+        `parallel_map`). Returns the number of simfiles that were hashed.
+        """
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM chart_hashes WHERE simfile NOT IN "
+                "(SELECT simfile FROM songs)"
+            )
+            self.connection.execute(
+                "DELETE FROM hashed_simfiles WHERE simfile NOT IN "
+                "(SELECT simfile FROM songs)"
+            )
+            known = {
+                path: (size, mtime)
+                for path, size, mtime in self.connection.execute(
+                    "SELECT simfile, size, mtime FROM hashed_simfiles"
+                )
+            }
+            simfiles = [
+                path
+                for (path,) in self.connection.execute(
+                    "SELECT simfile FROM songs"
+                )
+            ]
+        changed = []
+        for path in simfiles:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if known.get(path) != (stat.st_size, stat.st_mtime):
+                changed.append(Path(path))
+        for path, hashes in hash_simfiles(changed, workers).items():
+            self.store_hashes(path, hashes)
+        return len(changed)
+
+    def store_hashes(
+        self, simfile_path: Path, hashes: list[ChartHash]
+    ) -> None:
+        """
+        Caches the chart `hashes` of the simfile at `simfile_path`, replacing
+        any previous ones.
+        """
+        simfile_path = simfile_path.absolute()
+        stat = simfile_path.stat()
+        with self.lock, self.connection:
+            self.connection.execute(
+                "DELETE FROM chart_hashes WHERE simfile = ?",
+                (str(simfile_path),),
+            )
+            self.connection.execute(
+                "INSERT OR REPLACE INTO hashed_simfiles VALUES (?, ?, ?)",
+                (str(simfile_path), stat.st_size, stat.st_mtime),
+            )
+            self.connection.executemany(
+                "INSERT INTO chart_hashes VALUES (?, ?, ?, ?, ?)",
+                ((str(simfile_path), *chart[1:]) for chart in hashes),
+            )
+
+    def duplicates(self) -> list[list[ChartHash]]:
+        """
+        Returns groups of indexed charts that share a hash across different
+        songs, as of the last `hash_charts`.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT h.simfile, h.stepstype, h.difficulty, h.description, "
+                "h.hash FROM chart_hashes h JOIN songs s ON s.simfile = "
+                "h.simfile WHERE h.hash IN (SELECT hash FROM chart_hashes "
+                "JOIN songs USING (simfile) GROUP BY hash HAVING "
+                "COUNT(DISTINCT simfile) > 1) ORDER BY h.hash, h.simfile"
+            ).fetchall()
+        charts = (ChartHash(Path(path), *values) for path, *values in rows)
+        return [list(group) for _, group in groupby(charts, lambda c: c.hash)]
+
+    def find_duplicates(
+        self, charts: list[ChartHash], exclude: Optional[Path] = None
+    ) -> list[Duplicate]:
+        """
+        Returns the `charts` whose hash matches an indexed chart, along with
+        the matching charts. Charts in the pack or song directory `exclude`
+        (e.g. one that is about to be replaced) are not matched.
+        """
+        exclude = exclude.absolute() if exclude is not None else None
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT h.simfile, h.stepstype, h.difficulty, h.description, "
+                "h.hash FROM chart_hashes h JOIN songs s ON s.simfile = "
+                "h.simfile WHERE h.hash IN (SELECT value FROM json_each(?))",
+                (json.dumps([chart.hash for chart in charts]),),
+            ).fetchall()
+        matches: dict[str, list[ChartHash]] = {}
+        for path, *values in rows:
+            match = ChartHash(Path(path), *values)
+            if exclude is None or not match.simfile.is_relative_to(exclude):
+                matches.setdefault(match.hash, []).append(match)
+        return [
+            Duplicate(chart, matches[chart.hash])
+            for chart in charts
+            if chart.hash in matches
+        ]
+
+    def assets(self) -> dict[str, AssetEntry]:
+        """Returns the recorded asset files, keyed on their path."""
+        with self.lock:
+            rows = self.connection.execute("SELECT * FROM assets").fetchall()
+        return {row[0]: AssetEntry(*row) for row in rows}
+
+    def assets_of_size(
+        self, device: int, sizes: Iterable[int]
+    ) -> list[AssetEntry]:
+        """
+        Returns the recorded asset files on `device` whose size is one of
+        `sizes`.
+        """
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT * FROM assets WHERE device = ? AND size IN "
+                "(SELECT value FROM json_each(?))",
+                (device, json.dumps(list(set(sizes)))),
+            ).fetchall()
+        return [AssetEntry(*row) for row in rows]
+
+    def store_assets(self, assets: Iterable[AssetEntry]) -> None:
+        """Records `assets`, replacing any previous records of their paths."""
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO assets VALUES (?, ?, ?, ?, ?, ?, ?)",
+                assets,
+            )
+
+    def remove_assets(self, paths: Iterable[str]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "DELETE FROM assets WHERE path = ?", ((p,) for p in paths)
+            )
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def _upsert_pack(self, pack_dir: Path) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO packs VALUES (?, ?, ?)",
+            (str(pack_dir), pack_dir.name, pack_dir.stat().st_mtime),
+        )
+
+    def _delete(self, path: str) -> None:
+        """Deletes the rows for the pack or song at `path`."""
+        self.connection.execute(
+            "DELETE FROM charts WHERE song = ? OR song IN "
+            "(SELECT path FROM songs WHERE pack = ?)",
+            (path, path),
+        )
+        self.connection.execute(
+            "DELETE FROM songs WHERE path = ? OR pack = ?", (path, path)
+        )
+        self.connection.execute(
+            "DELETE FROM unreadable WHERE path = ? OR pack = ?", (path, path)
+        )
+        self.connection.execute("DELETE FROM packs WHERE path = ?", (path,))
+
+
+def _contains(text: str) -> str:
+    """
+    Returns a LIKE pattern (with `\\` as its ESCAPE character) matching
+    strings that contain `text`.
+    """
+    for char in "\\%_":
+        text = text.replace(char, "\\" + char)
+    return f"%{text}%"
+
+
+def _read_song(song_dir: Path) -> Optional[tuple[SongMetadata, int, float]]:
+    """
+    Returns the metadata, size and mtime of the song in `song_dir`, or None
+    if it has no readable simfile.
+    """
+    try:
+        song = read_song_metadata(song_dir)
+    except Exception:
+        return None
+    size = sum(
+        entry.stat().st_size
+        for entry in os.scandir(song_dir)
+        if entry.is_file()
+    )
+    return song, size, song_dir.stat().st_mtime
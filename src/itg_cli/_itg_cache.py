@@ -0,0 +1,67 @@
+import os
+from pathlib import Path
+from typing import Iterable
+from itg_cli._metadata import subdirs
+
+
+class SongCache:
+    """
+    The entries of ITGmania's song cache (`cache`/Songs) for the songs in
+    `packs`. ITGmania names each entry after the song's path with slashes
+    replaced by underscores, e.g. Songs_Pack_Song for Songs/Pack/Song.
+    """
+
+    def __init__(self, cache: Path, packs: Path):
+        self.songs = cache / "Songs"
+        self.packs = packs
+
+    def entry_name(self, song_dir: Path) -> str:
+        """Returns the name of the cache entry of `song_dir`."""
+        return "_".join([self.packs.name, song_dir.parent.name, song_dir.name])
+
+    def entries(self) -> dict[str, Path]:
+        """Returns the cache entries of songs in `packs`, by name."""
+        if not self.songs.is_dir():
+            return {}
+        prefix = self.packs.name + "_"
+        return {
+            entry.name: Path(entry.path)
+            for entry in os.scandir(self.songs)
+            if entry.name.startswith(prefix) and entry.is_file()
+        }
+
+    def invalidate(self, song_dirs: Iterable[Path]) -> list[Path]:
+        """
+        Deletes the cache entries of `song_dirs` so ITGmania reloads them.
+        Returns the deleted entries.
+        """
+        names = {self.entry_name(song_dir) for song_dir in song_dirs}
+        if not names:
+            return []
+        entries = self.entries()
+        deleted = [entries[name] for name in names if name in entries]
+        for entry in deleted:
+            entry.unlink(missing_ok=True)
+        return deleted
+
+    def orphans(self) -> list[Path]:
+        """
+        Returns the cache entries whose song folder no longer exists in
+        `packs`, reading each directory once.
+        """
+        existing = {
+            "_".join([self.packs.name, pack.name, song.name])
+            for pack in subdirs(self.packs)
+            for song in subdirs(Path(pack.path))
+        }
+        entries = self.entries()
+        return sorted(
+            path for name, path in entries.items() if name not in existing
+        )
+
+    def gc(self) -> list[Path]:
+        """Deletes the orphaned cache entries and returns them."""
+        orphans = self.orphans()
+        for entry in orphans:
+            entry.unlink(missing_ok=True)
+        return orphans
@@ -0,0 +1,272 @@
+import math
+import mmap
+import os
+from pathlib import Path
+from typing import Callable, Iterator, NamedTuple, Optional, TypeVar
+
+# Encodings tried in order when decoding simfile values (same as simfile)
+ENCODINGS = ("utf-8", "cp1252", "cp932", "cp949")
+SONG_KEYS = {b"TITLE": "title", b"ARTIST": "artist", b"CREDIT": "credit"}
+CHART_KEYS = {
+    b"STEPSTYPE": "stepstype",
+    b"DIFFICULTY": "difficulty",
+    b"METER": "meter",
+    b"DESCRIPTION": "description",
+    b"CREDIT": "credit",
+}
+# Fields of an .sm #NOTES tag that come before the note data
+SM_CHART_FIELDS = ("stepstype", "description", "difficulty", "meter")
+# Fewer items are processed serially; starting processes costs more
+PARALLEL_THRESHOLD = 32
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+class ChartMetadata(NamedTuple):
+    stepstype: str
+    difficulty: str
+    meter: Optional[int]
+    description: str
+    credit: str
+
+
+class SongMetadata(NamedTuple):
+    path: Path  # The .sm/.ssc file
+    title: str
+    artist: str
+    credit: str
+    charts: list[ChartMetadata]
+    # Range of the song's #BPMS (stops and warps aside), if it has any
+    min_bpm: Optional[float] = None
+    max_bpm: Optional[float] = None
+
+
+def read_metadata(simfile_path: Path) -> SongMetadata:
+    """
+    Reads the title, artist, credit and chart headers of the .sm/.ssc file at
+    `simfile_path` without parsing its note data. The file is memory-mapped
+    and note data is skipped over, so only the headers are copied into
+    memory.
+    """
+    with open(simfile_path, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return parse_metadata(b"", simfile_path)
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            return parse_metadata(data, simfile_path)
+
+
+def parse_metadata(
+    data: bytes | mmap.mmap, simfile_path: Path
+) -> SongMetadata:
+    """
+    Extracts the metadata from the contents `data` of the .sm/.ssc file at
+    `simfile_path` (see `read_metadata`).
+    """
+    song = {"title": "", "artist": "", "credit": ""}
+    bpms: list[float] = []
+    charts: list[dict[str, str]] = []
+    is_sm = simfile_path.suffix.lower() == ".sm"
+    for key, start, end in iter_tags(data):
+        if key == b"NOTES" and is_sm:
+            # #NOTES:type:description:difficulty:meter:radar:notes;
+            # Only the fields before the note data are copied
+            header_end = start - 1
+            for _ in range(5):
+                header_end = data.find(b":", header_end + 1, end)
+                if header_end == -1:
+                    header_end = end
+                    break
+            fields = data[start:header_end].split(b":")[:4]
+            charts.append(
+                dict(zip(SM_CHART_FIELDS, map(decode_value, fields)))
+            )
+        elif key == b"NOTEDATA":
+            charts.append({})
+        elif charts and key in CHART_KEYS and not is_sm:
+            charts[-1][CHART_KEYS[key]] = decode_value(data[start:end])
+        elif not charts and key in SONG_KEYS:
+            song[SONG_KEYS[key]] = decode_value(data[start:end])
+        elif not charts and key == b"BPMS":
+            bpms = _parse_bpms(decode_value(data[start:end]))
+    return SongMetadata(
+        simfile_path,
+        **song,
+        charts=[
+            ChartMetadata(
+                chart.get("stepstype", ""),
+                chart.get("difficulty", ""),
+                _int_or_none(chart.get("meter")),
+                chart.get("description", ""),
+                chart.get("credit", ""),
+            )
+            for chart in charts
+        ],
+        min_bpm=min(bpms, default=None),
+        max_bpm=max(bpms, default=None),
+    )
+
+
+def find_simfile(song_dir: Path) -> Optional[Path]:
+    """
+    Returns the simfile in `song_dir`, preferring .ssc over .sm like
+    `simfile.opendir`, or None if there is none.
+    """
+    sm_path = None
+    for entry in os.scandir(song_dir):
+        if entry.name.startswith("._") or not entry.is_file():
+            continue
+        suffix = os.path.splitext(entry.name)[1].lower()
+        if suffix == ".ssc":
+            return Path(entry.path)
+        if suffix == ".sm":
+            sm_path = Path(entry.path)
+    return sm_path
+
+
+def song_dirs(pack_dir: Path) -> list[Path]:
+    """
+    Returns the song directories (subdirectories containing a simfile) of
+    `pack_dir`, sorted by name.
+    """
+    return [
+        Path(entry.path)
+        for entry in sorted(os.scandir(pack_dir), key=lambda e: e.name)
+        if entry.is_dir() and find_simfile(Path(entry.path)) is not None
+    ]
+
+
+def subdirs(path: Path) -> list[os.DirEntry]:
+    """
+    Returns the non-hidden subdirectories of `path` (ITGmania doesn't load
+    hidden folders like `.censored`), or an empty list if `path` isn't a
+    directory.
+    """
+    if not path.is_dir():
+        return []
+    return [
+        entry
+        for entry in os.scandir(path)
+        if entry.is_dir() and not entry.name.startswith(".")
+    ]
+
+
+def read_song_metadata(song_dir: Path) -> SongMetadata:
+    """
+    Reads the metadata of the simfile in `song_dir` (see `read_metadata`).
+    Raises FileNotFoundError if there is no simfile in `song_dir`.
+    """
+    simfile_path = find_simfile(song_dir)
+    if simfile_path is None:
+        raise FileNotFoundError(f"No simfile in {song_dir}")
+    return read_metadata(simfile_path)
+
+
+def read_pack_metadata(
+    pack_dir: Path, workers: Optional[int] = None
+) -> list[SongMetadata]:
+    """
+    Reads the metadata of every song in `pack_dir`, sorted by folder (see
+    `iter_song_metadata` for `workers`).
+    """
+    return list(iter_song_metadata(song_dirs(pack_dir), workers))
+
+
+def iter_song_metadata(
+    dirs: list[Path], workers: Optional[int] = None
+) -> Iterator[SongMetadata]:
+    """
+    Yields the metadata of the songs in `dirs`, in order, as soon as each one
+    is read (see `parallel_map` for `workers`).
+    """
+    return parallel_map(read_song_metadata, dirs, workers)
+
+
+def parallel_map(
+    function: Callable[[T], R], items: list[T], workers: Optional[int] = None
+) -> Iterator[R]:
+    """
+    Yields `function(item)` for each of `items`, in order, as soon as each
+    result is ready. Items are processed in a pool of `workers` processes
+    (defaults to the number of CPUs), unless there are fewer than
+    `PARALLEL_THRESHOLD` items or `workers` is 1, in which case they are
+    processed in this process.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(items) < PARALLEL_THRESHOLD:
+        yield from map(function, items)
+        return
+    from concurrent.futures import ProcessPoolExecutor
+
+    chunksize = max(1, len(items) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(function, items, chunksize=chunksize)
+
+
+def iter_tags(data: bytes | mmap.mmap) -> Iterator[tuple[bytes, int, int]]:
+    """
+    Yields the upper-cased key of each `#KEY:value;` tag in the contents
+    `data` of a simfile or course file, with the start and end positions of
+    its value in `data`. Values aren't copied, so skipping one is free.
+    """
+    pos = data.find(b"#")
+    while pos != -1:
+        colon = data.find(b":", pos)
+        if colon == -1:
+            break
+        end = _value_end(data, colon)
+        yield data[pos + 1 : colon].strip().upper(), colon + 1, end
+        pos = data.find(b"#", end)
+
+
+def decode_value(value: bytes) -> str:
+    """
+    Decodes a tag value with the first of ENCODINGS that fits and strips its
+    `//` comments and surrounding whitespace.
+    """
+    for encoding in ENCODINGS:
+        try:
+            text = value.decode(encoding)
+            break
+        except UnicodeDecodeError:
+            continue
+    else:
+        text = value.decode("utf-8", "replace")
+    # Strip // comments
+    lines = (line.partition("//")[0] for line in text.splitlines())
+    return "\n".join(lines).strip()
+
+
+def _value_end(data: bytes | mmap.mmap, colon: int) -> int:
+    """
+    Returns the position of the `;` ending the value that starts after
+    `colon`, or of the next tag if the `;` is missing.
+    """
+    end = data.find(b";", colon)
+    if end == -1:
+        end = len(data)
+    next_tag = data.find(b"\n#", colon, end)
+    return end if next_tag == -1 else next_tag
+
+
+def _parse_bpms(value: str) -> list[float]:
+    """
+    Returns the BPMs of a #BPMS value like `0.000=150.000,64.000=300.000`.
+    Negative BPMs (used for warps in .sm files) and malformed entries are
+    skipped.
+    """
+    bpms = []
+    for change in value.split(","):
+        try:
+            bpm = float(change.partition("=")[2])
+        except ValueError:
+            continue
+        if 0 < bpm < math.inf:
+            bpms.append(bpm)
+    return bpms
+
+
+def _int_or_none(value: Optional[str]) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,65 @@
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, NamedTuple, Optional, TypeAlias
+
+
+class StageTiming(NamedTuple):
+    stage: str  # e.g. "download", "extract", "move"
+    subject: str  # The path, url, pack or song the stage worked on
+    started_at: float
+    seconds: float
+    bytes: Optional[int]  # Bytes processed, if known
+    ok: bool  # False if the stage raised an exception
+
+    @property
+    def bytes_per_second(self) -> Optional[float]:
+        if self.bytes is None or self.seconds <= 0:
+            return None
+        return self.bytes / self.seconds
+
+
+# Called with the timing of each stage once it finishes
+StageCallback: TypeAlias = Callable[[StageTiming], None]
+
+
+class Stage:
+    """Holds the bytes a stage processed, which may be set while it runs."""
+
+    def __init__(self, bytes: Optional[int] = None):
+        self.bytes = bytes
+
+
+@contextmanager
+def timed(
+    on_stage: Optional[StageCallback],
+    stage: str,
+    subject: object,
+    bytes: Optional[int] = None,
+) -> Iterator[Stage]:
+    """
+    Times the body of the `with` statement as `stage` of `subject` and calls
+    `on_stage` with its StageTiming, even if the body raises. The bytes the
+    stage processed can be set on the yielded Stage. Does nothing if
+    `on_stage` is None.
+    """
+    record = Stage(bytes)
+    if on_stage is None:
+        yield record
+        return
+    started_at = time.time()
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield record
+        ok = True
+    finally:
+        on_stage(
+            StageTiming(
+                stage,
+                str(subject),
+                started_at,
+                time.perf_counter() - start,
+                record.bytes,
+                ok,
+            )
+        )
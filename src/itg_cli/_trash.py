@@ -0,0 +1,167 @@
+import ctypes
+import ctypes.util
+import os
+import shutil
+import sys
+import time
+from pathlib import Path
+from tempfile import mkdtemp
+from threading import Lock, Thread
+from typing import Optional
+
+# Replaced packs and songs are moved here (inside `packs`, so on the same
+# filesystem) and deleted in the background, or later by `itg-cli gc`
+TRASH_NAME = ".itg-cli-trash"
+# Flag for renameat2(2) to swap two paths atomically (Linux only)
+RENAME_EXCHANGE = 2
+AT_FDCWD = -100
+# Prefix of the hidden folders new packs/songs are staged and extracted in,
+# so they are ignored while in `packs` and `empty_trash` can find leftovers
+STAGING_PREFIX = ".itg-cli-new-"
+# Staging folders untouched for this many seconds were left by a killed add
+STALE_STAGING = 24 * 60 * 60
+# Held while the trash is created and moved into, or removed once empty, so
+# a purge can't remove it between the two
+_trash_lock = Lock()
+
+
+def trash_dir(packs: Path) -> Path:
+    return packs / TRASH_NAME
+
+
+def replace_dir(new: Path, dest: Path, packs: Path) -> Path:
+    """
+    Replaces the directory `dest` with `new` and moves the old `dest` into
+    the trash in `packs`, returning its path there.
+
+    `new` is first moved into `packs` (a rename if it is already on the same
+    filesystem), then swapped in with renames, so `dest` is only missing for
+    the instant between them, or not at all where the two can be exchanged
+    atomically. If the swap fails, the old `dest` is left in place.
+    """
+    trash = trash_dir(packs)
+    staging = Path(mkdtemp(prefix=STAGING_PREFIX, dir=packs))
+    try:
+        staged = staging / dest.name
+        shutil.move(new, staged)
+        if _exchange(staged, dest):
+            old = staged
+        else:
+            old = staging / f"{dest.name}.old"
+            os.rename(dest, old)
+            try:
+                os.rename(staged, dest)
+            except OSError:
+                os.rename(old, dest)
+                raise
+        trashed = trash / f"{dest.name}.{time.time_ns()}"
+        with _trash_lock:
+            trash.mkdir(parents=True, exist_ok=True)
+            os.rename(old, trashed)
+    finally:
+        # Never delete the old copy if it couldn't be put back
+        if dest.exists():
+            shutil.rmtree(staging, ignore_errors=True)
+    return trashed
+
+
+def purge(paths: list[Path], background: bool = True) -> Optional[Thread]:
+    """
+    Deletes the trashed `paths`. If `background` is true, they are deleted by
+    a new thread, which is returned. The thread is not a daemon, so the
+    interpreter waits for it to finish before exiting; if the process is
+    killed first, `empty_trash` deletes the rest later.
+    """
+
+    def delete() -> None:
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+            with _trash_lock:
+                try:
+                    path.parent.rmdir()
+                except OSError:  # Other packs/songs are still being deleted
+                    pass
+
+    if not background:
+        delete()
+        return None
+    thread = Thread(target=delete, name="itg-cli-purge")
+    thread.start()
+    return thread
+
+
+def empty_trash(packs: Path, dry_run: bool = False) -> tuple[int, int]:
+    """
+    Deletes everything in the trash in `packs`, and staging folders left in
+    `packs` by adds that were killed (ones untouched for a day, so adds in
+    progress are left alone). Returns the number of trashed packs/songs and
+    leftovers deleted and the bytes freed (or that would be, if `dry_run` is
+    true, in which case nothing is deleted).
+    """
+    trash = trash_dir(packs)
+    entries = list(os.scandir(trash)) if trash.is_dir() else []
+    if packs.is_dir():
+        cutoff = time.time() - STALE_STAGING
+        entries += [
+            entry
+            for entry in os.scandir(packs)
+            if entry.name.startswith(STAGING_PREFIX)
+            and entry.stat(follow_symlinks=False).st_mtime < cutoff
+        ]
+    count, freed = 0, 0
+    for entry in entries:
+        try:
+            freed += _tree_size(entry.path)
+            if not dry_run and entry.is_dir(follow_symlinks=False):
+                shutil.rmtree(entry.path, ignore_errors=True)
+            elif not dry_run:
+                os.unlink(entry.path)
+        except FileNotFoundError:  # Deleted by a background purge
+            continue
+        count += 1
+    if dry_run or not trash.is_dir():
+        return count, freed
+    with _trash_lock:
+        try:
+            trash.rmdir()
+        except OSError:  # Something was trashed in the meantime
+            pass
+    return count, freed
+
+
+def _tree_size(path: str) -> int:
+    if not os.path.isdir(path) or os.path.islink(path):
+        return os.lstat(path).st_size
+    size = 0
+    stack = [path]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError:  # Deleted by a background purge
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        size += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    return size
+
+
+def _exchange(a: Path, b: Path) -> bool:
+    """
+    Atomically swaps the paths `a` and `b` with renameat2(2). Returns false
+    if that isn't supported here.
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        renameat2 = libc.renameat2
+    except (OSError, AttributeError):  # glibc < 2.28 or musl
+        return False
+    result = renameat2(AT_FDCWD, bytes(a), AT_FDCWD, bytes(b), RENAME_EXCHANGE)
+    return result == 0
@@ -1,60 +1,310 @@
+from __future__ import annotations
+
 import sys
-import gdown
+import csv
+import ctypes
+import errno
+import functools
+import hashlib
 import os
-import pyrfc6266
-import requests
+import re
 import shutil
-from itertools import chain
-from pathlib import Path
-from tqdm import tqdm
-from typing import Iterable, Optional
+import tarfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path, PurePath, PurePosixPath
+from typing import (
+    TYPE_CHECKING,
+    Callable,
+    Iterable,
+    Iterator,
+    Literal,
+    NamedTuple,
+    Optional,
+    TypeAlias,
+)
+from threading import Event, Lock
 from urllib.parse import urlparse, parse_qs
+from itg_cli._timings import StageCallback, timed
+
+# gdown, pyrfc6266, requests and tqdm are imported where they are used so
+# commands that don't download anything start quickly
+if TYPE_CHECKING:
+    import requests
+    from itg_cli._download_cache import DownloadCache
+
+# Size of the chunks read from download streams and hashed files
+CHUNK_SIZE = 1024 * 1024
+# Number of times a dropped download is retried before giving up
+DOWNLOAD_RETRIES = 5
+# (connect, read) timeouts for download requests, in seconds
+TIMEOUT = (15, 60)
+# Number of parallel connections a download is split across when the server
+# supports range requests, and the smallest segment worth a connection
+DOWNLOAD_SEGMENTS = 4
+SEGMENT_MIN_SIZE = 8 * 1024 * 1024
+# Bounds of the size of reads from download streams, which grow while the
+# connection keeps up and shrink when it doesn't
+MIN_READ_SIZE = 64 * 1024
+MAX_READ_SIZE = 8 * 1024 * 1024
+
+
+# ioctl request number for cloning a file on Linux (see ioctl_ficlone(2))
+FICLONE = 0x40049409
+LinkMode: TypeAlias = Literal["copy", "hardlink", "reflink"]
+# Takes the files in an archive and a function that reads one of them and
+# returns the files to extract
+MemberSelector: TypeAlias = Callable[
+    [list[PurePosixPath], Callable[[PurePosixPath], bytes]],
+    Iterable[PurePosixPath],
+]
+
+
+class ChecksumException(Exception):
+    """Raised when a downloaded file does not match its expected SHA-256."""
 
 
-def simfile_paths(path: Path) -> Iterable[Path]:
+class TreeManifest(NamedTuple):
+    simfiles: list[Path]  # Sorted; see `is_simfile`
+    course_dirs: set[Path]  # Folders containing .crs files
+    junk: list[Path]  # `._` files and __MACOSX folders
+    files: int
+    total_bytes: int
+
+
+def scan_tree(path: Path) -> TreeManifest:
     """
-    Returns an iterator of valid paths to .sm or .ssc files that start with
-    `path`. Paths that contain __MACOSX folders or whose simfiles begin with
-    `.` are filtered.
+    Walks `path` once with `os.scandir` and returns what add-pack and add-song
+    need to know about it. __MACOSX folders are listed as junk without being
+    descended into, symlinks are not followed and entries that can't be
+    read (like broken symlinks) are skipped. Returns an empty manifest if
+    `path` doesn't exist.
     """
+    simfiles: list[Path] = []
+    course_dirs: set[Path] = set()
+    junk: list[Path] = []
+    files = total_bytes = 0
+    stack = [path]
+    while stack:
+        folder = stack.pop()
+        try:
+            entries = list(os.scandir(folder))
+        except OSError:
+            continue
+        for entry in entries:
+            name = entry.name
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if name == "__MACOSX":
+                        junk.append(Path(entry.path))
+                    else:
+                        stack.append(Path(entry.path))
+                    continue
+                size = entry.stat(follow_symlinks=False).st_size
+            except OSError:
+                continue
+            files += 1
+            total_bytes += size
+            if name.startswith("._"):
+                junk.append(Path(entry.path))
+                continue
+            suffix = os.path.splitext(name)[1].lower()
+            if suffix in (".sm", ".ssc") and not name.startswith("."):
+                simfiles.append(Path(entry.path))
+            elif suffix == ".crs":
+                course_dirs.add(folder)
+    return TreeManifest(
+        sorted(simfiles), course_dirs, junk, files, total_bytes
+    )
 
-    def path_filter(p: Path):
-        return not ("__MACOSX" in p.parts or p.name.startswith("."))
 
-    sms = path.rglob("*.sm")
-    sscs = path.rglob("*.ssc")
-    return filter(path_filter, chain(sms, sscs))
+def simfile_paths(path: Path) -> list[Path]:
+    """
+    Returns the valid paths to .sm or .ssc files in `path` (see
+    `is_simfile`), from a single walk of it.
+    """
+    return scan_tree(path).simfiles
 
 
-def delete_macos_files(path: Path) -> None:
-    """Deletes all `._` files in the supplied path"""
-    for p in path.rglob("._*"):
-        Path.unlink(p)
+def delete_macos_files(
+    path: Path, manifest: Optional[TreeManifest] = None
+) -> None:
+    """
+    Deletes all `._` files and __MACOSX folders in the supplied path. If the
+    `manifest` of `path` or a folder containing it is supplied, its junk is
+    deleted without walking `path` again.
+    """
+    if manifest is None:
+        manifest = scan_tree(path)
+    for p in manifest.junk:
+        if not p.is_relative_to(path):
+            continue
+        if p.is_dir():
+            shutil.rmtree(p)
+        else:
+            p.unlink(missing_ok=True)
+
 
+# Archive suffixes mapped to the format used to extract them
+ARCHIVE_FORMATS = {
+    ".zip": "zip",
+    ".tar": "tar",
+    ".tar.gz": "tar",
+    ".tgz": "tar",
+    ".tar.bz2": "tar",
+    ".tbz2": "tar",
+    ".tar.xz": "tar",
+    ".txz": "tar",
+}
+ARCHIVE_CONTENT_TYPES = [
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+]
 
-def extract(archive_path: Path) -> Path:
+
+def archive_suffix(name: str) -> Optional[str]:
+    """
+    Returns the archive suffix (e.g. `.zip`, `.tar.gz`) of the filename
+    `name`, or None if it is not a supported archive.
     """
-    Extracts an archive to a containing folder in the same directory.
-    Returns the path to the containing folder.
+    matches = [s for s in ARCHIVE_FORMATS if name.lower().endswith(s)]
+    return max(matches, key=len) if matches else None
+
+
+def is_macos_junk(path: PurePath) -> bool:
+    """Returns whether `path` is in a __MACOSX folder or is a `._` file."""
+    return "__MACOSX" in path.parts or path.name.startswith("._")
+
+
+def is_simfile(path: PurePath) -> bool:
+    """
+    Returns whether `path` would be returned by `simfile_paths`: a .sm or .ssc
+    file outside of __MACOSX folders whose name does not begin with `.`
+    """
+    return (
+        path.suffix.lower() in (".sm", ".ssc")
+        and "__MACOSX" not in path.parts
+        and not path.name.startswith(".")
+    )
+
+
+def archive_members(archive_path: Path) -> list[PurePosixPath]:
+    """
+    Returns the paths of the files in an archive, read from the zip central
+    directory or the tar headers without extracting anything.
+    """
+    suffix = archive_suffix(archive_path.name)
+    if suffix is None:
+        raise ValueError(
+            f"Invalid or unsupported archive format: {archive_path.suffix}"
+        )
+    if ARCHIVE_FORMATS[suffix] == "zip":
+        with zipfile.ZipFile(archive_path) as zf:
+            return [
+                PurePosixPath(info.filename)
+                for info in zf.infolist()
+                if not info.is_dir()
+            ]
+    with tarfile.open(archive_path) as tar:
+        return [PurePosixPath(m.name) for m in tar.getmembers() if m.isfile()]
+
+
+def extract(
+    archive_path: Path,
+    dest_dir: Optional[Path] = None,
+    select: Optional[MemberSelector] = None,
+) -> Path:
+    """
+    Extracts an archive to a containing folder in `dest_dir` (defaults to the
+    archive's directory). Returns the path to the containing folder.
+
+    If `select` is supplied, it is called with the list of files in the
+    archive (see `archive_members`) and a function that reads a file's
+    contents, and only the files it returns are extracted.
 
     Uses shutil.unpack_archive, and thus only supports the following
     formats:
     `zip, tar, gztar, bztar, xztar`
     """
-    valid_suffixes = [".zip", ".tar", ".xz", ".bz", ".xz"]
-    if archive_path.suffix not in valid_suffixes:
+    suffix = archive_suffix(archive_path.name)
+    if suffix is None:
         raise ValueError(
-            "Invalid or unsupported archive format: {archive_path.suffix}"
+            f"Invalid or unsupported archive format: {archive_path.suffix}"
         )
-    dest = archive_path.with_suffix("")
+    name = archive_path.name[: -len(suffix)]
+    dest = (dest_dir or archive_path.parent).joinpath(name)
     dest.mkdir()
     print("Extracting archive...", file=sys.stderr)
-    shutil.unpack_archive(archive_path, dest)
+    if ARCHIVE_FORMATS[suffix] == "zip":
+        # Extracted member by member (even without `select`) to keep mtimes
+        with zipfile.ZipFile(archive_path) as zf:
+            _extract_zip_members(zf, dest, select or _select_all)
+    elif select is None:
+        shutil.unpack_archive(archive_path, dest)
+    else:
+        with tarfile.open(archive_path) as tar:
+            members = {m.name: m for m in tar.getmembers() if m.isfile()}
+            selected = _selected_names(
+                select,
+                list(members),
+                lambda name: tar.extractfile(members[name]).read(),
+            )
+            members = [m for name, m in members.items() if name in selected]
+            if hasattr(tarfile, "data_filter"):
+                tar.extractall(dest, members, filter="data")
+            else:
+                tar.extractall(dest, members)
     return dest
 
 
+def _extract_zip_members(
+    zf: zipfile.ZipFile, dest: Path, select: MemberSelector
+) -> None:
+    """Extracts the files of `zf` chosen by `select` to `dest`."""
+    infos = [info for info in zf.infolist() if not info.is_dir()]
+    selected = _selected_names(select, [i.filename for i in infos], zf.read)
+    for info in infos:
+        if info.filename in selected:
+            path = zf.extract(info, dest)
+            # Keep the archived modification time, like tar does, so updates
+            # from the same archive can skip unchanged files (see sync_tree)
+            mtime = time.mktime(info.date_time + (0, 0, -1))
+            os.utime(path, (mtime, mtime))
+
+
+def _select_all(
+    members: list[PurePosixPath], _read: Callable[[PurePosixPath], bytes]
+) -> list[PurePosixPath]:
+    return members
+
+
+def _selected_names(
+    select: MemberSelector, names: list[str], read: Callable[[str], bytes]
+) -> set[str]:
+    """
+    Calls `select` on `names` and returns the selected names as strings.
+    `read` returns the contents of the file with the supplied name.
+    """
+    paths = {PurePosixPath(name): name for name in names}
+    return {paths[p] for p in select(list(paths), lambda p: read(paths[p]))}
+
+
 def setup_working_dir(
-    path_or_url: str, temp: Path, downloads: Optional[Path]
+    path_or_url: str,
+    temp: Path,
+    downloads: Optional[Path],
+    stream: bool = False,
+    sha256: Optional[str] = None,
+    link: LinkMode = "copy",
+    select: Optional[MemberSelector] = None,
+    cache: Optional[DownloadCache] = None,
+    on_stage: Optional[StageCallback] = None,
 ) -> Path:
     """
     Takes the supplied parameter for an add command and does any necessary
@@ -62,71 +312,685 @@ def setup_working_dir(
     or extracted; copies if supplied as a path to a local directory instead.
     If downloads is None, saves the downloaded file to the temp dir so it is
     deleted when the program exits.
+
+    If `stream` is true, downloaded archives are extracted while they are
+    being downloaded (see `stream_download`). If `sha256` is supplied,
+    downloads are checked against it. `link` controls how local directories
+    are copied (see `copy_tree`) and `select` which files of an archive are
+    extracted (see `extract` and `stream_download`). URLs found in `cache`
+    are not downloaded again. `on_stage` is called with the timing of each
+    download, extraction or copy.
+    """
+    if stream and path_or_url.startswith("http"):
+        working_path = stream_download(
+            path_or_url,
+            temp,
+            downloads,
+            sha256,
+            cache,
+            on_stage=on_stage,
+            select=select,
+        )
+        if working_path is not None:
+            return working_path
+    path, downloaded = fetch_source(
+        path_or_url, temp, downloads, sha256, cache, on_stage
+    )
+    return prepare_working_dir(path, temp, downloaded, link, select, on_stage)
+
+
+def fetch_source(
+    path_or_url: str,
+    temp: Path,
+    downloads: Optional[Path],
+    sha256: Optional[str] = None,
+    cache: Optional[DownloadCache] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> tuple[Path, bool]:
+    """
+    Downloads `path_or_url` to `downloads` (or `temp` if downloads is None) if
+    it is a URL. Returns the path to the local file or directory and whether
+    or not it was downloaded. URLs found in `cache` are not downloaded again,
+    and new downloads are added to it. `on_stage` is called with the timing
+    of the download.
     """
-    downloaded, extracted = False, False
-    # Download if URL
     if path_or_url.startswith("http"):
-        if downloads is None:
-            path = download_file(path_or_url, temp)
-        else:
-            path = download_file(path_or_url, downloads)
-        downloaded = True
-    else:
-        path = Path(path_or_url).absolute()
+        if cache is not None and (cached := cache.get(path_or_url)):
+            return cached, False
+        with timed(on_stage, "download", path_or_url) as stage:
+            path = download_file(path_or_url, downloads or temp, sha256)
+            stage.bytes = path.stat().st_size
+        if cache is not None and downloads is not None:
+            cache.put(path_or_url, path)
+        return path, True
+    path = Path(path_or_url).absolute()
     if not path.exists():
         raise FileNotFoundError("File does not exist:", str(path))
-    if not path.is_dir():
-        path = extract(path)
-        extracted = True
-    working_path = temp.joinpath(path.name)
-    if downloaded or extracted:
-        shutil.move(path, working_path)
-    else:
-        shutil.copytree(path, working_path)
+    return path, False
+
+
+def prepare_working_dir(
+    path: Path,
+    temp: Path,
+    downloaded: bool,
+    link: LinkMode = "copy",
+    select: Optional[MemberSelector] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> Path:
+    """
+    Extracts `path` into `temp` if it is an archive, deleting the archive
+    afterwards if it was downloaded to `temp`. `select` chooses which files are
+    extracted (see `extract`). Local directories are copied with `copy_tree`
+    so the supplied files are left untouched. Returns the path to the working
+    directory. `on_stage` is called with the timing of the extraction or copy.
+    """
+    if path.is_dir():
+        working_path = temp.joinpath(path.name)
+        with timed(on_stage, "copy", path):
+            copy_tree(path, working_path, link)
+        return working_path
+    with timed(on_stage, "extract", path, path.stat().st_size):
+        working_path = extract(path, temp, select)
+    if downloaded and path.parent == temp:
+        path.unlink()
     return working_path
 
 
-def download_file(url: str, downloads: Path) -> Path:
+def same_filesystem(a: Path, b: Path) -> bool:
+    """
+    Returns whether `a` and `b` (or their closest existing parents) are on
+    the same filesystem, so files can be renamed or hardlinked between them.
+    """
+
+    def device(path: Path) -> int:
+        path = path.absolute()
+        while not path.exists() and path != path.parent:
+            path = path.parent
+        return path.stat().st_dev
+
+    return device(a) == device(b)
+
+
+def copy_tree(src: Path, dest: Path, link: LinkMode = "copy") -> None:
+    """
+    Copies the directory `src` to `dest`.
+
+    `link` may be one of:
+      - `copy`: copy every file
+      - `hardlink`: hardlink files into `dest`, except simfiles
+      - `reflink`: clone files using copy-on-write (btrfs, xfs, APFS, ...)
+
+    Files that can not be linked or cloned (e.g. because `src` and `dest` are
+    on different filesystems) are copied instead. Simfiles are edited by
+    hand, so they are always copied or cloned rather than shared with `src`.
+    """
+    copy_functions = {
+        "copy": shutil.copy2,
+        "hardlink": _hardlink_or_copy,
+        "reflink": _reflink_or_copy,
+    }
+    if link not in copy_functions:
+        raise ValueError(f"Invalid link mode: {link}")
+    shutil.copytree(src, dest, copy_function=copy_functions[link])
+
+
+def _hardlink_or_copy(src: str, dst: str) -> None:
+    if os.path.splitext(src)[1].lower() in (".sm", ".ssc"):
+        shutil.copy2(src, dst)
+        return
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _reflink_or_copy(src: str, dst: str) -> None:
+    try:
+        if sys.platform == "darwin":
+            libc = ctypes.CDLL(None, use_errno=True)
+            if libc.clonefile(os.fsencode(src), os.fsencode(dst), 0) != 0:
+                raise OSError(ctypes.get_errno(), "clonefile failed")
+        else:
+            import fcntl  # Unavailable on Windows
+
+            with open(src, "rb") as s, open(dst, "wb") as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+        shutil.copystat(src, dst)
+    except (OSError, AttributeError, ImportError):
+        shutil.copy2(src, dst)
+
+
+class SyncResult(NamedTuple):
+    added: int
+    modified: int
+    deleted: int
+    unchanged: int
+    bytes_written: int  # Size of the added and modified files
+    bytes_saved: int  # Size of the unchanged files, which weren't rewritten
+    changed: list[PurePosixPath]  # Added, modified and deleted files
+
+
+def sync_tree(src: Path, dest: Path) -> SyncResult:
+    """
+    Updates the directory `dest` to match `src`: files of `src` that are
+    missing from `dest` or differ from the file there are moved into `dest`,
+    and files and folders of `dest` that aren't in `src` are deleted. `src`
+    is left incomplete.
+
+    Files are compared by size, then by modification time, and only read
+    (both at once, stopping at the first difference) if their sizes match but
+    their modification times don't. The modification time of files found to
+    be identical is updated so the next comparison doesn't read them again,
+    unless they are hardlinked elsewhere (e.g. to the files they were added
+    from), whose timestamps are left alone.
+    Each file is replaced atomically, but the tree as a whole is not.
+    """
+    src_files, src_dirs = _list_tree(src)
+    dest_files, dest_dirs = _list_tree(dest)
+    changed = []
+    deleted = 0
+    # Delete first so folders can replace files of the same name
+    for name in dest_files.keys() - src_files.keys():
+        os.unlink(dest / name)
+        changed.append(PurePosixPath(name))
+        deleted += 1
+    for name in sorted(dest_dirs - src_dirs, reverse=True):
+        shutil.rmtree(dest / name, ignore_errors=True)
+    for name in sorted(src_dirs - dest_dirs):
+        dest.joinpath(name).mkdir(parents=True, exist_ok=True)
+    added = modified = unchanged = written = saved = 0
+    for name, stat in src_files.items():
+        old = dest_files.get(name)
+        src_file, dest_file = src / name, dest / name
+        if old is not None:
+            if old.st_size == stat.st_size and (
+                old.st_mtime_ns == stat.st_mtime_ns
+                or _same_contents(src_file, dest_file)
+            ):
+                if old.st_mtime_ns != stat.st_mtime_ns and old.st_nlink == 1:
+                    os.utime(
+                        dest_file, ns=(stat.st_atime_ns, stat.st_mtime_ns)
+                    )
+                unchanged += 1
+                saved += stat.st_size
+                continue
+            modified += 1
+        else:
+            added += 1
+        _replace_file(src_file, dest_file)
+        changed.append(PurePosixPath(name))
+        written += stat.st_size
+    return SyncResult(
+        added, modified, deleted, unchanged, written, saved, changed
+    )
+
+
+def _list_tree(root: Path) -> tuple[dict[str, os.stat_result], set[str]]:
+    """
+    Returns the files under `root` (mapped to their stats) and the folders,
+    as POSIX paths relative to `root`. Symlinks are listed as files.
+    """
+    files, dirs = {}, set()
+    stack = [("", str(root))]
+    while stack:
+        prefix, path = stack.pop()
+        with os.scandir(path) as entries:
+            for entry in entries:
+                name = prefix + entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    dirs.add(name)
+                    stack.append((name + "/", entry.path))
+                else:
+                    files[name] = entry.stat(follow_symlinks=False)
+    return files, dirs
+
+
+def _same_contents(a: Path, b: Path) -> bool:
+    with open(a, "rb") as file_a, open(b, "rb") as file_b:
+        while True:
+            chunk = file_a.read(CHUNK_SIZE)
+            if chunk != file_b.read(CHUNK_SIZE):
+                return False
+            if not chunk:
+                return True
+
+
+def _replace_file(src: Path, dest: Path) -> None:
+    """Atomically replaces `dest` with `src`, moving it if possible."""
+    try:
+        os.replace(src, dest)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Different filesystems: copy next to `dest`, then rename
+        temp = dest.with_name(f".{dest.name}.itg-cli-tmp")
+        shutil.copy2(src, temp, follow_symlinks=False)
+        os.replace(temp, dest)
+
+
+def read_manifest(manifest: Path) -> dict[str, Optional[str]]:
+    """
+    Reads a manifest file listing one path/url per line, optionally followed
+    by a space and the hex SHA-256 of the file. Blank lines and lines starting
+    with `#` are ignored. Returns a dict mapping each path/url to its SHA-256
+    (or None).
+    """
+    entries = {}
+    for line in manifest.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        path_or_url, _, sha256 = line.rpartition(" ")
+        if path_or_url and re.fullmatch(r"[0-9a-fA-F]{64}", sha256):
+            entries[path_or_url.strip()] = sha256
+        else:
+            entries[line] = None
+    return entries
+
+
+def read_song_list(path: Path) -> dict[str, Optional[str]]:
+    """
+    Reads a list of songs to add. CSV and TSV files (e.g. spreadsheets
+    exported as .csv/.tsv) are read row by row: the first cell of each row
+    that is a URL is used, along with a cell holding a hex SHA-256 if there
+    is one, and rows without a URL (headers, section titles) are skipped.
+    Other files are read with `read_manifest`. Returns a dict mapping each
+    path/url to its SHA-256 (or None).
+    """
+    delimiter = {".csv": ",", ".tsv": "\t", ".tab": "\t"}.get(
+        path.suffix.lower()
+    )
+    if delimiter is None:
+        return read_manifest(path)
+    entries = {}
+    with open(path, newline="", encoding="utf-8-sig") as file:
+        for row in csv.reader(file, delimiter=delimiter):
+            cells = [cell.strip() for cell in row]
+            url = next(
+                (c for c in cells if re.match(r"https?://", c, re.I)), None
+            )
+            if url is None:
+                continue
+            sha256 = next(
+                (c for c in cells if re.fullmatch(r"[0-9a-fA-F]{64}", c)),
+                None,
+            )
+            entries[url] = sha256
+    return entries
+
+
+def download_file(
+    url: str,
+    downloads: Path,
+    sha256: Optional[str] = None,
+    retries: int = DOWNLOAD_RETRIES,
+    segments: int = DOWNLOAD_SEGMENTS,
+) -> Path:
     """
     Downloads a file from a URL to the downloads folder and returns a path to
     the downloaded file. Processes Google drive links using gdown and attempts
     to download other files using requests. Prints a progress bar to stderr.
+
+    Interrupted downloads are resumed from their .part file, both on retries
+    and across calls. If `sha256` is supplied, the downloaded file is checked
+    against it and a ChecksumException is raised if it does not match. Large
+    files are downloaded over up to `segments` connections at once (see
+    `download_with_progress`).
     """
+    import gdown
+
     # TODO: handle mega.nz links
+    url = resolve_redirect(url)
     parsed_url = urlparse(url)
-    if "google.com" in parsed_url.netloc and "/url" in parsed_url.path:
-        # follow redirects from google sheets links
-        parsed_query = parse_qs(parsed_url.query)
-        url = parsed_query["q"][0]
-        parsed_url = urlparse(url)
-        print(f"Redirecting to {url}...", file=sys.stderr)
-    if "drive.google.com" in parsed_url.netloc or "drive.usercontent.google.com" in parsed_url.netloc:
+    if is_google_drive(url):
         print("Making request to Google Drive...", file=sys.stderr)
         download_path = gdown.download(
             url,
             quiet=False,
             fuzzy=True,
+            resume=True,
             output=os.path.join(downloads, ""),  # Append trailing `/`
         )
+        if sha256 is not None:
+            digest = hashlib.sha256()
+            with open(download_path, "rb") as file:
+                while chunk := file.read(CHUNK_SIZE):
+                    digest.update(chunk)
+            verify_checksum(digest, sha256, Path(download_path))
         return Path(download_path)
     else:  # try using requests
         print(f"Making request to {url}...", file=sys.stderr)
-        response = requests.get(url, allow_redirects=True, stream=True)
+        response = _session().get(
+            url, allow_redirects=True, stream=True, timeout=TIMEOUT
+        )
         parsed_redirected_url = urlparse(response.url)
         if parsed_redirected_url.netloc != parsed_url.netloc:
             # potential case where redirected url is a gdrive link
-            return download_file(response.url, downloads)
+            response.close()
+            return download_file(
+                response.url, downloads, sha256, retries, segments
+            )
         validate_response(response)
         filename = get_download_filename(response)
         dest = downloads.joinpath(filename)
         # Delete dest if it exists
         dest.unlink(missing_ok=True)
-        download_with_progress(response, dest)
+        download_with_progress(response, dest, sha256, retries, segments)
         return dest
 
 
+def resolve_redirect(url: str, verbose: bool = True) -> str:
+    """Returns the target of a Google Sheets redirect link, or `url`."""
+    parsed_url = urlparse(url)
+    if "google.com" in parsed_url.netloc and "/url" in parsed_url.path:
+        # follow redirects from google sheets links
+        parsed_query = parse_qs(parsed_url.query)
+        url = parsed_query["q"][0]
+        if verbose:
+            print(f"Redirecting to {url}...", file=sys.stderr)
+    return url
+
+
+def remote_validators(
+    url: str,
+) -> Optional[tuple[Optional[str], Optional[int]]]:
+    """
+    Returns the ETag and Content-Length (either may be None) the server
+    currently reports for `url`, from a HEAD request, or from the headers of
+    a GET if HEAD isn't allowed. Returns None if the request fails.
+    """
+    import requests
+
+    url = resolve_redirect(url, verbose=False)
+    try:
+        r = _session().head(url, allow_redirects=True, timeout=TIMEOUT)
+        if r.status_code in (405, 501):
+            r = _session().get(
+                url, allow_redirects=True, stream=True, timeout=TIMEOUT
+            )
+            r.close()
+    except requests.RequestException:
+        return None
+    if r.status_code != 200:
+        return None
+    return response_validators(r)
+
+
+def response_validators(
+    r: requests.Response,
+) -> tuple[Optional[str], Optional[int]]:
+    """Returns the ETag and Content-Length of `r`, if it has them."""
+    length = r.headers.get("Content-Length", "")
+    return r.headers.get("ETag"), int(length) if length.isdigit() else None
+
+
+def is_google_drive(url: str) -> bool:
+    """Returns whether `url` links to a file on Google Drive."""
+    netloc = urlparse(url).netloc
+    return (
+        "drive.google.com" in netloc
+        or "drive.usercontent.google.com" in netloc
+    )
+
+
+def stream_download(
+    url: str,
+    temp: Path,
+    downloads: Optional[Path],
+    sha256: Optional[str] = None,
+    cache: Optional[DownloadCache] = None,
+    cache_url: Optional[str] = None,
+    on_stage: Optional[StageCallback] = None,
+    select: Optional[MemberSelector] = None,
+) -> Optional[Path]:
+    """
+    Downloads the archive at `url` and extracts it while it is being
+    downloaded, without first writing the whole archive to disk. Returns the
+    path to the extracted directory in `temp`, or None if `url` can not be
+    streamed (Google Drive links), in which case the caller should fall back
+    to `download_file`. None is also returned if `url` is in `cache`, so the
+    cached archive is used instead.
+
+    Tar archives are extracted straight from the response body. Zip archives
+    keep their index at the end of the file, so they are spooled to disk and
+    extracted with `extract` as soon as the last byte arrives, extracting
+    only the files chosen by `select`. A tar stream can't be listed before it
+    is extracted, so `select` doesn't apply to tar archives. The archive is only kept if
+    `downloads` is set. If `sha256` is supplied, the archive is hashed as it
+    streams in and a ChecksumException is raised if it does not match. Kept
+    archives are added to `cache` under `cache_url` (defaults to `url`).
+    `on_stage` is called with the timing of the download and extraction
+    (a single "stream" stage for tar archives).
+    """
+    cache_url = cache_url or url
+    if cache is not None and cache.contains(cache_url):
+        return None
+    url = resolve_redirect(url)
+    if is_google_drive(url):
+        return None
+    print(f"Making request to {url}...", file=sys.stderr)
+    response = _session().get(
+        url, allow_redirects=True, stream=True, timeout=TIMEOUT
+    )
+    if urlparse(response.url).netloc != urlparse(url).netloc:
+        # potential case where redirected url is a gdrive link
+        response.close()
+        return stream_download(
+            response.url,
+            temp,
+            downloads,
+            sha256,
+            cache,
+            cache_url,
+            on_stage,
+            select,
+        )
+    validate_response(response)
+    filename = str(get_download_filename(response))
+    suffix = archive_suffix(filename)
+    if suffix is None:
+        raise ValueError(f"Invalid or unsupported archive format: {filename}")
+    if downloads is not None:
+        spool = downloads.joinpath(filename)
+    else:
+        spool = temp.joinpath(filename)
+    if ARCHIVE_FORMATS[suffix] == "zip":
+        with timed(on_stage, "download", url) as stage:
+            download_with_progress(response, spool, sha256)
+            stage.bytes = spool.stat().st_size
+        with timed(on_stage, "extract", spool, stage.bytes):
+            dest = extract(spool, temp, select)
+    else:
+        dest = temp.joinpath(filename[: -len(suffix)])
+        dest.mkdir()
+        munged_spool = spool.with_suffix(spool.suffix + ".part")
+        keep = open(munged_spool, "wb") if downloads is not None else None
+        with (
+            timed(on_stage, "stream", url) as stage,
+            _StreamReader(response, spool.name, keep) as reader,
+        ):
+            with tarfile.open(fileobj=reader, mode="r|*") as tar:
+                if hasattr(tarfile, "data_filter"):
+                    tar.extractall(dest, filter="data")
+                else:
+                    tar.extractall(dest)
+            # Read any padding after the end-of-archive marker
+            while reader.read(CHUNK_SIZE):
+                pass
+            stage.bytes = reader.bytes_read
+        if sha256 is not None:
+            try:
+                verify_checksum(reader.digest, sha256, spool)
+            except ChecksumException:
+                munged_spool.unlink(missing_ok=True)
+                raise
+        if keep is not None:
+            shutil.move(munged_spool, spool)
+    if cache is not None and downloads is not None:
+        cache.put(cache_url, spool, response_validators(response))
+    return dest
+
+
+class _StreamReader:
+    """
+    Read-only file object over the body of a streamed response. Updates a
+    progress bar and a SHA-256 digest as it is read and optionally copies the
+    body to `keep`.
+    """
+
+    def __init__(self, r: requests.Response, desc: str, keep=None):
+        from tqdm import tqdm
+
+        r.raw.decode_content = True
+        self.raw = r.raw
+        self.keep = keep
+        self.digest = hashlib.sha256()
+        self.bytes_read = 0
+        total_size = int(r.headers.get("content-length", 0))
+        self.pbar = tqdm(
+            total=total_size, unit="B", unit_scale=True, desc=desc
+        )
+
+    def read(self, size: int = -1) -> bytes:
+        chunk = self.raw.read(size)
+        self.bytes_read += len(chunk)
+        self.pbar.update(len(chunk))
+        self.digest.update(chunk)
+        if self.keep is not None:
+            self.keep.write(chunk)
+        return chunk
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.pbar.close()
+        if self.keep is not None:
+            self.keep.close()
+
+
+def fetch_remote_zip_members(
+    url: str, temp: Path, select: MemberSelector
+) -> Optional[Path]:
+    """
+    Extracts the files chosen by `select` from a remote zip archive into a
+    folder in `temp` without downloading the whole archive: the central
+    directory and the selected files are fetched with HTTP range requests.
+    Returns the path to the folder, or None if the server does not support
+    range requests or `url` is not a zip archive, in which case the caller
+    should fall back to downloading the archive.
+    """
+    url = resolve_redirect(url)
+    if is_google_drive(url):
+        return None
+    print(f"Making range requests to {url}...", file=sys.stderr)
+    remote = HTTPRangeFile(url)
+    if remote.size is None:
+        print("Server does not support range requests.", file=sys.stderr)
+        return None
+    filename = str(get_download_filename(remote.response))
+    if archive_suffix(filename) != ".zip":
+        return None
+    dest = temp.joinpath(filename[: -len(".zip")])
+    dest.mkdir()
+    with remote, zipfile.ZipFile(remote) as zf:
+        _extract_zip_members(zf, dest, select)
+    print(
+        f"Fetched {remote.fetched / 1e6:.1f} MB "
+        f"of {remote.size / 1e6:.1f} MB archive.",
+        file=sys.stderr,
+    )
+    return dest
+
+
+class HTTPRangeFile:
+    """
+    Read-only, seekable file object over a remote file, fetched on demand
+    with HTTP range requests. `size` is None if the server does not support
+    range requests.
+    """
+
+    # Minimum number of bytes fetched per request
+    READ_AHEAD = 256 * 1024
+
+    def __init__(self, url: str):
+        self.session = _session()
+        self.response = self.session.get(
+            url, headers={"Range": "bytes=0-0"}, stream=True, timeout=TIMEOUT
+        )
+        self.response.close()
+        self.url = self.response.url
+        self.size = None
+        content_range = self.response.headers.get("Content-Range", "")
+        if self.response.status_code == 206 and "/" in content_range:
+            total = content_range.rpartition("/")[2]
+            self.size = int(total) if total.isdigit() else None
+        self.position = 0
+        self.fetched = 0
+        self.buffer = b""
+        self.buffer_start = 0
+
+    def read(self, size: int = -1) -> bytes:
+        end = self.size if size < 0 else min(self.position + size, self.size)
+        if end <= self.position:
+            return b""
+        buffer_end = self.buffer_start + len(self.buffer)
+        if not (self.buffer_start <= self.position and end <= buffer_end):
+            fetch_start = self.position
+            if self.size - self.position < self.READ_AHEAD:
+                # Reads near the end are for the zip's end records and
+                # central directory, so fetch them together
+                fetch_start = max(
+                    min(fetch_start, self.size - self.READ_AHEAD), 0
+                )
+            fetch_end = min(
+                max(end, self.position + self.READ_AHEAD), self.size
+            )
+            r = self.session.get(
+                self.url,
+                headers={"Range": f"bytes={fetch_start}-{fetch_end - 1}"},
+                timeout=TIMEOUT,
+            )
+            if r.status_code != 206:
+                raise Exception(
+                    f"Unsuccessful range request to {r.url} "
+                    f"with status {r.status_code}"
+                )
+            self.buffer, self.buffer_start = r.content, fetch_start
+            self.fetched += len(r.content)
+        start = self.position - self.buffer_start
+        data = self.buffer[start : start + end - self.position]
+        self.position += len(data)
+        return data
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self.position
+        elif whence == os.SEEK_END:
+            offset += self.size
+        self.position = max(offset, 0)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+    def seekable(self) -> bool:
+        return True
+
+    def close(self) -> None:
+        # The session is shared with other downloads, so it stays open
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+
 def validate_response(
-    r: requests.Response, valid_content_types: list[str] = ["application/zip"]
+    r: requests.Response,
+    valid_content_types: list[str] = ARCHIVE_CONTENT_TYPES,
 ) -> None:
     """
     Validates a request response.
@@ -151,30 +1015,389 @@ def get_download_filename(r: requests.Response) -> str:
     Returns the filename from the response's Content-Disposition header, the
     url's basename, or defaults to "download.zip"
     """
+    import pyrfc6266
+
     if "Content-Disposition" in r.headers:
         return Path(pyrfc6266.parse_filename(r.headers["Content-Disposition"]))
-    name = os.path.basename(r.url)
-    if name.endswith(".zip"):
+    name = os.path.basename(urlparse(r.url).path)
+    if archive_suffix(name) is not None:
         return name
     else:
         return "download.zip"
 
 
-def download_with_progress(r: requests.Response, dest: Path) -> None:
+def download_with_progress(
+    r: requests.Response,
+    dest: Path,
+    sha256: Optional[str] = None,
+    retries: int = DOWNLOAD_RETRIES,
+    segments: int = DOWNLOAD_SEGMENTS,
+) -> None:
     """
     Downloads the content from a streamed request `r` to a .part file. Writes a
     progress bar to stderr tracking progress. Moves the file to dest once it is
     finished downloading.
+
+    If the server supports range requests and the file is large enough, it is
+    split into up to `segments` parts that are downloaded in parallel, over
+    pooled connections, into a preallocated .part file. Otherwise it is
+    downloaded as a single stream.
+
+    If a .part file from an earlier attempt exists and the server still
+    reports the same ETag/Last-Modified for it, the download resumes where it
+    left off using a Range request. Dropped connections are retried up to
+    `retries` times with exponential backoff, also resuming from the .part
+    file.
+
+    If `sha256` is supplied, the file is hashed as it is written and a
+    ChecksumException is raised (and the .part file deleted) if it does not
+    match.
     """
+    import requests
+    from tqdm import tqdm
+
     # Write the file with a munged extension before it's fully downloaded
     munged_dest = dest.with_suffix(dest.suffix + ".part")
-    # https://stackoverflow.com/a/37573701/22049792
-    chunk_size = 1024
+    validator_path = munged_dest.with_suffix(munged_dest.suffix + ".validator")
+    validator = r.headers.get("ETag") or r.headers.get("Last-Modified")
+    if validator is not None and validator.startswith("W/"):
+        # If-Range only works with strong validators
+        validator = None
+    accepts_ranges = r.headers.get("Accept-Ranges") == "bytes"
+    # The validator, and the number of bytes that can be kept if the .part
+    # file was left by a segmented download (see `_download_segments`)
+    saved = (
+        validator_path.read_text().split("\n")
+        if validator_path.exists()
+        else []
+    )
+    resumable = (
+        validator is not None
+        and accepts_ranges
+        and munged_dest.exists()
+        and saved[:1] == [validator]
+    )
+    if not resumable:
+        munged_dest.unlink(missing_ok=True)
+        validator_path.unlink(missing_ok=True)
+        if validator is not None:
+            validator_path.write_text(validator)
+    elif len(saved) > 1 and munged_dest.stat().st_size > int(saved[1]):
+        os.truncate(munged_dest, int(saved[1]))
+
+    digest = hashlib.sha256() if sha256 is not None else None
+    offset = munged_dest.stat().st_size if munged_dest.exists() else 0
     total_size = int(r.headers.get("content-length", 0))
-    pbar = tqdm(total=total_size, unit="B", unit_scale=True, desc=dest.name)
-    with open(munged_dest, "wb") as file:
-        for chunk in r.iter_content(chunk_size):
-            pbar.update(len(chunk))
-            file.write(chunk)
+    segmented = (
+        segments > 1
+        and offset == 0
+        and validator is not None
+        and accepts_ranges
+        and "Content-Encoding" not in r.headers
+        and total_size >= 2 * SEGMENT_MIN_SIZE
+    )
+    if segmented:
+        count = min(segments, total_size // SEGMENT_MIN_SIZE)
+        # The .part file is preallocated to its full size, so its size says
+        # nothing about what was downloaded. Without a validator, a .part
+        # file left by a killed process is started over instead of resumed.
+        validator_path.unlink(missing_ok=True)
+        _download_segments(
+            r,
+            munged_dest,
+            total_size,
+            validator,
+            count,
+            retries,
+            dest.name,
+            digest,
+        )
+    else:
+        if digest is not None and offset > 0:
+            # Hash the bytes kept from the earlier attempt
+            with open(munged_dest, "rb") as file:
+                while chunk := file.read(CHUNK_SIZE):
+                    digest.update(chunk)
+        url = r.url
+        if offset > 0:
+            r.close()
+            r = None
+        pbar = tqdm(
+            total=total_size,
+            initial=offset,
+            unit="B",
+            unit_scale=True,
+            desc=dest.name,
+        )
+        attempt = 0
+        while True:
+            try:
+                if r is None:
+                    r = _request_range(url, offset, validator)
+                    if r.status_code != 206 and offset > 0:
+                        # Range ignored or file changed: start over
+                        offset = 0
+                        pbar.reset(int(r.headers.get("content-length", 0)))
+                        if digest is not None:
+                            digest = hashlib.sha256()
+                with open(munged_dest, "ab" if offset > 0 else "wb") as file:
+                    for chunk in _read_chunks(r):
+                        pbar.update(len(chunk))
+                        file.write(chunk)
+                        offset += len(chunk)
+                        if digest is not None:
+                            digest.update(chunk)
+                break
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                attempt += 1
+                if attempt > retries:
+                    pbar.close()
+                    raise
+                delay = min(2**attempt, 60)
+                print(f"\n{e}\nRetrying in {delay}s...", file=sys.stderr)
+                time.sleep(delay)
+                r = None
+                if validator is None:
+                    # Without a validator the partial file can't be trusted
+                    offset = 0
+                    pbar.reset()
+                    if digest is not None:
+                        digest = hashlib.sha256()
+        pbar.close()
+    if digest is not None:
+        try:
+            verify_checksum(digest, sha256, dest)
+        except ChecksumException:
+            munged_dest.unlink()
+            validator_path.unlink(missing_ok=True)
+            raise
     shutil.move(munged_dest, dest)
-    pbar.close()
+    validator_path.unlink(missing_ok=True)
+
+
+def _download_segments(
+    r: requests.Response,
+    path: Path,
+    size: int,
+    validator: str,
+    segments: int,
+    retries: int,
+    desc: str,
+    digest=None,
+) -> None:
+    """
+    Downloads the `size` byte file of the response `r` to `path` as
+    `segments` ranges fetched in parallel. The first range is read from `r`
+    itself. Each range is retried up to `retries` times, resuming where it
+    stopped. If the download fails, `path` is truncated to the bytes that
+    were downloaded without gaps and its validator file records how many
+    there are, so it can be resumed as a single stream.
+
+    If `digest` is supplied, it is updated in file order: the first range as
+    it streams in, and each later range as soon as it and every range before
+    it have finished, while the rest are still downloading.
+    """
+    import requests
+    from tqdm import tqdm
+
+    length = -(-size // segments)  # Rounded up
+    bounds = [
+        (start, min(start + length, size)) for start in range(0, size, length)
+    ]
+    done = [0] * len(bounds)  # Bytes written to each segment
+    stop = Event()
+    with open(path, "wb") as file:
+        _preallocate(file, size)
+    pbar = tqdm(total=size, unit="B", unit_scale=True, desc=desc)
+    pbar_lock = Lock()
+
+    def fetch(i: int) -> None:
+        start, end = bounds[i]
+        response = r if i == 0 else None
+        attempt = 0
+        with open(path, "r+b") as file:
+            while done[i] < end - start and not stop.is_set():
+                try:
+                    if response is None:
+                        response = _request_range(
+                            r.url, start + done[i], validator, end - 1
+                        )
+                        if response.status_code != 206:
+                            raise Exception(
+                                "File changed on the server while downloading"
+                            )
+                    file.seek(start + done[i])
+                    for chunk in _read_chunks(response, end - start - done[i]):
+                        file.write(chunk)
+                        done[i] += len(chunk)
+                        if i == 0 and digest is not None:
+                            digest.update(chunk)
+                        with pbar_lock:
+                            pbar.update(len(chunk))
+                        if stop.is_set():
+                            return
+                    if done[i] < end - start:
+                        raise requests.ConnectionError(
+                            "Connection closed early"
+                        )
+                except (
+                    requests.ConnectionError,
+                    requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError,
+                ) as e:
+                    attempt += 1
+                    if attempt > retries:
+                        raise
+                    delay = min(2**attempt, 60)
+                    print(f"\n{e}\nRetrying in {delay}s...", file=sys.stderr)
+                    stop.wait(delay)
+                finally:
+                    if response is not None:
+                        response.close()
+                    response = None
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(bounds)) as executor:
+            futures = {
+                executor.submit(fetch, i): i for i in range(len(bounds))
+            }
+            finished = [False] * len(bounds)
+            hashed = 1  # Ranges after the first are hashed from `path`
+            try:
+                for future in as_completed(futures):
+                    future.result()
+                    finished[futures[future]] = True
+                    while (
+                        digest is not None
+                        and finished[0]
+                        and hashed < len(bounds)
+                        and finished[hashed]
+                    ):
+                        _hash_range(path, *bounds[hashed], digest)
+                        hashed += 1
+            except BaseException:
+                stop.set()
+                raise
+    except BaseException:
+        # Keep the bytes before the first gap for resuming
+        contiguous = 0
+        for (start, end), written in zip(bounds, done):
+            contiguous = start + written
+            if written < end - start:
+                break
+        os.truncate(path, contiguous)
+        # Ranges still being written can grow the file again, so the resume
+        # only keeps the recorded bytes
+        path.with_suffix(path.suffix + ".validator").write_text(
+            f"{validator}\n{contiguous}"
+        )
+        raise
+    finally:
+        pbar.close()
+
+
+def _hash_range(path: Path, start: int, end: int, digest) -> None:
+    """Updates `digest` with the bytes from `start` to `end` of `path`."""
+    with open(path, "rb") as file:
+        file.seek(start)
+        while start < end:
+            chunk = file.read(min(CHUNK_SIZE, end - start))
+            if not chunk:
+                break
+            digest.update(chunk)
+            start += len(chunk)
+
+
+def _preallocate(file, size: int) -> None:
+    """Allocates `size` bytes for `file` so parallel writes don't fragment it."""
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(file.fileno(), 0, size)
+            return
+        except OSError:
+            pass  # e.g. not supported by the filesystem
+    file.truncate(size)
+
+
+def _read_chunks(
+    r: requests.Response, limit: Optional[int] = None
+) -> Iterator[bytes]:
+    """
+    Yields the body of the streamed response `r`, or its first `limit` bytes.
+    Reads start at MIN_READ_SIZE and double while each read returns quickly,
+    up to MAX_READ_SIZE, so fast connections make fewer, larger writes.
+    """
+    import requests
+    from urllib3.exceptions import HTTPError
+
+    size = MIN_READ_SIZE
+    while limit is None or limit > 0:
+        began = time.monotonic()
+        try:
+            chunk = r.raw.read(
+                size if limit is None else min(size, limit),
+                decode_content=True,
+            )
+        except HTTPError as e:
+            raise requests.ConnectionError(e) from e
+        if not chunk:
+            return
+        yield chunk
+        if limit is not None:
+            limit -= len(chunk)
+        elapsed = time.monotonic() - began
+        if elapsed < 0.05 and size < MAX_READ_SIZE:
+            size *= 2
+        elif elapsed > 0.5 and size > MIN_READ_SIZE:
+            size //= 2
+
+
+@functools.cache
+def _session() -> requests.Session:
+    """
+    Returns the HTTP session shared by all downloads, so keep-alive
+    connections are pooled across requests, redirects and files.
+    """
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=4 * DOWNLOAD_SEGMENTS)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def _request_range(
+    url: str, offset: int, validator: Optional[str], end: Optional[int] = None
+) -> requests.Response:
+    """
+    Requests `url` from byte `offset` to `end` (inclusive; defaults to the end
+    of the file). The server sends the whole file instead (status 200) if it
+    no longer matches `validator`.
+    """
+    headers = {"Range": f"bytes={offset}-{'' if end is None else end}"}
+    if validator is not None:
+        headers["If-Range"] = validator
+    r = _session().get(url, headers=headers, stream=True, timeout=TIMEOUT)
+    if r.status_code not in (200, 206):
+        raise Exception(
+            f"Unsuccessful request to {r.url} with status {r.status_code}"
+        )
+    return r
+
+
+def verify_checksum(digest, sha256: str, path: Path) -> None:
+    """
+    Raises a ChecksumException if the hex digest of the hashlib object
+    `digest` does not match `sha256`.
+    """
+    if digest.hexdigest() != sha256.strip().lower():
+        raise ChecksumException(
+            f"SHA-256 mismatch for {path.name}: expected {sha256}, "
+            f"got {digest.hexdigest()}"
+        )
@@ -0,0 +1,341 @@
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import shutil
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from threading import Event, Lock
+from typing import Callable, NamedTuple, Optional, TypeAlias
+from itg_cli._utils import archive_suffix
+
+# Archives dropped in inbox/songs are added as songs, the rest as packs
+SONGS_FOLDER = "songs"
+DONE_FOLDER = ".done"
+FAILED_FOLDER = ".failed"
+STATUS_NAME = ".itg-cli-watch.json"
+# Suffixes of files that browsers and file managers are still writing
+PARTIAL_SUFFIXES = (".part", ".partial", ".crdownload", ".download", ".tmp")
+# Number of finished items listed in the status file
+HISTORY = 50
+# Longest wait for file events before checking `stop` again
+IDLE_TIMEOUT = 5.0
+
+# Adds the archive at a path and returns the name of the added pack/song
+Ingest: TypeAlias = Callable[[Path], str]
+
+
+class InboxItem(NamedTuple):
+    path: Path
+    kind: str  # "pack" or "song"
+    size: int
+    queued_at: float
+
+
+class IngestResult(NamedTuple):
+    path: Path  # Where the archive was moved to (inbox/.done or .failed)
+    kind: str
+    size: int
+    started_at: float
+    seconds: float
+    added: Optional[str]  # The name of the added pack/song
+    error: Optional[str]
+
+
+class InboxWatcher:
+    """
+    Watches the folder `inbox` and adds the archives dropped into it once they
+    are fully written: archives in `inbox` are added with `add_pack` and those
+    in `inbox`/songs with `add_song`. At most `jobs` archives are added at the
+    same time. Added archives are moved to `inbox`/.done and archives that
+    could not be added to `inbox`/.failed.
+
+    An archive is considered fully written once its size and modification
+    time haven't changed for `settle` seconds. The inbox is watched with
+    inotify on Linux and polled every `poll` seconds otherwise (or if `poll`
+    is supplied).
+
+    The queue and the duration and throughput of finished items are written
+    to the JSON file `status` (defaults to `inbox`/.itg-cli-watch.json)
+    whenever they change. `on_result` is called with each IngestResult.
+    """
+
+    def __init__(
+        self,
+        inbox: Path,
+        add_pack: Ingest,
+        add_song: Ingest,
+        jobs: int = 2,
+        settle: float = 2.0,
+        poll: Optional[float] = None,
+        status: Optional[Path] = None,
+        on_result: Optional[Callable[[IngestResult], None]] = None,
+    ):
+        self.inbox = inbox
+        self.ingest = {"pack": add_pack, "song": add_song}
+        self.jobs = jobs
+        self.settle = settle
+        self.status_path = status or inbox / STATUS_NAME
+        self.on_result = on_result
+        self.lock = Lock()
+        self.status_lock = Lock()  # Held while the status file is written
+        # path -> ((size, mtime), time the signature last changed)
+        self.changes: dict[Path, tuple[tuple[int, int], float]] = {}
+        self.queued: dict[Path, InboxItem] = {}
+        self.active: dict[Path, tuple[InboxItem, float]] = {}
+        self.finished: deque[IngestResult] = deque(maxlen=HISTORY)
+        self.added = 0
+        self.failed = 0
+        self.started_at = time.time()
+        inbox.joinpath(SONGS_FOLDER).mkdir(parents=True, exist_ok=True)
+        self.notifier = _notifier(
+            [inbox, inbox / SONGS_FOLDER], poll or settle, poll is not None
+        )
+
+    @property
+    def mode(self) -> str:
+        return "inotify" if isinstance(self.notifier, _Inotify) else "poll"
+
+    def run(self, stop: Optional[Event] = None, once: bool = False) -> None:
+        """
+        Adds archives as they arrive until `stop` is set (or forever). If
+        `once` is true, returns once the archives already in the inbox have
+        been added instead.
+        """
+        stop = stop or Event()
+        self.write_status()
+        with ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            try:
+                while not stop.is_set():
+                    for item in self.check():
+                        executor.submit(self._process, item)
+                    with self.lock:
+                        busy = bool(self.queued or self.active)
+                    if once and not busy and not self.changes:
+                        break
+                    # Files still being written are checked again shortly
+                    settling = self.changes or (once and busy)
+                    timeout = self.settle / 2 if settling else IDLE_TIMEOUT
+                    self.notifier.wait(timeout)
+            finally:
+                # Queued archives stay in the inbox for the next run
+                executor.shutdown(cancel_futures=True)
+                self.notifier.close()
+                with self.lock:
+                    self.queued.clear()
+                self.write_status()
+
+    def check(self) -> list[InboxItem]:
+        """
+        Returns the archives in the inbox that are ready to be added and
+        haven't been queued yet, and queues them.
+        """
+        now = time.time()
+        candidates = {
+            path: (kind, stat) for path, kind, stat in self._candidates()
+        }
+        # Forget files that were removed
+        for path in self.changes.keys() - candidates.keys():
+            del self.changes[path]
+        ready = []
+        with self.lock:
+            for path, (kind, stat) in candidates.items():
+                if path in self.queued or path in self.active:
+                    continue
+                signature = (stat.st_size, stat.st_mtime_ns)
+                previous = self.changes.get(path)
+                if previous is None or previous[0] != signature:
+                    self.changes[path] = (signature, now)
+                elif now - previous[1] >= self.settle:
+                    del self.changes[path]
+                    item = InboxItem(path, kind, stat.st_size, now)
+                    self.queued[path] = item
+                    ready.append(item)
+        if ready:
+            self.write_status()
+        return ready
+
+    def status(self) -> dict:
+        """Returns the contents of the status file."""
+        with self.lock:
+            return {
+                "inbox": str(self.inbox),
+                "pid": os.getpid(),
+                "mode": self.mode,
+                "started_at": self.started_at,
+                "updated_at": time.time(),
+                "added": self.added,
+                "failed": self.failed,
+                "queued": [
+                    {
+                        "path": str(item.path),
+                        "kind": item.kind,
+                        "size": item.size,
+                        "queued_at": item.queued_at,
+                    }
+                    for item in self.queued.values()
+                ],
+                "active": [
+                    {
+                        "path": str(item.path),
+                        "kind": item.kind,
+                        "size": item.size,
+                        "started_at": started_at,
+                    }
+                    for item, started_at in self.active.values()
+                ],
+                "finished": [
+                    {
+                        **result._asdict(),
+                        "path": str(result.path),
+                        "bytes_per_second": (
+                            result.size / result.seconds
+                            if result.seconds > 0
+                            else None
+                        ),
+                    }
+                    for result in reversed(self.finished)
+                ],
+            }
+
+    def write_status(self) -> None:
+        # Write atomically so readers never see a partial file
+        temp = self.status_path.with_name(self.status_path.name + ".tmp")
+        with self.status_lock:
+            temp.write_text(json.dumps(self.status(), indent=2))
+            os.replace(temp, self.status_path)
+
+    def _candidates(self):
+        """Yields the archives in the inbox as (path, kind, stat) tuples."""
+        for folder, kind in (
+            (self.inbox, "pack"),
+            (self.inbox / SONGS_FOLDER, "song"),
+        ):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder):
+                name = entry.name
+                if (
+                    name.startswith(".")
+                    or name.lower().endswith(PARTIAL_SUFFIXES)
+                    or archive_suffix(name) is None
+                ):
+                    continue
+                try:
+                    if entry.is_file():
+                        yield Path(entry.path), kind, entry.stat()
+                except FileNotFoundError:
+                    continue
+
+    def _process(self, item: InboxItem) -> None:
+        started_at = time.time()
+        with self.lock:
+            del self.queued[item.path]
+            self.active[item.path] = (item, started_at)
+        self.write_status()
+        added, error = None, None
+        try:
+            added = self.ingest[item.kind](item.path)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+        seconds = time.time() - started_at
+        folder = self.inbox / (DONE_FOLDER if error is None else FAILED_FOLDER)
+        try:
+            path = _move_to(item.path, folder)
+        except OSError:
+            path = item.path
+        result = IngestResult(
+            path, item.kind, item.size, started_at, seconds, added, error
+        )
+        with self.lock:
+            del self.active[item.path]
+            self.finished.append(result)
+            if error is None:
+                self.added += 1
+            else:
+                self.failed += 1
+        self.write_status()
+        if self.on_result is not None:
+            self.on_result(result)
+
+
+class _Inotify:
+    """
+    Waits for files to be written or moved into `dirs` using Linux's inotify
+    API (through ctypes, as the standard library has no binding).
+    """
+
+    # IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+    MASK = 0x00000008 | 0x00000080 | 0x00000100
+
+    def __init__(self, dirs: list[Path]):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        for path in dirs:
+            if libc.inotify_add_watch(self.fd, bytes(path), self.MASK) < 0:
+                errno = ctypes.get_errno()
+                os.close(self.fd)
+                raise OSError(errno, os.strerror(errno), str(path))
+
+    def wait(self, timeout: float) -> None:
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return
+        # The inbox is scanned again, so the events themselves aren't needed
+        try:
+            while os.read(self.fd, 64 * 1024):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class _Poller:
+    """Waits `interval` seconds, or `timeout` if it is shorter."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(min(timeout, self.interval))
+
+    def close(self) -> None:
+        pass
+
+
+def _notifier(
+    dirs: list[Path], interval: float, force_poll: bool
+) -> _Inotify | _Poller:
+    if force_poll or not sys.platform.startswith("linux"):
+        return _Poller(interval)
+    try:
+        return _Inotify(dirs)
+    except (OSError, AttributeError, TypeError) as e:
+        print(f"Warning | inotify unavailable ({e}), polling instead.")
+        return _Poller(interval)
+
+
+def _move_to(path: Path, folder: Path) -> Path:
+    """
+    Moves `path` into `folder`, adding a number to its name if a file with
+    the same name is already there. Returns the new path.
+    """
+    folder.mkdir(exist_ok=True)
+    suffix = archive_suffix(path.name) or ""
+    stem = path.name[: len(path.name) - len(suffix)]
+    dest = folder / path.name
+    i = 1
+    while dest.exists():
+        dest = folder / f"{stem} ({i}){suffix}"
+        i += 1
+    shutil.move(path, dest)
+    return dest
@@ -1,22 +1,75 @@
+from __future__ import annotations
+
 import shutil
-import simfile
+import warnings
 from collections import Counter
-from pathlib import Path
-from simfile.dir import SimfilePack
-from simfile.types import Simfile
+from contextlib import nullcontext
+from fnmatch import fnmatch
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path, PurePath, PurePosixPath
 from tempfile import TemporaryDirectory
-from typing import Callable, Optional, TypeAlias
+from threading import BoundedSemaphore, Lock
+from typing import TYPE_CHECKING, Callable, Iterable, Optional, TypeAlias
+from urllib.parse import urlparse
+from itg_cli._censored import CensoredSong, CensorManifest
+from itg_cli._courses import SongLookup, UnresolvedSong, check_courses
+from itg_cli._dedupe import dedupe_new
+from itg_cli._download_cache import DownloadCache
+from itg_cli._hashing import Duplicate, hash_simfiles
+from itg_cli._index import LibraryIndex
+from itg_cli._itg_cache import SongCache
+from itg_cli._timings import StageCallback, timed
+from itg_cli._trash import STAGING_PREFIX, purge, replace_dir
+from itg_cli._metadata import (
+    SongMetadata,
+    find_simfile,
+    parse_metadata,
+    read_song_metadata,
+    song_dirs,
+)
 from itg_cli._utils import (
+    LinkMode,
+    MemberSelector,
+    SyncResult,
+    TreeManifest,
     delete_macos_files,
+    fetch_remote_zip_members,
+    fetch_source,
+    is_macos_junk,
+    is_simfile,
+    prepare_working_dir,
+    resolve_redirect,
+    scan_tree,
     setup_working_dir,
-    simfile_paths,
+    stream_download,
+    sync_tree,
 )
 
-PackOverwriteHandler: TypeAlias = Callable[[SimfilePack, SimfilePack], bool]
+# simfile is imported where it is used so commands that don't parse simfiles
+# start quickly
+if TYPE_CHECKING:
+    from simfile.dir import SimfilePack
+    from simfile.types import Simfile
+
+PackOverwriteHandler: TypeAlias = Callable[
+    ["SimfilePack", "SimfilePack"], bool
+]
 SongOverwriteHandler: TypeAlias = Callable[
-    [tuple[Simfile, str], tuple[Simfile, str]], bool
+    [tuple["Simfile", str], tuple["Simfile", str]], bool
+]
+UncensorPicker: TypeAlias = Callable[[list[tuple["Simfile", str]]], int]
+CensoredSongPicker: TypeAlias = Callable[[list[CensoredSong]], int]
+PackResult: TypeAlias = "tuple[SimfilePack, int] | Exception"
+SongResult: TypeAlias = "tuple[Simfile, str] | Exception"
+DuplicatesHandler: TypeAlias = Callable[["SimfilePack", list[Duplicate]], bool]
+UpdateHandler: TypeAlias = Callable[["SimfilePack", SyncResult], None]
+UnresolvedHandler: TypeAlias = Callable[
+    ["SimfilePack", list[UnresolvedSong]], None
 ]
-UncensorPicker: TypeAlias = Callable[[list[tuple[Simfile, str]]], int]
+
+# Held while a pack or song replaces its destination so that concurrent adds
+# of the same folder (e.g. from `watch`) can't interleave
+_install_lock = Lock()
 
 
 class OverwriteException(Exception):
@@ -27,6 +80,10 @@ class UncensorException(Exception):
     """Raised when there are no songs to uncensor"""
 
 
+class DuplicateException(Exception):
+    """Raised when a pack with charts already in the library is not added."""
+
+
 def add_pack(
     path_or_url: str,
     packs: Path,
@@ -34,6 +91,18 @@ def add_pack(
     downloads: Optional[Path] = None,
     overwrite: PackOverwriteHandler = lambda _new, _old: False,
     delete_macos_files_flag: bool = False,
+    stream: bool = False,
+    sha256: Optional[str] = None,
+    staging: Optional[Path] = None,
+    link: LinkMode = "copy",
+    index: Optional[LibraryIndex] = None,
+    download_cache: Optional[DownloadCache] = None,
+    duplicates: Optional[DuplicatesHandler] = None,
+    cache: Optional[Path] = None,
+    on_stage: Optional[StageCallback] = None,
+    update: Optional[UpdateHandler] = None,
+    dedupe: bool = False,
+    unresolved: Optional[UnresolvedHandler] = None,
 ) -> tuple[SimfilePack, int]:
     """
     Takes a path to a local directory or a path/url to an archive and adds the
@@ -41,68 +110,514 @@ def add_pack(
 
     In the case of multiple valid pack directories (multiple folders
     containing .sm files with different direct parents), a warning will be
-    displayed, and the pack containing the most songs will be added.
+    displayed, and the pack containing the most songs will be added. Archives
+    are inspected before extraction so only the chosen pack and any folders
+    containing .crs files are extracted (__MACOSX folders never are).
 
     If there is already an existing pack in `packs` with the same
     folder name, the supplied `overwrite` function is called on the new and old
     SimfilePacks. If `overwrite` returns true, the old pack is overwritten by
-    the supplied pack; if false, an OverwriteException is raised.
+    the supplied pack; if false, an OverwriteException is raised. If `cache`
+    (the ITGmania cache folder) is supplied, the overwritten pack's song cache
+    entries are deleted. The new pack is swapped in with renames and the old
+    one moved to `packs`/.itg-cli-trash, from where a background thread
+    deletes it (see `empty_trash` for leftovers).
+
+    If `update` is supplied, an existing pack is updated in place instead,
+    without calling `overwrite`: only the files that were added, changed or
+    removed are written or deleted (see `sync_tree`), and only the cache
+    entries of the songs they belong to are deleted. `update` is then called
+    with the updated SimfilePack and the SyncResult.
+
+    If `stream` is true, downloaded archives are extracted while they
+    download instead of afterwards. If `sha256` is supplied, downloads are
+    checked against it and a ChecksumException is raised on a mismatch.
+    If `index` is supplied, the added pack/song is indexed. URLs found in
+    `download_cache` are not downloaded again, and new downloads are added to
+    it.
+
+    If `duplicates` and `index` are supplied, the pack's charts are hashed
+    and looked up in `index` (whose hashes should be up to date, see
+    `LibraryIndex.hash_charts`). If any of them are already in the library,
+    `duplicates` is called on the new SimfilePack and the list of duplicates.
+    If it returns false, a DuplicateException is raised.
+
+    If `dedupe` is true and `index` is supplied, the pack's audio, images and
+    videos that are identical to files recorded by `dedupe_library` are
+    replaced with hardlinks to them.
+
+    If `unresolved` is supplied, the #SONG entries of the added courses are
+    checked against the songs in `packs` (see `check_courses`), and it is
+    called with the added SimfilePack and the entries that don't match one.
+
+    The working directory is created in `staging` (defaults to the system's
+    temporary directory). Staging on the same filesystem as the destination
+    turns the final move into a rename. `link` sets how local directories are
+    copied into the working directory: `copy`, `hardlink` or `reflink`.
+
+    `on_stage` is called with the StageTiming of each stage (download,
+    extraction, scanning, deleting macOS files, moving courses, removing the
+    old pack, the final move, ...) as it finishes.
 
     Returns:
         a tuple containing a `SimfilePack` object of the added pack and the
         number of courses added.
     """
-    with TemporaryDirectory() as temp_directory:
+    with TemporaryDirectory(prefix=STAGING_PREFIX, dir=staging) as temp_dir:
         working_dir = setup_working_dir(
-            path_or_url, Path(temp_directory), downloads
+            path_or_url,
+            Path(temp_dir),
+            downloads,
+            stream,
+            sha256,
+            link,
+            _pack_selector(delete_macos_files_flag),
+            download_cache,
+            on_stage,
+        )
+        pack_path, manifest = _locate_pack(
+            working_dir, delete_macos_files_flag, on_stage
+        )
+        return _install_pack(
+            pack_path,
+            working_dir,
+            packs,
+            courses,
+            overwrite,
+            delete_macos_files_flag,
+            index,
+            duplicates,
+            cache,
+            manifest,
+            on_stage,
+            update,
+            dedupe,
+            unresolved,
         )
 
-        # 2nd parent of a simfile path is a valid pack directory
-        # pack_dir_counts stores the # of simfiles in each pack
-        pack_dir_counts = Counter(
-            p.parents[1] for p in simfile_paths(working_dir)
+
+def add_packs(
+    paths_or_urls: Iterable[str],
+    packs: Path,
+    courses: Path,
+    downloads: Optional[Path] = None,
+    overwrite: PackOverwriteHandler = lambda _new, _old: False,
+    delete_macos_files_flag: bool = False,
+    download_jobs: int = 2,
+    extract_jobs: int = 2,
+    install_jobs: int = 1,
+    stream: bool = False,
+    checksums: Optional[dict[str, str]] = None,
+    staging: Optional[Path] = None,
+    link: LinkMode = "copy",
+    index: Optional[LibraryIndex] = None,
+    download_cache: Optional[DownloadCache] = None,
+    cache: Optional[Path] = None,
+    on_stage: Optional[StageCallback] = None,
+    update: Optional[UpdateHandler] = None,
+    dedupe: bool = False,
+    unresolved: Optional[UnresolvedHandler] = None,
+) -> dict[str, PackResult]:
+    """
+    Adds several packs at once. Each path/url goes through the same steps as
+    `add_pack`, but downloading, extracting and installing run as overlapping
+    stages: at most `download_jobs` downloads, `extract_jobs` extractions and
+    `install_jobs` installs run at the same time.
+
+    Packs that would overwrite an existing pack are held back until every
+    other pack has been processed, and `overwrite` is then called for each of
+    them in turn from the calling thread.
+
+    `checksums` optionally maps paths/urls to the SHA-256 their download is
+    checked against. `staging`, `link`, `index`, `download_cache`, `cache`,
+    `on_stage`, `update`, `dedupe` and `unresolved` behave as in `add_pack`;
+    `on_stage` and `unresolved` are called from the worker threads.
+
+    A failure while adding one pack does not stop the others.
+
+    Returns:
+        a dict mapping each supplied path/url to either the `(SimfilePack,
+        num_courses)` tuple returned by `add_pack` or the exception raised
+        while adding it (an OverwriteException if it was not overwritten).
+    """
+    paths_or_urls = list(dict.fromkeys(paths_or_urls))
+    download_slots = BoundedSemaphore(download_jobs)
+    extract_slots = BoundedSemaphore(extract_jobs)
+    install_slots = BoundedSemaphore(install_jobs)
+    claimed_lock = Lock()
+    claimed: set[str] = set()
+    pending: dict[str, tuple[Path, Path, TreeManifest]] = {}
+    results: dict[str, PackResult] = {}
+
+    def process(path_or_url: str, temp: Path) -> None:
+        temp.mkdir()
+        sha256 = (checksums or {}).get(path_or_url)
+        working_dir = None
+        with download_slots:
+            if stream and path_or_url.startswith("http"):
+                # downloading and extracting happen together when streaming
+                working_dir = stream_download(
+                    path_or_url,
+                    temp,
+                    downloads,
+                    sha256,
+                    download_cache,
+                    on_stage=on_stage,
+                    select=_pack_selector(delete_macos_files_flag),
+                )
+            if working_dir is None:
+                source, downloaded = fetch_source(
+                    path_or_url,
+                    temp,
+                    downloads,
+                    sha256,
+                    download_cache,
+                    on_stage,
+                )
+        if working_dir is None:
+            with extract_slots:
+                working_dir = prepare_working_dir(
+                    source,
+                    temp,
+                    downloaded,
+                    link,
+                    _pack_selector(delete_macos_files_flag),
+                    on_stage,
+                )
+        with install_slots:
+            pack_path, manifest = _locate_pack(
+                working_dir, delete_macos_files_flag, on_stage
+            )
+            with claimed_lock:
+                conflict = (
+                    pack_path.name in claimed
+                    or packs.joinpath(pack_path.name).exists()
+                )
+                claimed.add(pack_path.name)
+            if conflict:
+                pending[path_or_url] = (pack_path, working_dir, manifest)
+                return
+            results[path_or_url] = _install_pack(
+                pack_path,
+                working_dir,
+                packs,
+                courses,
+                overwrite,
+                delete_macos_files_flag,
+                index,
+                cache=cache,
+                manifest=manifest,
+                on_stage=on_stage,
+                update=update,
+                dedupe=dedupe,
+                unresolved=unresolved,
+            )
+
+    workers = download_jobs + extract_jobs + install_jobs
+    with TemporaryDirectory(prefix=STAGING_PREFIX, dir=staging) as temp_dir:
+        temp = Path(temp_dir)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(
+                    process, path_or_url, temp / str(i)
+                ): path_or_url
+                for i, path_or_url in enumerate(paths_or_urls)
+            }
+            for future in as_completed(futures):
+                if future.exception() is not None:
+                    results[futures[future]] = future.exception()
+        # Overwrites are confirmed one at a time once everything else is done
+        for path_or_url, (pack_path, working_dir, manifest) in pending.items():
+            try:
+                results[path_or_url] = _install_pack(
+                    pack_path,
+                    working_dir,
+                    packs,
+                    courses,
+                    overwrite,
+                    delete_macos_files_flag,
+                    index,
+                    cache=cache,
+                    manifest=manifest,
+                    on_stage=on_stage,
+                    update=update,
+                    dedupe=dedupe,
+                    unresolved=unresolved,
+                )
+            except Exception as e:
+                results[path_or_url] = e
+    return {path_or_url: results[path_or_url] for path_or_url in paths_or_urls}
+
+
+def _locate_pack(
+    working_dir: Path,
+    delete_macos_files_flag: bool,
+    on_stage: Optional[StageCallback] = None,
+) -> tuple[Path, TreeManifest]:
+    """
+    Returns the pack directory in `working_dir` and the manifest of
+    `working_dir`, which is walked once. If there are multiple candidates, a
+    warning is printed and the one with the most songs is returned.
+    """
+    with timed(on_stage, "scan", working_dir) as stage:
+        manifest = scan_tree(working_dir)
+        stage.bytes = manifest.total_bytes
+    simfiles = (p.relative_to(working_dir) for p in manifest.simfiles)
+    pack_path = working_dir.joinpath(_choose_pack_dir(simfiles))
+    if delete_macos_files_flag:
+        with timed(on_stage, "delete-macos-files", pack_path):
+            delete_macos_files(pack_path, manifest)
+    return pack_path, manifest
+
+
+def _choose_pack_dir(simfiles: Iterable[PurePath]) -> PurePath:
+    """
+    Returns the pack directory of the supplied simfile paths (relative to the
+    working directory or archive root). If there are multiple candidates, a
+    warning is printed and the one with the most songs is returned.
+    """
+    # 2nd parent of a simfile path is a valid pack directory
+    # pack_dir_counts stores the # of simfiles in each pack
+    pack_dir_counts = Counter(
+        p.parents[1] for p in simfiles if len(p.parts) > 1
+    )
+
+    if len(pack_dir_counts) == 0:
+        raise Exception("No packs found.")
+    elif len(pack_dir_counts) > 1:
+        print("Warning | Multiple pack directories found:")
+        packs_by_frequency = pack_dir_counts.most_common()
+        for pack, count in packs_by_frequency:
+            print(f"{pack} ({count} songs)")
+        pack_path, _ = packs_by_frequency[0]
+        print(f"Selecting pack with the most songs: {pack_path}")
+    else:
+        pack_path, _ = pack_dir_counts.popitem()
+    return pack_path
+
+
+def _choose_song_dir(
+    simfiles: Iterable[PurePath],
+    song: Optional[str] = None,
+    read: Callable[[PurePath], bytes] = lambda p: Path(p).read_bytes(),
+) -> PurePath:
+    """
+    Returns the directory containing the supplied simfile paths, raising an
+    exception if there is not exactly one.
+
+    If `song` is supplied, only directories whose folder name matches it are
+    considered, or, if there are none, directories whose simfile title
+    matches it. `read` returns the contents of a simfile.
+    """
+    if song is not None:
+        simfiles = list(simfiles)
+        matches = {
+            p.parent
+            for p in simfiles
+            if p.parent.name.casefold() == song.casefold()
+        }
+        if not matches:
+            matches = {
+                p.parent
+                for p in simfiles
+                if _simfile_title(read(p), p).casefold() == song.casefold()
+            }
+        if not matches:
+            raise Exception(f"No song matching {song} found.")
+        simfiles = [p for p in simfiles if p.parent in matches]
+    simfile_dirs = {p.parent for p in simfiles}
+
+    # Ensure only one simfile was supplied
+    if len(simfile_dirs) == 1:
+        return simfile_dirs.pop()
+    elif len(simfile_dirs) == 0:
+        raise Exception("No simfiles found.")
+    else:
+        # TODO: Maybe this behavior should be changed?
+        # Sticking with it for now because it's simpler.
+        raise Exception(
+            "More than one simfile in supplied link/directory\n"
+            + "Supply songs individually or use add-pack instead."
         )
 
-        if len(pack_dir_counts) == 0:
-            raise Exception("No packs found.")
-        elif len(pack_dir_counts) > 1:
-            print("Warning | Multiple pack directories found:")
-            packs_by_frequency = pack_dir_counts.most_common()
-            for pack, count in packs_by_frequency:
-                print(f"{pack.relative_to(working_dir)} ({count} songs)")
-            pack_path, _ = packs_by_frequency[0]
-            rel_path = pack_path.relative_to(working_dir)
-            print(f"Selecting pack with the most songs: {rel_path}")
-        else:
-            pack_path, _ = pack_dir_counts.popitem()
 
-        if delete_macos_files_flag:
-            delete_macos_files(pack_path)
-        pack = SimfilePack(pack_path)
-        songs = list(pack.simfiles(strict=False))
+def _simfile_title(data: bytes, path: PurePath) -> str:
+    """
+    Returns the title of the simfile `data` read from `path`, or "" if it
+    can't be read.
+    """
+    try:
+        return parse_metadata(data, Path(path)).title
+    except Exception:
+        return ""
+
+
+def _without_junk(
+    members: list[PurePosixPath], delete_macos_files_flag: bool
+) -> list[PurePosixPath]:
+    """
+    Filters __MACOSX folders (and `._` files if `delete_macos_files_flag` is
+    set) out of a list of archive members.
+    """
+    if delete_macos_files_flag:
+        return [m for m in members if not is_macos_junk(m)]
+    return [m for m in members if "__MACOSX" not in m.parts]
+
+
+def _pack_selector(delete_macos_files_flag: bool) -> MemberSelector:
+    """
+    Returns a `MemberSelector` that picks the pack directory (see
+    `_choose_pack_dir`) and any folders containing .crs files from an
+    archive's member list, so nothing else is extracted.
+    """
 
+    def select(
+        members: list[PurePosixPath], _read: Callable[[PurePosixPath], bytes]
+    ) -> list[PurePosixPath]:
+        members = _without_junk(members, delete_macos_files_flag)
+        pack_dir = _choose_pack_dir(filter(is_simfile, members))
+        crs_dirs = {m.parent for m in members if m.suffix == ".crs"}
+        return [
+            m
+            for m in members
+            if m.is_relative_to(pack_dir) or m.parent in crs_dirs
+        ]
+
+    return select
+
+
+def _song_selector(
+    delete_macos_files_flag: bool, song: Optional[str] = None
+) -> MemberSelector:
+    """
+    Returns a `MemberSelector` that picks the song directory (see
+    `_choose_song_dir`) from an archive's member list.
+    """
+
+    def select(
+        members: list[PurePosixPath], read: Callable[[PurePosixPath], bytes]
+    ) -> list[PurePosixPath]:
+        members = _without_junk(members, delete_macos_files_flag)
+        song_dir = _choose_song_dir(filter(is_simfile, members), song, read)
+        return [m for m in members if m.is_relative_to(song_dir)]
+
+    return select
+
+
+def _install_pack(
+    pack_path: Path,
+    working_dir: Path,
+    packs: Path,
+    courses: Path,
+    overwrite: PackOverwriteHandler,
+    delete_macos_files_flag: bool,
+    index: Optional[LibraryIndex] = None,
+    duplicates: Optional[DuplicatesHandler] = None,
+    cache: Optional[Path] = None,
+    manifest: Optional[TreeManifest] = None,
+    on_stage: Optional[StageCallback] = None,
+    update: Optional[UpdateHandler] = None,
+    dedupe: bool = False,
+    unresolved: Optional[UnresolvedHandler] = None,
+) -> tuple[SimfilePack, int]:
+    """
+    Moves the pack at `pack_path` into `packs` and any courses found in
+    `working_dir` into `courses`, calling `overwrite` if the pack already
+    exists (or updating it, if `update` is supplied) and `duplicates` if it
+    has charts already in `index`, and updates `index` and `cache` (linking
+    the pack's duplicate assets if `dedupe` is true), then checks the added
+    courses if `unresolved` is supplied. Course
+    folders are taken from the `manifest` of `working_dir` if supplied.
+    `on_stage` is called with the timing of each stage. Returns the same
+    values as `add_pack`.
+    """
+    from simfile.dir import SimfilePack
+
+    pack = SimfilePack(pack_path)
+    dest = packs.joinpath(pack_path.name)
+
+    # check for charts that are already in the library
+    hashes = {}
+    if duplicates is not None and index is not None:
+        with timed(on_stage, "find-duplicates", pack_path):
+            simfiles = [
+                find_simfile(song_dir) for song_dir in song_dirs(pack_path)
+            ]
+            hashes = hash_simfiles(simfiles)
+            found = index.find_duplicates(
+                [chart for charts in hashes.values() for chart in charts],
+                exclude=dest,
+            )
+        if found and not duplicates(pack, found):
+            raise DuplicateException("Pack has charts already in library.")
+
+    trashed, synced = None, None
+    with _install_lock:
         # check if pack already exists
-        dest = packs.joinpath(pack_path.name)
-        if dest.exists():
+        replace = dest.exists()
+        if replace:
             if delete_macos_files_flag:
-                delete_macos_files(dest)
-            if not overwrite(pack, SimfilePack(dest)):
+                with timed(on_stage, "delete-macos-files", dest):
+                    delete_macos_files(dest)
+            if update is None and not overwrite(pack, SimfilePack(dest)):
                 raise OverwriteException("Pack already exists.")
-            shutil.rmtree(dest)
+            if cache is not None and update is None:
+                with timed(on_stage, "invalidate-cache", dest):
+                    SongCache(cache, packs).invalidate(song_dirs(dest))
 
         # look for a Courses folder countaining .crs files
-        num_courses = 0
+        course_files = []
         courses_subfolder = courses.joinpath(pack.name)
         courses_subfolder.mkdir(exist_ok=True)
-        crs_parent_dirs = {p.parent for p in working_dir.rglob("*.crs")}
-        for crs_parent_dir in crs_parent_dirs:
-            for file in filter(Path.is_file, crs_parent_dir.iterdir()):
-                file.replace(courses_subfolder.joinpath(file.name))
-                if file.suffix == ".crs":
-                    num_courses += 1
+        manifest = manifest or scan_tree(working_dir)
+        with timed(on_stage, "courses", courses_subfolder):
+            for crs_parent_dir in manifest.course_dirs:
+                for file in filter(Path.is_file, crs_parent_dir.iterdir()):
+                    course_file = courses_subfolder.joinpath(file.name)
+                    course_file.unlink(missing_ok=True)
+                    shutil.move(file, course_file)
+                    if file.suffix == ".crs":
+                        course_files.append(course_file)
 
-        shutil.move(pack_path, dest)
-        return SimfilePack(dest), num_courses
+        if replace and update is not None:
+            with timed(on_stage, "sync", dest) as stage:
+                synced = sync_tree(pack_path, dest)
+                stage.bytes = synced.bytes_written
+            if cache is not None:
+                # Only the songs with changed files need to be reloaded
+                changed_songs = {
+                    dest / path.parts[0]
+                    for path in synced.changed
+                    if len(path.parts) > 1
+                }
+                with timed(on_stage, "invalidate-cache", dest):
+                    SongCache(cache, packs).invalidate(changed_songs)
+        elif replace:
+            # The old pack is swapped out and deleted in the background
+            with timed(on_stage, "swap", dest, manifest.total_bytes):
+                trashed = replace_dir(pack_path, dest, packs)
+        else:
+            with timed(on_stage, "move", dest, manifest.total_bytes):
+                shutil.move(pack_path, dest)
+    if trashed is not None:
+        purge([trashed])
+    if index is not None:
+        with timed(on_stage, "index", dest):
+            index.update_pack(dest)
+            # Cache the hashes under the simfiles' new location
+            for path, charts in hashes.items():
+                index.store_hashes(dest / path.relative_to(pack_path), charts)
+        if dedupe:
+            with timed(on_stage, "dedupe", dest) as stage:
+                stage.bytes = dedupe_new([dest], index).bytes_reclaimed
+    if unresolved is not None and course_files:
+        with timed(on_stage, "check-courses", courses_subfolder):
+            missing = check_courses(course_files, SongLookup(packs))
+        if missing:
+            unresolved(SimfilePack(dest), missing)
+    if synced is not None:
+        update(SimfilePack(dest), synced)
+    return SimfilePack(dest), len(course_files)
 
 
 def add_song(
@@ -112,115 +627,403 @@ def add_song(
     downloads: Optional[Path] = None,
     overwrite: SongOverwriteHandler = lambda _new, _old: False,
     delete_macos_files_flag: bool = False,
+    stream: bool = False,
+    sha256: Optional[str] = None,
+    staging: Optional[Path] = None,
+    link: LinkMode = "copy",
+    song: Optional[str] = None,
+    index: Optional[LibraryIndex] = None,
+    download_cache: Optional[DownloadCache] = None,
+    on_stage: Optional[StageCallback] = None,
+    dedupe: bool = False,
+    download_slot: Optional[BoundedSemaphore] = None,
 ) -> tuple[Simfile, str]:
     """
     Takes a path to a local directory or a path/url to an archive and adds the
     contained song to `singles`. Supplied local files are not changed/moved.
 
     In the case of multiple valid songs (multiple folders containing
-    .sm/.ssc files), an exception will be raised.
+    .sm/.ssc files), an exception will be raised unless `song` is supplied,
+    in which case the song whose folder name (or title) matches `song` is
+    added. Archives are inspected before extraction so only the song's folder
+    is extracted. For remote zip archives, `song` is fetched with HTTP range
+    requests instead of downloading the whole archive if the server supports
+    them.
 
     If there is already an existing song in `singles` with the same
     folder name, the supplied `overwrite` function is called on the new and
     old simfiles. If `overwrite` returns true, the old song is overwritten by
-    the supplied song; if false, an OverwriteException is raised.
+    the supplied song; if false, an OverwriteException is raised. The old
+    song is swapped out and deleted in the background, like packs in
+    `add_pack`.
+
+    If `stream` is true, downloaded archives are extracted while they
+    download instead of afterwards. If `sha256` is supplied, downloads are
+    checked against it and a ChecksumException is raised on a mismatch.
+    If `index` is supplied, the added pack/song is indexed. URLs found in
+    `download_cache` are not downloaded again, and new downloads are added to
+    it.
+
+    The working directory is created in `staging` (defaults to the system's
+    temporary directory). Staging on the same filesystem as the destination
+    turns the final move into a rename. `link` sets how local directories are
+    copied into the working directory: `copy`, `hardlink` or `reflink`.
+    `on_stage` is called with the StageTiming of each stage as it finishes.
+    `dedupe` links the song's duplicate assets as in `add_pack`.
+    `download_slot` is held while the song is downloaded (see `add_songs`).
 
     Returns:
         a tuple containing the Simfile object of the added song and the path
         to the .sm/.ssc containing the chart data.
     """
-    with TemporaryDirectory() as temp_directory:
-        working_dir = setup_working_dir(
-            path_or_url, Path(temp_directory), downloads
-        )
-        simfile_dirs = {p.parent for p in simfile_paths(working_dir)}
+    import simfile
 
-        # Ensure only one simfile was supplied
-        if len(simfile_dirs) == 1:
-            simfile_root = simfile_dirs.pop()
-        elif len(simfile_dirs) == 0:
-            raise Exception("No simfiles found.")
-        else:
-            # TODO: Maybe this behavior should be changed?
-            # Sticking with it for now because it's simpler.
-            raise Exception(
-                "More than one simfile in supplied link/directory\n"
-                + "Supply songs individually or use add-pack instead."
+    with TemporaryDirectory(prefix=STAGING_PREFIX, dir=staging) as temp_dir:
+        select = _song_selector(delete_macos_files_flag, song)
+        working_dir = None
+        # Range requests are only worth it if the archive isn't cached
+        cached = download_cache is not None and download_cache.contains(
+            path_or_url
+        )
+        is_url = path_or_url.startswith("http")
+        with download_slot or nullcontext():
+            if song is not None and is_url and not cached:
+                with timed(on_stage, "download-members", path_or_url):
+                    working_dir = fetch_remote_zip_members(
+                        path_or_url, Path(temp_dir), select
+                    )
+            if working_dir is None and stream and is_url:
+                # downloading and extracting happen together when streaming
+                working_dir = stream_download(
+                    path_or_url,
+                    Path(temp_dir),
+                    downloads,
+                    sha256,
+                    download_cache,
+                    on_stage=on_stage,
+                    select=select,
+                )
+            if working_dir is None:
+                source, downloaded = fetch_source(
+                    path_or_url,
+                    Path(temp_dir),
+                    downloads,
+                    sha256,
+                    download_cache,
+                    on_stage,
+                )
+        if working_dir is None:
+            working_dir = prepare_working_dir(
+                source, Path(temp_dir), downloaded, link, select, on_stage
             )
+        with timed(on_stage, "scan", working_dir) as stage:
+            manifest = scan_tree(working_dir)
+            stage.bytes = manifest.total_bytes
+        simfile_root = Path(_choose_song_dir(manifest.simfiles, song))
+        if delete_macos_files_flag:
+            with timed(on_stage, "delete-macos-files", simfile_root):
+                delete_macos_files(simfile_root, manifest)
 
         dest = singles.joinpath(simfile_root.name)
 
-        if dest.exists():
-            if delete_macos_files_flag:
-                delete_macos_files(simfile_root)
-                delete_macos_files(dest)
-            new = simfile.opendir(simfile_root, strict=False)
-            old = simfile.opendir(dest, strict=False)
-            if not overwrite(new, old):
-                raise OverwriteException("Simfile already exists.")
-            shutil.rmtree(dest)
-            # Delete cache entry if cache is set
-            if cache is not None:
-                cache_entry = "_".join(
-                    [singles.parent.name, singles.name, simfile_root.name]
-                )
-                cache.joinpath("Songs", cache_entry).unlink(missing_ok=True)
-
-        dest.parent.mkdir(parents=True, exist_ok=True)
-        shutil.move(simfile_root, dest)
+        trashed = None
+        with _install_lock:
+            if dest.exists():
+                if delete_macos_files_flag:
+                    with timed(on_stage, "delete-macos-files", dest):
+                        delete_macos_files(dest)
+                new = simfile.opendir(simfile_root, strict=False)
+                old = simfile.opendir(dest, strict=False)
+                if not overwrite(new, old):
+                    raise OverwriteException("Simfile already exists.")
+                # Delete cache entry if cache is set
+                if cache is not None:
+                    with timed(on_stage, "invalidate-cache", dest):
+                        SongCache(cache, singles.parent).invalidate([dest])
+                # The old song is swapped out and deleted in the background
+                with timed(on_stage, "swap", dest, manifest.total_bytes):
+                    trashed = replace_dir(simfile_root, dest, singles.parent)
+            else:
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                with timed(on_stage, "move", dest, manifest.total_bytes):
+                    shutil.move(simfile_root, dest)
+        if trashed is not None:
+            purge([trashed])
+        if index is not None:
+            with timed(on_stage, "index", dest):
+                index.update_song(dest)
+            if dedupe:
+                with timed(on_stage, "dedupe", dest) as stage:
+                    stage.bytes = dedupe_new([dest], index).bytes_reclaimed
 
-    if delete_macos_files_flag:
-        delete_macos_files(simfile_root)
     return simfile.opendir(dest, strict=False)
 
 
-def censor(path: Path, packs: Path, cache: Path) -> Simfile:
+def add_songs(
+    paths_or_urls: Iterable[str],
+    singles: Path,
+    cache: Optional[Path] = None,
+    downloads: Optional[Path] = None,
+    overwrite: SongOverwriteHandler = lambda _new, _old: False,
+    delete_macos_files_flag: bool = False,
+    jobs: int = 4,
+    host_jobs: int = 2,
+    stream: bool = False,
+    checksums: Optional[dict[str, str]] = None,
+    staging: Optional[Path] = None,
+    link: LinkMode = "copy",
+    index: Optional[LibraryIndex] = None,
+    download_cache: Optional[DownloadCache] = None,
+    on_stage: Optional[StageCallback] = None,
+    dedupe: bool = False,
+) -> dict[str, SongResult]:
+    """
+    Adds several songs to `singles` at once. Each path/url is added with
+    `add_song` on a pool of `jobs` threads, with at most `host_jobs` of them
+    downloading from the same host at the same time (Google Sheets redirect
+    links count towards the host they redirect to).
+
+    `overwrite` is called from the worker threads, but never for two songs at
+    the same time. `checksums` optionally maps paths/urls to the SHA-256
+    their download is checked against. The other arguments behave as in
+    `add_song`; `on_stage` is called from the worker threads.
+
+    A failure while adding one song does not stop the others.
+
+    Returns:
+        a dict mapping each supplied path/url to either the `(Simfile, path)`
+        tuple returned by `add_song` or the exception raised while adding it
+        (an OverwriteException if it was not overwritten).
+    """
+    paths_or_urls = list(dict.fromkeys(paths_or_urls))
+    slots_lock = Lock()
+    host_slots: dict[str, BoundedSemaphore] = {}
+
+    def slot(path_or_url: str) -> Optional[BoundedSemaphore]:
+        if not path_or_url.startswith("http"):
+            return None
+        host = urlparse(resolve_redirect(path_or_url, verbose=False)).netloc
+        with slots_lock:
+            return host_slots.setdefault(
+                host.lower(), BoundedSemaphore(host_jobs)
+            )
+
+    def process(path_or_url: str) -> tuple[Simfile, str]:
+        return add_song(
+            path_or_url,
+            singles,
+            cache,
+            downloads,
+            overwrite,
+            delete_macos_files_flag,
+            stream,
+            (checksums or {}).get(path_or_url),
+            staging,
+            link,
+            index=index,
+            download_cache=download_cache,
+            on_stage=on_stage,
+            dedupe=dedupe,
+            download_slot=slot(path_or_url),
+        )
+
+    results: dict[str, SongResult] = {}
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        futures = {
+            executor.submit(process, path_or_url): path_or_url
+            for path_or_url in paths_or_urls
+        }
+        for future in as_completed(futures):
+            exception = future.exception()
+            results[futures[future]] = (
+                future.result() if exception is None else exception
+            )
+    return {path_or_url: results[path_or_url] for path_or_url in paths_or_urls}
+
+
+def censor(
+    path: Path,
+    packs: Path,
+    cache: Path,
+    index: Optional[LibraryIndex] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> Simfile:
     """
     Moves the song in the supplied `path` to `packs`/.censored, hiding it from
-    players. `path` must be a subdirectory of `packs` or an exception
-    will be raised.
+    players, records it in the censor manifest and removes it from `index`.
+    `path` must be a subdirectory of `packs` or an exception will be raised.
+    `on_stage` is called with the StageTiming of each stage as it finishes.
     """
+    import simfile
+
     path = path.absolute()
-    # Validate supplied path to sm folder
-    if not path.exists():
-        raise FileNotFoundError(f"{path} does not exist")
-    if not path.is_relative_to(packs):
-        raise Exception(f"Supplied path {path} is not a pack in {packs}")
+    manifest = CensorManifest(packs)
+    _check_censorable(path, packs, manifest)
     try:
-        sm, _ = simfile.opendir(path, strict=False)
+        sm, simfile_path = simfile.opendir(path, strict=False)
     except Exception as e:
         raise Exception(f"{path} is not a valid simfile directory: {e}")
+    # The manifest only needs the title and artist, so reuse this parse
+    metadata = SongMetadata(
+        Path(simfile_path),
+        sm.title or "",
+        sm.artist or "",
+        sm.credit or "",
+        [],
+    )
+    _censor_song(path, packs, manifest, index, on_stage, metadata)
+    with timed(on_stage, "save-manifest", manifest.path):
+        manifest.save()
+    with timed(on_stage, "invalidate-cache", cache):
+        SongCache(cache, packs).invalidate([path])
+    return sm
+
+
+def censor_songs(
+    paths: Iterable[Path],
+    packs: Path,
+    cache: Path,
+    index: Optional[LibraryIndex] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> list[CensoredSong]:
+    """
+    Censors each song directory in `paths` like `censor`, reading only the
+    simfiles' headers and writing the censor manifest and scanning the cache
+    once. Returns the censored songs.
+    """
+    manifest = CensorManifest(packs)
+    songs, censored = [], []
+    try:
+        for path in map(Path.absolute, paths):
+            songs.append(_censor_song(path, packs, manifest, index, on_stage))
+            censored.append(path)
+    finally:
+        with timed(on_stage, "save-manifest", manifest.path):
+            manifest.save()
+        with timed(on_stage, "invalidate-cache", cache):
+            SongCache(cache, packs).invalidate(censored)
+    return songs
+
+
+def _censor_song(
+    path: Path,
+    packs: Path,
+    manifest: CensorManifest,
+    index: Optional[LibraryIndex] = None,
+    on_stage: Optional[StageCallback] = None,
+    metadata: Optional[SongMetadata] = None,
+) -> CensoredSong:
+    """
+    Censors the song directory `path` and adds it to `manifest`. The
+    simfile's headers are read unless its `metadata` is supplied.
+    """
+    if metadata is None:
+        _check_censorable(path, packs, manifest)
+        try:
+            metadata = read_song_metadata(path)
+        except Exception as e:
+            raise Exception(f"{path} is not a valid simfile directory: {e}")
     # Move the simfile to the censored folder under the same pack subdirectory
     pack_and_song = path.relative_to(packs)
-    destination = packs / ".censored" / pack_and_song
-    shutil.move(path, destination)
-    # Remove the song's cache entry if it exists
-    cache_entry = "_".join([packs.name, path.parent.name, path.name])
-    cache.joinpath("Songs", cache_entry).unlink(missing_ok=True)
-    return sm
+    destination = manifest.censored / pack_and_song
+    if destination.exists():
+        raise Exception(f"{pack_and_song} is already censored")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with timed(on_stage, "move", pack_and_song):
+        shutil.move(path, destination)
+    if index is not None:
+        with timed(on_stage, "index", pack_and_song):
+            index.remove(path)
+    return manifest.add(pack_and_song.as_posix(), metadata)
+
+
+def _check_censorable(
+    path: Path, packs: Path, manifest: CensorManifest
+) -> None:
+    """Raises an exception if `path` isn't an uncensored song in `packs`."""
+    if not path.exists():
+        raise FileNotFoundError(f"{path} does not exist")
+    if not path.is_relative_to(packs) or path.is_relative_to(
+        manifest.censored
+    ):
+        raise Exception(f"Supplied path {path} is not a pack in {packs}")
+
+
+def find_songs(
+    targets: Iterable[str],
+    packs: Path,
+    index: Optional[LibraryIndex] = None,
+) -> list[Path]:
+    """
+    Returns the song directories in `packs` matched by `targets`, in order
+    and without duplicates. Each target is either a path to a song directory,
+    a glob pattern matched against song directories relative to `packs`
+    (e.g. `Pack/*`), or text found in the title, artist or credit of songs in
+    `index`. `index` is rescanned (see `LibraryIndex.rescan`) before the
+    first text target only, so paths and patterns never read the library.
+
+    Raises an exception if a target matches no songs.
+    """
+    found: dict[Path, None] = {}
+    rescanned = False
+    for target in targets:
+        path = Path(target)
+        if path.is_dir():
+            matches = [path.absolute()]
+        elif any(char in target for char in "*?["):
+            if path.is_absolute() and path.is_relative_to(packs):
+                target = str(path.relative_to(packs))
+            matches = sorted(
+                p.absolute()
+                for p in packs.glob(target)
+                if p.is_dir()
+                and not p.relative_to(packs).parts[0].startswith(".")
+                and find_simfile(p) is not None
+            )
+        elif index is not None:
+            if not rescanned:
+                index.rescan()
+                rescanned = True
+            matches = [song.path for song in index.search(target)]
+        else:
+            matches = []
+        if not matches:
+            raise Exception(f"No songs matching {target} found.")
+        found.update(dict.fromkeys(matches))
+    return list(found)
+
+
+def list_censored(packs: Path) -> list[CensoredSong]:
+    """
+    Returns the songs in `packs`/.censored from the censor manifest, sorted
+    by pack and folder.
+    """
+    return CensorManifest(packs).entries()
 
 
 def get_censored(packs: Path) -> list[tuple[Simfile, str]]:
     """
     Returns the simfiles in `packs/.censored` as a list of (`simfile`, `path`)
-    pairs where `path` is the path to the .sm/.ssc file.
+    pairs where `path` is the path to the .sm/.ssc file. Every simfile is
+    parsed; use `list_censored` if only titles and paths are needed.
     """
-    out = []
+    import simfile
+
     censored = packs / ".censored"
-    for pack in filter(Path.is_dir, censored.iterdir()):
-        for simfile_path in filter(Path.is_dir, pack.iterdir()):
-            out.append(simfile.opendir(simfile_path, strict=False))
-    return out
+    return [
+        simfile.opendir(censored / song.path, strict=False)
+        for song in list_censored(packs)
+    ]
 
 
-def _default_uncensor_picker(censored: list[tuple[Simfile, str]]) -> int:
+def _default_uncensor_picker(censored: list[CensoredSong]) -> int:
     """
     Prints a numbered list of the provided censored packs and prompts the user
     to select one to be uncensored. Returns the index of the selected song.
     """
-    for i, (sm, path) in enumerate(censored, start=1):
-        pack = Path(path).parents[1].name
-        print(f"{i}. {sm.title} ({pack})")
+    for i, song in enumerate(censored, start=1):
+        pack = PurePosixPath(song.path).parent.name
+        print(f"{i}. {song.title} ({pack})")
     print(f"Select a song to uncensor (1-{len(censored)}): ", end="")
     while True:
         user_input = input()
@@ -233,21 +1036,141 @@ def _default_uncensor_picker(censored: list[tuple[Simfile, str]]) -> int:
 
 
 def uncensor(
-    packs: Path, picker: UncensorPicker = _default_uncensor_picker
+    packs: Path,
+    picker: Optional[UncensorPicker] = None,
+    index: Optional[LibraryIndex] = None,
+    on_stage: Optional[StageCallback] = None,
+    chooser: CensoredSongPicker = _default_uncensor_picker,
 ) -> Simfile:
     """
-    Gets the censored songs and passes them to `picker` which returns an index
-    of the song to uncensor. The picked simfile will be moved back to its
-    original location in `packs` and returned.
+    Gets the censored songs from the censor manifest and passes them to
+    `chooser` which returns an index of the song to uncensor. The picked
+    simfile will be moved back to its original location in `packs`, removed
+    from the censor manifest, added to `index` and returned. `on_stage` is
+    called with the StageTiming of each stage as it finishes.
+
+    `picker` is deprecated: if supplied, it is passed the parsed censored
+    simfiles as (`simfile`, `path`) pairs (see `get_censored`) instead, and
+    `chooser` is ignored.
 
     If there are no censored songs, raises an UncensorException.
     """
-    censored = get_censored(packs)
+    import simfile
+
+    manifest = CensorManifest(packs)
+    censored = manifest.entries()
     if len(censored) == 0:
         raise UncensorException("No censored songs.")
-    chosen_path = Path(censored[picker(censored)][1]).parent
-    pack_and_song = chosen_path.relative_to(packs / ".censored")
-    destination = packs.joinpath(pack_and_song)
-    shutil.move(chosen_path, destination)
-
+    if picker is not None:
+        warnings.warn(
+            "uncensor's `picker` is deprecated, use `chooser` instead",
+            DeprecationWarning,
+            stacklevel=2,
+        )
+        choice = picker(
+            [
+                simfile.opendir(manifest.censored / song.path, strict=False)
+                for song in censored
+            ]
+        )
+    else:
+        choice = chooser(censored)
+    destination = _uncensor_song(
+        censored[choice], packs, manifest, index, on_stage
+    )
+    with timed(on_stage, "save-manifest", manifest.path):
+        manifest.save()
     return simfile.opendir(destination)[0]
+
+
+def uncensor_songs(
+    packs: Path,
+    targets: Optional[Iterable[str]] = None,
+    index: Optional[LibraryIndex] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> list[CensoredSong]:
+    """
+    Uncensors the censored songs matched by `targets`, or every censored song
+    if `targets` is None, and returns them. Each target is either a path to a
+    song directory (censored or not), a glob pattern matched against
+    `Pack/Song`, or text found in a censored song's title or artist.
+    `on_stage` behaves as in `uncensor`.
+
+    Raises an UncensorException if there are no censored songs or a target
+    matches none of them.
+    """
+    manifest = CensorManifest(packs)
+    censored = manifest.entries()
+    if len(censored) == 0:
+        raise UncensorException("No censored songs.")
+    if targets is not None:
+        chosen: dict[str, CensoredSong] = {}
+        for target in targets:
+            matches = _match_censored(censored, target, packs)
+            if not matches:
+                raise UncensorException(
+                    f"No censored songs matching {target}."
+                )
+            chosen.update((song.path, song) for song in matches)
+        censored = list(chosen.values())
+    try:
+        for song in censored:
+            _uncensor_song(song, packs, manifest, index, on_stage)
+    finally:
+        with timed(on_stage, "save-manifest", manifest.path):
+            manifest.save()
+    return censored
+
+
+def _match_censored(
+    censored: list[CensoredSong], target: str, packs: Path
+) -> list[CensoredSong]:
+    """
+    Returns the songs in `censored` matched by `target` (see
+    `uncensor_songs`).
+    """
+    if any(char in target for char in "*?["):
+        return [song for song in censored if fnmatch(song.path, target)]
+    path = Path(target).absolute()
+    for root in (packs.absolute() / ".censored", packs.absolute()):
+        if path.is_relative_to(root):
+            key = path.relative_to(root).as_posix()
+            matches = [song for song in censored if song.path == key]
+            if matches:
+                return matches
+    query = target.casefold()
+    return [
+        song
+        for song in censored
+        if query in song.title.casefold()
+        or query in song.artist.casefold()
+        or query == song.path.casefold()
+    ]
+
+
+def _uncensor_song(
+    song: CensoredSong,
+    packs: Path,
+    manifest: CensorManifest,
+    index: Optional[LibraryIndex] = None,
+    on_stage: Optional[StageCallback] = None,
+) -> Path:
+    """
+    Moves `song` back to its original location in `packs`, removes it from
+    `manifest` and adds it to `index`. Returns its new location.
+    """
+    source = manifest.censored / song.path
+    destination = packs / song.path
+    if destination.exists():
+        raise Exception(f"{song.path} already exists in {packs}")
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with timed(on_stage, "move", song.path):
+        shutil.move(source, destination)
+    manifest.remove(song.path)
+    # Remove the censored pack folder once it is empty
+    if not any(source.parent.iterdir()):
+        source.parent.rmdir()
+    if index is not None:
+        with timed(on_stage, "index", song.path):
+            index.update_song(destination)
+    return destination